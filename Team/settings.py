@@ -53,6 +53,7 @@ MIDDLEWARE = [
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
     'django.contrib.auth.middleware.AuthenticationMiddleware',
+    'main.routing.ReplicaPinMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
 ]
@@ -91,6 +92,26 @@ DATABASES = {
 }
 
 
+# Cache used for the template fragments of space.html and choose_teams.html, which are keyed on space.version
+# https://docs.djangoproject.com/en/1.11/topics/cache/
+
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'team-formation',
+    }
+}
+
+
+# When True, discarded MasterTeams and deleted spaces are purged on a background thread after the request instead of
+# before the response is sent (see main/purge.py)
+DEFER_PURGES = False
+
+
+# Seconds the local search in main/formation/optimize.py may spend improving a candidate MasterTeam
+LOCAL_SEARCH_BUDGET = 2.0
+
+
 # Password validation
 # https://docs.djangoproject.com/en/1.11/ref/settings/#auth-password-validators
 
@@ -151,3 +172,40 @@ ALLOWED_HOSTS = ['*']
 import dj_database_url
 db_from_env = dj_database_url.config(conn_max_age=500)
 DATABASES['default'].update(db_from_env)
+
+
+# Where Iterative Soulmates groups are found: 'jar' leaves it to TeamFormationAlgorithms.jar, 'python' finds them with
+# main/formation/soulmates.py (in parallel for large spaces) and only sends the leftover members to the jar
+TEAM_FORMATION_SOULMATES = 'python'
+
+
+# Number of jar processes form_teams may run at once for the independent preference clusters of one space (defaults to
+# the number of CPUs when None)
+TEAM_FORMATION_WORKERS = None
+
+
+# Profiling of form_teams (see main/formation/profiling.py). Stage timings are always saved on the MasterTeam, with
+# TEAM_FORMATION_PROFILE = True memory use is traced too, and with TEAM_FORMATION_PROFILE_DIR set every formation is
+# run under cProfile and its stats are dumped in that directory
+TEAM_FORMATION_PROFILE = False
+TEAM_FORMATION_PROFILE_DIR = None
+
+
+# Directory where compiled preference arrays are published for formation worker processes to map read-only (see
+# main/formation/shared.py). Defaults to team-formation in the system temp directory when None
+TEAM_FORMATION_CACHE_DIR = None
+
+
+# When True, form_teams_view and improve_teams_view run their work as a FormationJob on a background thread and send
+# the owner to a page that streams its progress (see main/formation/progress.py), instead of holding the request
+FORMATION_IN_BACKGROUND = True
+
+
+# Optional read replica for the read-only pages (see main/routing.py), e.g. REPLICA_DATABASE_URL=postgres://... . A
+# session that wrote reads from 'default' for REPLICA_PIN_SECONDS afterwards, so it does not see a lagging replica.
+# Tests read the replica from the test database of 'default' instead of making a test database of their own
+if os.environ.get('REPLICA_DATABASE_URL'):
+    DATABASES['replica'] = dj_database_url.parse(os.environ['REPLICA_DATABASE_URL'], conn_max_age=500)
+    DATABASES['replica']['TEST'] = {'MIRROR': 'default'}
+DATABASE_ROUTERS = ['main.routing.ReplicaRouter']
+REPLICA_PIN_SECONDS = 5
@@ -0,0 +1,232 @@
+"""
+api.py is a read-only JSON API for integrations (like LMS syncs) under /api/v1/, so they do not have to scrape the HTML
+views or wait for the spreadsheet emailed by send_owner_spreadsheet
+-   Requests are made with the session of the space's owner, and only spaces they own are visible
+-   GET /api/v1/spaces/ lists the owner's spaces, and GET /api/v1/spaces/<url>/<collection>/ lists the members,
+    preferences, master_teams, teams or assignments (TeamProjects) of one space
+-   Every list is paged with keyset cursors (see main/pagination.py): pass the 'next' of a response back as ?cursor=.
+    ?limit= sets the page size (at most MAX_LIMIT) and ?fields=id,name keeps only the named fields
+-   Each response has an ETag built from the versions of the spaces it shows, so asking again with If-None-Match gets
+    a 304 until something changes
+-   Each response also has a 'changes' cursor. Passing it back as ?since= answers with "unchanged": true and no rows
+    while the space has not changed. Otherwise spaces and preferences only list the rows updated since, and the other
+    collections are listed in full, since their rows do not record when they changed. Deleted rows are never listed,
+    so a sync should do a full pull (without since) now and then
+"""
+
+import hashlib
+from functools import wraps
+from django.db.models import Max, Prefetch
+from django.http import JsonResponse, HttpResponseNotModified
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+from main.models import Space, Preferences, MasterTeam, Team, TeamProject
+from main.pagination import InvalidCursor, decode_cursor, encode_cursor, keyset_page
+
+DEFAULT_LIMIT = 50
+MAX_LIMIT = 200
+
+
+class ApiError(Exception):
+
+    def __init__(self, message, status=400):
+        super(ApiError, self).__init__(message)
+        self.status = status
+
+
+# Answers errors as JSON instead of redirecting to the login page or showing an error page
+def api_view(function):
+    @wraps(function)
+    def view(request, *args, **kwargs):
+        if request.method != 'GET':
+            return JsonResponse({'error': "The API is read only."}, status=405)
+        if not request.user.is_authenticated:
+            return JsonResponse({'error': "Log in first."}, status=401)
+        try:
+            return function(request, *args, **kwargs)
+        except ApiError as error:
+            return JsonResponse({'error': str(error)}, status=error.status)
+        except InvalidCursor as error:
+            return JsonResponse({'error': str(error)}, status=400)
+    return view
+
+
+def owned_space(request, space_url):
+    space = Space.objects.filter(url=space_url, teacher=request.user.get_username()).first()
+    if space is None:
+        raise ApiError("There is no space with that url that you own.", status=404)
+    return space
+
+
+def _limit(request):
+    try:
+        return max(1, min(MAX_LIMIT, int(request.GET.get('limit', DEFAULT_LIMIT))))
+    except ValueError:
+        raise ApiError("limit must be a number.")
+
+
+def _select(rows, request, available):
+    if not request.GET.get('fields'):
+        return rows
+    fields = [field.strip() for field in request.GET['fields'].split(',') if field.strip()]
+    unknown = [field for field in fields if field not in available]
+    if unknown:
+        raise ApiError("Unknown fields: " + ", ".join(unknown) + ". Choose from " + ", ".join(available) + ".")
+    return [{field: row[field] for field in fields} for row in rows]
+
+
+# Lists one page of queryset as JSON, or answers 304 when the client already has this page at this state
+def _collection(request, queryset, serialize, fields, state, changes, extra=None):
+    etag = '"' + hashlib.md5((str(request.user.pk) + "|" + request.get_full_path() + "|" + state)
+                             .encode('utf-8')).hexdigest() + '"'
+    if etag in [tag.strip() for tag in request.META.get('HTTP_IF_NONE_MATCH', '').split(',')]:
+        response = HttpResponseNotModified()
+        response['ETag'] = etag
+        return response
+    rows, next_cursor = keyset_page(queryset, ('id',), request.GET.get('cursor') or None, _limit(request))
+    body = {'results': _select([serialize(row) for row in rows], request, fields), 'next': next_cursor,
+            'changes': changes}
+    body.update(extra or {})
+    response = JsonResponse(body)
+    response['ETag'] = etag
+    return response
+
+
+def _unchanged(changes):
+    return JsonResponse({'results': [], 'next': None, 'changes': changes, 'unchanged': True})
+
+
+# Reads the version and time of a 'changes' cursor passed back as ?since=
+def _decode_since(request):
+    version, synced_at = decode_cursor(request.GET['since'], 2)
+    try:
+        synced_at = parse_datetime(synced_at) if isinstance(synced_at, str) else None
+    except ValueError:
+        synced_at = None
+    if not isinstance(version, int) or synced_at is None or timezone.is_naive(synced_at):
+        raise ApiError("since is not a valid changes cursor.")
+    return version, synced_at
+
+
+# Reads ?since= for a space: returns None without one, or the time the client last synced if the space changed since
+def _since(request, space):
+    if not request.GET.get('since'):
+        return None
+    version, synced_at = _decode_since(request)
+    return synced_at if version != space.version else False
+
+
+def _space_changes(space):
+    return encode_cursor([space.version, space.updated_at])
+
+
+def _space_json(space):
+    return {'id': space.id, 'name': space.name, 'url': space.url, 'description': space.description,
+            'teams_decided': space.teams_decided, 'version': space.version, 'updated_at': space.updated_at.isoformat()}
+
+
+SPACE_FIELDS = ('id', 'name', 'url', 'description', 'teams_decided', 'version', 'updated_at')
+
+
+@api_view
+def spaces(request):
+    queryset = Space.objects.filter(teacher=request.user.get_username())
+    latest = queryset.aggregate(latest=Max('updated_at'))['latest'] or timezone.now()
+    changes = encode_cursor([0, latest])
+    if request.GET.get('since'):
+        version, synced_at = _decode_since(request)
+        if synced_at >= latest:
+            return _unchanged(changes)
+        queryset = queryset.filter(updated_at__gt=synced_at)
+    state = ",".join(str(space_id) + ":" + str(version) for space_id, version in
+                     queryset.order_by('id').values_list('id', 'version'))
+    return _collection(request, queryset, _space_json, SPACE_FIELDS, state, changes)
+
+
+MEMBER_FIELDS = ('id', 'name', 'username', 'email', 'skills')
+
+
+@api_view
+def members(request, space_url):
+    space = owned_space(request, space_url)
+    if _since(request, space) is False:
+        return _unchanged(_space_changes(space))
+    queryset = space.member_set.exclude(name='Account in Progress')
+    return _collection(request, queryset, lambda member: {field: getattr(member, field) for field in MEMBER_FIELDS},
+                       MEMBER_FIELDS, str(space.version), _space_changes(space))
+
+
+PREFERENCE_FIELDS = ('id', 'member', 'username', 'members_ranking', 'projects_ranking', 'updated_at')
+
+
+def _preference_json(preference):
+    return {'id': preference.id, 'member': preference.member_id, 'username': preference.member.username,
+            'members_ranking': preference.members_ranking, 'projects_ranking': preference.projects_ranking,
+            'updated_at': preference.updated_at.isoformat()}
+
+
+@api_view
+def preferences(request, space_url):
+    space = owned_space(request, space_url)
+    since = _since(request, space)
+    if since is False:
+        return _unchanged(_space_changes(space))
+    queryset = Preferences.objects.filter(space=space).select_related('member')
+    if since is not None:
+        queryset = queryset.filter(updated_at__gt=since)
+    return _collection(request, queryset, _preference_json, PREFERENCE_FIELDS, str(space.version),
+                       _space_changes(space))
+
+
+MASTER_TEAM_FIELDS = ('id', 'algorithm', 'algorithm_index', 'number_of_members', 'iterative_soulmates', 'teams')
+
+
+def _master_team_json(master_team):
+    return {'id': master_team.id, 'algorithm': master_team.algorithm_type(),
+            'algorithm_index': master_team.algorithm_index, 'number_of_members': master_team.number_of_members,
+            'iterative_soulmates': master_team.iterative_soulmates, 'teams': master_team.team_member_ids()}
+
+
+@api_view
+def master_teams(request, space_url):
+    space = owned_space(request, space_url)
+    if _since(request, space) is False:
+        return _unchanged(_space_changes(space))
+    # candidates made before teams were packed keep their teams as Team rows, which are prefetched for them
+    team_rows = Prefetch('team_set', queryset=Team.objects.order_by('id').with_rosters())
+    queryset = MasterTeam.objects.filter(space=space).prefetch_related(team_rows)
+    return _collection(request, queryset, _master_team_json, MASTER_TEAM_FIELDS, str(space.version),
+                       _space_changes(space))
+
+
+TEAM_FIELDS = ('id', 'master', 'members')
+
+
+@api_view
+def teams(request, space_url):
+    space = owned_space(request, space_url)
+    if _since(request, space) is False:
+        return _unchanged(_space_changes(space))
+    queryset = Team.objects.filter(space=space).with_rosters()
+    return _collection(request, queryset, lambda team: {'id': team.id, 'master': team.master_id,
+                                                        'members': [member.id for member in team.member_set.all()]},
+                       TEAM_FIELDS, str(space.version), _space_changes(space))
+
+
+ASSIGNMENT_FIELDS = ('id', 'team', 'project', 'project_name', 'assigned', 'representative')
+
+
+def _assignment_json(assignment):
+    return {'id': assignment.id, 'team': assignment.team_id, 'project': assignment.project_id,
+            'project_name': assignment.project.name if assignment.project_id else None,
+            'assigned': assignment.assigned, 'representative': assignment.representative_id}
+
+
+@api_view
+def assignments(request, space_url):
+    space = owned_space(request, space_url)
+    if _since(request, space) is False:
+        return _unchanged(_space_changes(space))
+    queryset = TeamProject.objects.filter(space=space).select_related('project')
+    return _collection(request, queryset, _assignment_json, ASSIGNMENT_FIELDS, str(space.version),
+                       _space_changes(space))
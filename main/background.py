@@ -0,0 +1,21 @@
+"""
+background.py runs slow work after the current request's transaction commits, on a daemon thread of the same process
+-   The thread gets its own database connection from Django and closes it once the work is done
+-   Used for work the owner does not need to wait for, like purging discarded MasterTeams or deleted spaces
+"""
+
+import threading
+from django.db import connection, transaction
+
+
+def run_in_background(function, *args, **kwargs):
+    def run():
+        try:
+            function(*args, **kwargs)
+        finally:
+            connection.close()
+
+    def start():
+        threading.Thread(target=run, daemon=True).start()
+
+    transaction.on_commit(start)
@@ -0,0 +1,62 @@
+"""
+conditional.py gives the space, teams and assignment pages ETags and Last-Modified dates, so a refresh of a page that
+has not changed gets a 304 Not Modified without running the view's queries or rendering its template
+-   The views use Django's condition() decorator with the functions below, placed under login_required
+-   A page only changes when the version of the space(s) it shows changes (see main/signals.py), so the ETag is built
+    from those versions and updated_at dates
+-   The pages also show who is looking and embed a csrf token in their forms, so the ETag includes the user and the
+    csrf cookie, and a user never gets a 304 for a copy another user (or an older token) was sent
+-   condition() asks for the ETag and the Last-Modified date separately, so the space state is looked up once per
+    request and kept on the request
+"""
+
+import hashlib
+from django.conf import settings
+from django.db.models import Q
+from main.models import Space
+
+
+# Returns [(space id, version, updated_at)] for the spaces the page shows, read with one query per request
+def _space_state(request, key, spaces):
+    cache = request.__dict__.setdefault('_space_state', {})
+    if key not in cache:
+        cache[key] = list(spaces.order_by('id').values_list('id', 'version', 'updated_at'))
+    return cache[key]
+
+
+def _etag(request, state):
+    if not state:
+        return None
+    parts = [str(request.user.pk), request.COOKIES.get(settings.CSRF_COOKIE_NAME, '')]
+    for space_id, version, updated_at in state:
+        parts.append(str(space_id) + ":" + str(version) + ":" + updated_at.isoformat())
+    return hashlib.md5("|".join(parts).encode('utf-8')).hexdigest()
+
+
+def _last_modified(state):
+    if not state:
+        return None
+    return max(updated_at for space_id, version, updated_at in state)
+
+
+# For pages about one space, like space_view(request, url) and view_assignments(request, space_url)
+def space_etag(request, space_url, *args):
+    return _etag(request, _space_state(request, space_url, Space.objects.filter(url=space_url)))
+
+
+def space_last_modified(request, space_url, *args):
+    return _last_modified(_space_state(request, space_url, Space.objects.filter(url=space_url)))
+
+
+# For teams_view, which shows every space the logged in member is in or owns (whatever username is in the url)
+def _member_spaces(request):
+    username = request.user.get_username()
+    return Space.objects.filter(Q(member__username=username) | Q(teacher=username)).distinct()
+
+
+def member_spaces_etag(request, *args):
+    return _etag(request, _space_state(request, 'member', _member_spaces(request)))
+
+
+def member_spaces_last_modified(request, *args):
+    return _last_modified(_space_state(request, 'member', _member_spaces(request)))
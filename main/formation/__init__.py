@@ -0,0 +1,15 @@
+"""
+The formation package holds everything needed to turn the preferences of a space into candidate teams (MasterTeams)
+-   jar.py speaks the protocol of JavaCode/TeamFormationAlgorithms.jar: the setup data and preference strings passed in
+    and the T:/S: lines printed back
+-   service.py runs a whole formation for a space (load, encode, solve, decode, persist) and is shared by
+    form_teams_view in main/views.py and the form_teams management command
+-   matrix.py compiles the rankings of a space into arrays, and graph.py holds the CSR and component helpers built on
+    them
+-   profiling.py times each stage of a formation, and progress.py runs formations as FormationJobs whose progress the
+    owner can watch
+-   shared.py publishes compiled arrays once as memory-mapped files that worker processes attach to read-only
+-   soulmates.py finds Iterative Soulmates groups in Python so large spaces do not depend on the jar for that step
+-   montecarlo.py plays Random Serial Dictatorship over thousands of orderings at once with NumPy and keeps the best
+-   joint.py forms teams and picks their projects together, weighing partner rankings against project rankings
+"""
@@ -0,0 +1,126 @@
+"""
+assignment.py gives the teams of a space their projects with a min-cost max-flow, respecting how many teams each
+project can take
+-   The flow network is source -> team (1 unit each) -> project -> sink, where a project takes at least
+    project.min_teams and at most project.max_teams units. A team -> project unit costs minus the team's score for the
+    project, so the cheapest flow is the best assignment
+-   Minimum staffing is met before anything else: the first min_teams units into a project earn a bonus larger than
+    any difference in scores could be. As many teams as the capacities allow get a project, then as many minimums as
+    possible are met, then the scores are as high as they can be
+-   The flow is found by successive shortest paths. A path starts at a team without a project, may move teams from
+    one project to another, and ends at a project with room. Its Bellman-Ford relaxations run as NumPy operations over
+    the (teams, projects) cost matrix, so hundreds of teams take milliseconds
+-   assign_projects() scores the finalized teams of a space from the project rankings of all their members, or of
+    one representative per team, and writes every TeamProject row in bulk in one transaction
+"""
+
+import random
+import numpy as np
+from django.db import transaction
+from main.formation.matrix import project_scores
+from main.models import Project, Preferences, Team, TeamProject
+from main.signals import bump_space_version, delete_in_bulk
+
+UNITS = 1000  # scores are turned into whole costs, so sums of costs are exact
+INFINITY = 1 << 50
+
+
+# Returns the project number each team gets (-1 for none) for a (teams, projects) score matrix
+def min_cost_assignment(scores, min_teams, max_teams):
+    scores = np.asarray(scores, dtype=np.float64)
+    teams, projects = scores.shape
+    min_teams = np.minimum(np.asarray(min_teams, dtype=np.int64), max_teams)
+    max_teams = np.asarray(max_teams, dtype=np.int64)
+    cost = -np.round(scores * UNITS).astype(np.int64)
+    bonus = 2 * (int(np.abs(cost).max(initial=0)) + 1) * (teams + 1)
+    assigned = np.full(teams, -1, dtype=np.int64)
+    load = np.zeros(projects, dtype=np.int64)
+    team_numbers = np.arange(teams)
+    project_numbers = np.arange(projects)
+    if not teams or not projects:
+        return assigned
+
+    for unit in range(min(teams, int(max_teams.sum()))):
+        slot = np.where(load < min_teams, -bonus, np.where(load < max_teams, 0, INFINITY))
+        # a team without a project is reached straight from the source, one with a project only through it
+        reached = np.where(assigned < 0, 0, INFINITY)
+        has_project = assigned >= 0
+        distance = np.full(projects, INFINITY, dtype=np.int64)
+        previous = np.full(projects, -1, dtype=np.int64)
+        for relaxation in range(teams + projects + 1):
+            through = np.where(reached[:, None] < INFINITY, reached[:, None] + cost, INFINITY)
+            through[team_numbers[has_project], assigned[has_project]] = INFINITY
+            best = through.argmin(axis=0)
+            # a project only changes its previous team for a strictly shorter path, so ties can never form a loop
+            shorter = through[best, project_numbers] < distance
+            if not shorter.any():
+                break
+            distance[shorter] = through[best[shorter], project_numbers[shorter]]
+            previous[shorter] = best[shorter]
+            left = distance[assigned]
+            reached = np.where(has_project, np.where(left < INFINITY, left - cost[team_numbers, assigned], INFINITY), 0)
+        total = distance + slot
+        end = int(total.argmin())
+        if total[end] >= INFINITY // 2:
+            break
+
+        # walks the path back from the project with room, handing each team on it the next project
+        load[end] += 1
+        project = end
+        while True:
+            team = previous[project]
+            project, assigned[team] = assigned[team], project
+            if project < 0:
+                break
+    return assigned
+
+
+# Scores the teams from the project rankings of their members. With representatives, each team is scored by one
+# random member who ranked projects, who is returned as the team's representative
+def team_scores(teams, rankings, project_names, representatives=False):
+    usernames = [member.username for team in teams for member in team]
+    member_scores = project_scores(usernames, rankings, project_names)
+    scores = np.zeros((len(teams), len(project_names)))
+    chosen = []
+    start = 0
+    for t, team in enumerate(teams):
+        rows = list(range(start, start + len(team)))
+        start += len(team)
+        representative = None
+        if representatives:
+            ranked = [row for row, member in zip(rows, team) if rankings.get(member.username)]
+            if ranked:
+                row = random.choice(ranked)
+                representative = team[row - rows[0]]
+                rows = [row]
+            else:
+                rows = []
+        scores[t] = member_scores[rows].sum(axis=0)
+        chosen.append(representative)
+    return scores, chosen
+
+
+# Replaces the TeamProjects of space. Returns the names of the projects whose minimum staffing could not be met
+def assign_projects(space, representatives=False):
+    teams = list(Team.objects.filter(space=space).with_rosters().order_by('id'))
+    rosters = [list(team.member_set.all()) for team in teams]
+    projects = list(Project.objects.filter(space=space).order_by('id'))
+    rankings = dict(Preferences.objects.filter(space=space).values_list('member__username', 'projects_ranking'))
+    scores, chosen = team_scores(rosters, rankings, [project.name for project in projects], representatives)
+    assigned = min_cost_assignment(scores, [project.min_teams for project in projects],
+                                   [project.max_teams for project in projects])
+
+    rows = []
+    for team, project, representative in zip(teams, assigned, chosen):
+        if project >= 0:
+            rows.append(TeamProject(space=space, team=team, project=projects[project], assigned=True,
+                                    representative=representative))
+        else:
+            rows.append(TeamProject(space=space, team=team, assigned=False))
+    with transaction.atomic():
+        delete_in_bulk(TeamProject.objects.filter(space=space))
+        TeamProject.objects.bulk_create(rows)
+        bump_space_version([space.pk])
+
+    load = np.bincount(assigned[assigned >= 0], minlength=len(projects))
+    return [project.name for p, project in enumerate(projects) if load[p] < project.min_teams]
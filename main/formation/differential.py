@@ -0,0 +1,165 @@
+"""
+differential.py runs random preferences through JavaCode/TeamFormationAlgorithms.jar and through an in-process engine,
+to check that the engine forms the same teams (or teams at least as good) and to measure how much faster it is. It is
+run with the compare_engines management command
+-   random_instance() makes n members who each rank up to MAX_RANKED others, in the members_ranking format of
+    Preferences. Some add @team@ at the end, some put @myself@ among their choices and some rank nobody
+-   Each instance is encoded once with service.encode(), so the jar and the engine see the same random ranks, and the
+    jar is run with the usual protocol: setup data and preferences as arguments, T: and S: lines back
+-   The 'rsd' engine plays Random Serial Dictatorship (run_orderings() of main/formation/montecarlo.py) over the one
+    ordering those ranks give, lowest rank first, against the jar's algorithm 0 with Iterative Soulmates off, so both
+    should form the same partition. The 'montecarlo' engine keeps the best of many seeded orderings, so only welfare
+    is compared: it should never be below the jar's single ordering
+-   Every run records its seconds and peak memory: tracemalloc for the engine (in a second run, so tracing does not
+    slow down the timed one) and the peak resident size of the java process for the jar
+-   Without java or the jar the jar runs are skipped, and the report only has the engine's numbers. A jar that
+    crashes raises JarError instead of being reported as a mismatch
+"""
+
+import os
+import shutil
+import time
+import tracemalloc
+from collections import namedtuple
+import numpy as np
+from main.formation.jar import jar_path, parse_output, run_jar_measured
+from main.formation.matrix import PreferenceMatrix
+from main.formation.montecarlo import best_orderings, run_orderings, teams_of
+from main.formation.service import encode
+
+ENGINES = ('rsd', 'montecarlo')
+SIZES = (20, 50, 100, 200)
+MAX_RANKED = 5
+JAR_ALGORITHM_INDEX = 0  # Random Serial Dictatorship
+ALPHA = 0.001
+THETA = 0.0
+
+# Stands in for a Member, since encode() only needs usernames and decoding only needs ids
+Participant = namedtuple('Participant', ['id', 'username'])
+
+
+# Returns the participants and their rankings ({username: members_ranking}) of a random instance with n members
+def random_instance(n, rng, max_ranked=MAX_RANKED):
+    usernames = ["member" + str(i) for i in range(n)]
+    rankings = {}
+    for i, username in enumerate(usernames):
+        others = [j for j in rng.permutation(n)[:max_ranked + 1] if j != i][:rng.randint(max_ranked + 1)]
+        tokens = [usernames[j] for j in others]
+        marker = rng.random_sample()
+        if marker < 0.3:
+            tokens.append("@team@")
+        elif marker < 0.4 and tokens:
+            tokens.insert(rng.randint(len(tokens) + 1), "@myself@")
+        if tokens:
+            rankings[username] = " ".join(tokens) + " "
+    return [Participant(i + 1, username) for i, username in enumerate(usernames)], rankings
+
+
+# Reads the random rank encode() gave each member back out of the preferences, and returns the members in rank order
+def dictator_order(user_preferences, usernames):
+    tokens = user_preferences.split()
+    wanted = set(usernames)
+    ranks = {token: int(tokens[t + 1]) for t, token in enumerate(tokens) if token in wanted}
+    return np.array(sorted(range(len(usernames)), key=lambda i: ranks[usernames[i]]), dtype=np.int64)
+
+
+# Returns why the jar cannot run here, or None if it can
+def jar_unavailable():
+    if not shutil.which('java'):
+        return "java is not installed"
+    if not os.path.exists(jar_path()):
+        return jar_path() + " does not exist"
+    return None
+
+
+def run_engine(engine, matrix, order, group_size, orderings, seed):
+    if engine == 'rsd':
+        team_of = run_orderings(matrix.ranked, matrix.wants_team, group_size, order[None, :])
+        return teams_of(team_of[0])
+    kept, scores = best_orderings(matrix, group_size, orderings, seed=seed)
+    return kept[0][0]
+
+
+# Returns what function returned, the seconds it took and the peak memory in KB it allocated when run again traced
+def measure(function, *args):
+    started = time.perf_counter()
+    result = function(*args)
+    seconds = time.perf_counter() - started
+    if tracemalloc.is_tracing():
+        return result, seconds, None
+    tracemalloc.start()
+    try:
+        function(*args)
+        peak = tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+    return result, seconds, peak // 1024
+
+
+def partition(teams, usernames):
+    return frozenset(frozenset(usernames[i] for i in team) for team in teams)
+
+
+# Runs one instance through the engine and, if run_jar is set, the jar. Returns one row of the report
+def compare_instance(participants, rankings, group_size, engine, orderings, seed, run_jar=True):
+    iterative_soulmates = engine != 'rsd'
+    setup_data, user_preferences = encode(participants, rankings, group_size, JAR_ALGORITHM_INDEX, ALPHA, THETA,
+                                          iterative_soulmates)
+    matrix = PreferenceMatrix([p.id for p in participants], [p.username for p in participants], rankings)
+    order = dictator_order(user_preferences, matrix.usernames)
+    teams, seconds, peak_kb = measure(run_engine, engine, matrix, order, group_size, orderings, seed)
+    row = {'members': len(participants), 'engine_seconds': seconds, 'engine_peak_kb': peak_kb,
+           'engine_welfare': round(matrix.welfare(teams), 6), 'jar_seconds': None, 'jar_peak_kb': None,
+           'jar_welfare': None, 'same_partition': None}
+    if not run_jar:
+        return row
+
+    started = time.perf_counter()
+    lines, jar_peak_kb = run_jar_measured(setup_data, user_preferences)
+    row['jar_seconds'] = time.perf_counter() - started
+    row['jar_peak_kb'] = jar_peak_kb
+    index = {username: i for i, username in enumerate(matrix.usernames)}
+    jar_teams = matrix.teams_from_ids([[matrix.member_ids[index[username]] for username in team if username in index]
+                                       for team in parse_output(lines)])
+    row['jar_welfare'] = round(matrix.welfare(jar_teams), 6)
+    row['same_partition'] = partition(teams, matrix.usernames) == partition(jar_teams, matrix.usernames)
+    return row
+
+
+def _mean(values):
+    values = [value for value in values if value is not None]
+    return sum(values) / len(values) if values else None
+
+
+# Sums the rows up per instance size
+def summarize(rows):
+    sizes = []
+    for n in sorted(set(row['members'] for row in rows)):
+        runs = [row for row in rows if row['members'] == n]
+        jar_seconds = _mean([row['jar_seconds'] for row in runs])
+        engine_seconds = _mean([row['engine_seconds'] for row in runs])
+        compared = [row for row in runs if row['same_partition'] is not None]
+        sizes.append({'members': n, 'runs': len(runs), 'jar_seconds': jar_seconds, 'engine_seconds': engine_seconds,
+                      'speedup': jar_seconds / engine_seconds if jar_seconds is not None and engine_seconds else None,
+                      'jar_welfare': _mean([row['jar_welfare'] for row in runs]),
+                      'engine_welfare': _mean([row['engine_welfare'] for row in runs]),
+                      'same_partitions': sum(row['same_partition'] for row in compared) if compared else None,
+                      'engine_not_worse': sum(row['engine_welfare'] >= row['jar_welfare'] - 1e-9
+                                              for row in compared) if compared else None,
+                      'jar_peak_kb': max([row['jar_peak_kb'] for row in compared] or [None]),
+                      'engine_peak_kb': max([row['engine_peak_kb'] or 0 for row in runs])})
+    return sizes
+
+
+# Compares engine with the jar over trials random instances of every size in sizes
+def compare(sizes=SIZES, trials=3, group_size=2, engine='rsd', orderings=1000, seed=0, use_jar=True):
+    rng = np.random.RandomState(seed)
+    skipped = jar_unavailable() if use_jar else "jar runs were turned off"
+    rows = []
+    for n in sizes:
+        for trial in range(trials):
+            participants, rankings = random_instance(n, rng)
+            rows.append(compare_instance(participants, rankings, group_size, engine, orderings, seed + trial,
+                                         skipped is None))
+    return {'engine': engine, 'group_size': group_size, 'jar': skipped or "ran", 'runs': rows,
+            'sizes': summarize(rows)}
@@ -0,0 +1,44 @@
+"""
+graph.py holds the graph helpers the formation algorithms share
+-   Graphs are stored as CSR arrays: the neighbours of vertex v are indices[indptr[v]:indptr[v + 1]]
+-   weak_components() splits the directed "i ranked j" graph into groups of members that never rank anyone outside
+    their group, so each group can be solved on its own
+"""
+
+import numpy as np
+
+
+def csr_from_lists(neighbour_lists):
+    lengths = np.array([len(neighbours) for neighbours in neighbour_lists], dtype=np.int64)
+    indptr = np.zeros(len(neighbour_lists) + 1, dtype=np.int64)
+    np.cumsum(lengths, out=indptr[1:])
+    indices = np.fromiter((j for neighbours in neighbour_lists for j in neighbours), dtype=np.int64,
+                          count=int(indptr[-1]))
+    return indptr, indices
+
+
+def neighbours(indptr, indices, v):
+    return indices[indptr[v]:indptr[v + 1]]
+
+
+# Returns the weakly connected components of the graph where member i points at every member in ranked[i], as lists
+# of member numbers ordered by their smallest member
+def weak_components(ranked):
+    parent = np.arange(len(ranked))
+
+    def root(v):
+        while parent[v] != v:
+            parent[v] = parent[parent[v]]
+            v = parent[v]
+        return v
+
+    for i, order in enumerate(ranked):
+        for j in order:
+            a, b = root(i), root(j)
+            if a != b:
+                parent[max(a, b)] = min(a, b)
+
+    components = {}
+    for v in range(len(ranked)):
+        components.setdefault(root(v), []).append(v)
+    return [components[key] for key in sorted(components)]
@@ -0,0 +1,62 @@
+"""
+jar.py runs JavaCode/TeamFormationAlgorithms.jar and reads its output
+-   The jar takes two arguments: the setup data "<members> <group size> <iterative soulmates> <algorithm> <alpha>
+    <theta>" and the preferences "<username> <rank> <team|alone> <ranks of preferred members...> <username> ..."
+-   It prints one "T: user1 user2 ..." line per team and "S: user1 user2 ..." lines with members left on their own
+-   A jar that exits with an error or is killed raises JarError, which fails the FormationJob running it
+-   run_jar_measured() also returns the peak memory of the java process, for the comparisons of
+    main/formation/differential.py
+"""
+
+import os
+from subprocess import Popen, PIPE, STDOUT
+from django.conf import settings
+
+
+class JarError(Exception):
+    pass
+
+
+def jar_path():
+    return getattr(settings, 'TEAM_FORMATION_JAR',
+                   os.path.join(settings.BASE_DIR, 'JavaCode', 'TeamFormationAlgorithms.jar'))
+
+
+# Runs the jar and returns its console output and the resources used by the java process. Raises JarError if the jar
+# crashed or was killed, since its missing teams must not be mistaken for an answer
+def _run(setup_data, user_preferences):
+    p = Popen(['java', '-jar', jar_path(), setup_data, user_preferences], stdout=PIPE, stderr=STDOUT)
+    lines = [raw_line.decode("utf-8") for raw_line in p.stdout]
+    p.stdout.close()
+    # wait4 reports the resources of this one process, where getrusage would add up every child so far
+    pid, status, usage = os.wait4(p.pid, 0)
+    if os.WIFSIGNALED(status):
+        p.returncode = -os.WTERMSIG(status)
+        raise JarError("The jar was killed by signal " + str(os.WTERMSIG(status)) + ".")
+    p.returncode = os.WEXITSTATUS(status)
+    if p.returncode != 0:
+        raise JarError("The jar exited with status " + str(p.returncode) + ": " + "".join(lines[-5:]).strip())
+    return lines, usage
+
+
+# Runs the jar and returns its console output as a list of lines
+def run_jar(setup_data, user_preferences):
+    return _run(setup_data, user_preferences)[0]
+
+
+# Runs the jar like run_jar, also returning the peak resident memory of the java process in KB
+def run_jar_measured(setup_data, user_preferences):
+    lines, usage = _run(setup_data, user_preferences)
+    return lines, usage.ru_maxrss
+
+
+# Returns the teams printed by the jar as lists of usernames, members left alone each get a team of their own
+def parse_output(lines):
+    teams = []
+    for line in lines:
+        if line[0:2] == 'T:':
+            teams.append(line[3:].split())
+        if line[0:2] == 'S:':
+            for username in line[3:].split():
+                teams.append([username])
+    return teams
@@ -0,0 +1,227 @@
+"""
+joint.py forms teams and picks their projects in one pass, instead of forming teams from the partner rankings alone
+and handing out projects afterwards with the assign views
+-   The objective is (1 - project_weight) * welfare + project_weight * project score, where welfare is the partner
+    welfare of main/formation/matrix.py and the project score is the sum of project_scores[i, p] over every member i
+    on a team given project p. project_weight = 0 only looks at partners and project_weight = 1 only at projects
+-   Project p goes to at most project.max_teams teams, as with the assign views, and the teams left over get no
+    project. The search hands out max_teams slots of each project, each held by one team. Once it ends, the projects of
+    the best teams are settled with the min-cost flow of main/formation/assignment.py, which staffs project.min_teams
+    first
+-   It starts from the best of a batch of Random Serial Dictatorship orderings (main/formation/montecarlo.py), gives
+    out the projects greedily, then runs a time budgeted local search like main/formation/optimize.py whose proposals
+    also include handing a team another project (swapping with the team that has it)
+-   form_joint_teams() saves the result as a candidate MasterTeam that remembers the project of each team, so
+    finalizing it writes its Team and TeamProject rows in the same transaction (see MasterTeam.materialize)
+"""
+
+import math
+import time
+import numpy as np
+from main.formation.assignment import min_cost_assignment
+from main.formation.matrix import project_scores
+from main.formation.montecarlo import best_orderings
+from main.formation.profiling import FormationProfile
+from main.formation.scoring import TeamScores
+from main.formation.shared import shared_matrix
+from main.models import MasterTeam, Preferences, Project
+
+JOINT_ALGORITHM_INDEX = 6
+START_ORDERINGS = 1000
+BATCH_SIZE = 32
+PROJECT_WEIGHT = 0.5
+
+
+class JointScores(object):
+
+    def __init__(self, utility, scores, teams, group_size, project_weight, projects=None):
+        self.peers = TeamScores(utility, teams, capacity=group_size)
+        self.weight = project_weight
+        t, m = len(self.peers.size), scores.shape[1]
+        # column m is "no project", which scores 0 for everyone
+        self.scores = np.concatenate([scores, np.zeros((scores.shape[0], 1))], axis=1)
+        self.no_project = m
+        self.project_of = np.full(t, m, dtype=np.int64) if projects is None else np.asarray(projects, dtype=np.int64)
+        self.holder = np.full(m + 1, -1, dtype=np.int64)  # team holding each project
+        for team, project in enumerate(self.project_of):
+            if project != m:
+                self.holder[project] = team
+
+    # Sum of scores[member, projects[k]] over the members of teams[k]
+    def _team_scores(self, teams, projects):
+        rows = self.peers.members[teams]
+        valid = rows >= 0
+        return (self.scores[np.where(valid, rows, 0), projects[:, None]] * valid).sum(axis=1)
+
+    @property
+    def project_score(self):
+        teams = np.arange(len(self.project_of))
+        return float(self._team_scores(teams, self.project_of).sum())
+
+    @property
+    def objective(self):
+        return (1 - self.weight) * self.peers.welfare + self.weight * self.project_score
+
+    # Weighs the welfare and project changes of K proposals, keeping -inf for the proposals that are not allowed
+    def _combine(self, peer_deltas, project_deltas):
+        deltas = (1 - self.weight) * np.where(np.isinf(peer_deltas), 0, peer_deltas) + self.weight * project_deltas
+        deltas[np.isinf(peer_deltas)] = -np.inf
+        return deltas
+
+    def evaluate_moves(self, members, teams):
+        a = self.peers.team_of[members]
+        gained = self.scores[members, self.project_of[teams]] - self.scores[members, self.project_of[a]]
+        return self._combine(self.peers.evaluate_moves(members, teams), gained)
+
+    def evaluate_swaps(self, first, second):
+        a = self.peers.team_of[first]
+        b = self.peers.team_of[second]
+        pa, pb = self.project_of[a], self.project_of[b]
+        gained = (self.scores[first, pb] - self.scores[first, pa] + self.scores[second, pa] - self.scores[second, pb])
+        return self._combine(self.peers.evaluate_swaps(first, second), gained)
+
+    # Objective change of giving teams[k] projects[k], and the project teams[k] had to the team that held projects[k]
+    def evaluate_projects(self, teams, projects):
+        current = self.project_of[teams]
+        holders = self.holder[projects]
+        deltas = self._team_scores(teams, projects) - self._team_scores(teams, current)
+        held = holders >= 0
+        deltas[held] += (self._team_scores(holders[held], current[held])
+                         - self._team_scores(holders[held], projects[held]))
+        deltas = self.weight * deltas
+        deltas[current == projects] = -np.inf
+        return deltas
+
+    def give_project(self, team, project):
+        current = self.project_of[team]
+        holder = self.holder[project] if project != self.no_project else -1
+        if current != self.no_project:
+            self.holder[current] = holder
+        if holder >= 0:
+            self.project_of[holder] = current
+        self.project_of[team] = project
+        if project != self.no_project:
+            self.holder[project] = team
+
+    # The teams as member numbers, with the project number (or None) of each
+    def teams(self):
+        teams = []
+        projects = []
+        for t in range(len(self.peers.size)):
+            if self.peers.size[t] > 0:
+                teams.append([int(i) for i in self.peers.teammates(t)])
+                projects.append(int(self.project_of[t]) if self.project_of[t] != self.no_project else None)
+        return teams, projects
+
+
+# Gives each project (a column of scores) to at most one team, best total score first
+def greedy_projects(scores, teams):
+    m = scores.shape[1]
+    totals = np.array([scores[team].sum(axis=0) for team in teams]).reshape(len(teams), m)
+    projects = np.full(len(teams), m, dtype=np.int64)
+    for flat in np.argsort(-totals, axis=None, kind='stable'):
+        team, project = divmod(int(flat), m)
+        if totals[team, project] <= 0:
+            break
+        if projects[team] == m and project not in projects:
+            projects[team] = project
+    return projects
+
+
+# Gives the teams their projects with the min-cost flow of main/formation/assignment.py. Returns (teams, projects,
+# objective)
+def settle_projects(matrix, scores, teams, project_weight, min_teams, max_teams):
+    totals = np.array([scores[team].sum(axis=0) for team in teams]).reshape(len(teams), scores.shape[1])
+    assigned = min_cost_assignment(totals, min_teams, max_teams)
+    project_score = float(sum(totals[t, p] for t, p in enumerate(assigned) if p >= 0))
+    objective = (1 - project_weight) * matrix.welfare(teams) + project_weight * project_score
+    return teams, [int(p) if p >= 0 else None for p in assigned], objective
+
+
+# Returns (teams, projects, objective) for matrix and project scores. Project p can go to max_teams[p] teams (one
+# each by default), min_teams[p] of which it gets first. progress, if given, is a JobProgress told the best objective
+# found so far
+def joint_teams(matrix, scores, group_size, project_weight=PROJECT_WEIGHT, budget=2.0, seed=None, progress=None,
+                min_teams=None, max_teams=None):
+    m = scores.shape[1]
+    min_teams = np.zeros(m, dtype=np.int64) if min_teams is None else np.asarray(min_teams, dtype=np.int64)
+    max_teams = np.ones(m, dtype=np.int64) if max_teams is None else np.asarray(max_teams, dtype=np.int64)
+    slot_project = np.repeat(np.arange(m), max_teams)
+    slots = scores[:, slot_project]
+    rng = np.random.RandomState(seed)
+    kept, ignored = best_orderings(matrix, group_size, START_ORDERINGS, seed=seed)
+    start = kept[0][0]
+    # empty teams give members somewhere to go and project slots a team to take them, up to one team per slot
+    spare = max(0, -(-len(matrix) // group_size) - len(start)) + len(slot_project)
+    start = start + [[] for k in range(spare)]
+    state = JointScores(matrix.utility, slots, start, group_size, project_weight, greedy_projects(slots, start))
+    best = state.objective
+    best_teams = state.teams()[0]
+    members = np.flatnonzero(state.peers.team_of >= 0)
+    teams = len(state.peers.size)
+    if len(members) < 2:
+        return settle_projects(matrix, scores, best_teams, project_weight, min_teams, max_teams)
+
+    deadline = time.time() + budget
+    while True:
+        remaining = deadline - time.time()
+        if remaining <= 0:
+            break
+        temperature = max(1e-3, remaining / budget)
+        if progress:
+            progress.report('improve', 10 + 85 * (1 - remaining / budget), best)
+
+        first = rng.choice(members, BATCH_SIZE)
+        second = rng.choice(members, BATCH_SIZE)
+        targets = rng.randint(teams, size=BATCH_SIZE)
+        projects = rng.randint(len(slot_project) + 1, size=BATCH_SIZE)
+        proposals = np.stack([state.evaluate_swaps(first, second), state.evaluate_moves(first, targets),
+                              state.evaluate_projects(targets, projects)])
+        kind, k = np.unravel_index(int(np.argmax(proposals)), proposals.shape)
+        delta = proposals[kind, k]
+        if delta == -np.inf or (delta < 0 and rng.random_sample() >= math.exp(delta / temperature)):
+            continue
+        if kind == 0:
+            state.peers.swap(first[k], second[k])
+        elif kind == 1:
+            state.peers.move(first[k], targets[k])
+        else:
+            state.give_project(targets[k], projects[k])
+
+        if state.objective > best + 1e-9:
+            best = state.objective
+            best_teams = state.teams()[0]
+
+    return settle_projects(matrix, scores, best_teams, project_weight, min_teams, max_teams)
+
+
+def form_joint_teams(space, group_size, project_weight=PROJECT_WEIGHT, budget=2.0, seed=None, progress=None):
+    report = progress.report if progress else lambda stage, percent, best_metric=None: None
+    profile = FormationProfile()
+    profile.start()
+    try:
+        report('load', 0)
+        with profile.stage('load'):
+            matrix = shared_matrix(space)
+            projects = list(Project.objects.filter(space=space).order_by('id').values_list('id', 'name', 'min_teams',
+                                                                                           'max_teams'))
+            rankings = dict(Preferences.objects.filter(space=space).values_list('member__username',
+                                                                                'projects_ranking'))
+            scores = project_scores(matrix.usernames, rankings, [project[1] for project in projects])
+        with profile.stage('solve'):
+            teams, team_projects, objective = joint_teams(matrix, scores, group_size, project_weight, budget, seed,
+                                                          progress, [project[2] for project in projects],
+                                                          [project[3] for project in projects])
+        report('persist', 95, objective)
+        with profile.stage('persist'):
+            master_team = MasterTeam(space=space, number_of_members=group_size, iterative_soulmates=False,
+                                     algorithm_index=JOINT_ALGORITHM_INDEX)
+            master_team.set_teams(matrix.teams_to_ids(teams),
+                                  [projects[p][0] if p is not None else None for p in team_projects])
+            master_team.save()
+            space.teams_decided = False
+            space.save()
+    finally:
+        profile.stop()
+    profile.save([master_team])
+    return master_team
@@ -0,0 +1,135 @@
+"""
+matrix.py compiles the partner rankings of a space into a NumPy matrix the optimizers can score teams with
+-   Members are numbered 0..n-1 in the order of matrix.member_ids, and matrix.index maps a member id back to its number
+-   utility[i, j] is how much member i wants to be with member j: 1 for their first choice, falling evenly to 1/L for
+    the last of their L choices, and 0 for anyone they did not rank (or ranked after @myself@)
+-   ranked[i] lists the members i ranked, best first, and wants_team[i] is True if member i ranked @team@, i.e. would
+    rather be on any team than alone
+-   The welfare of a set of teams is the sum of utility[i, j] over every pair of teammates i != j
+-   project_scores() compiles the project rankings the same way: scores[i, p] falls evenly from 1 for member i's first
+    choice of project to 1/L for the last of their L choices, and is 0 for projects they did not rank
+-   cached_matrix(space) keeps the last few compiled matrices in memory, keyed on space.version, so repeated requests
+    for the same space (like the what-if editor in choose_teams.html) do not query Preferences again
+"""
+
+import threading
+from collections import OrderedDict
+import numpy as np
+from main.models import Preferences
+
+CACHE_SIZE = 8
+_cache = OrderedDict()
+_cache_lock = threading.Lock()
+
+
+# Returns, for every member, the numbers of the members they ranked in order (stopping at @myself@), and whether
+# they would rather be on any team than alone. Used on its own where the full utility matrix is not needed
+def compile_rankings(usernames, rankings):
+    user_to_index = {username: i for i, username in enumerate(usernames)}
+    ranked = []
+    wants_team = np.zeros(len(usernames), dtype=bool)
+    for i, username in enumerate(usernames):
+        order = []
+        for preference in rankings.get(username, '').split(' '):
+            if preference == "@myself@":
+                break
+            if preference == "@team@":
+                wants_team[i] = True
+            elif preference in user_to_index and user_to_index[preference] != i:
+                if user_to_index[preference] not in order:
+                    order.append(user_to_index[preference])
+        ranked.append(order)
+    return ranked, wants_team
+
+
+# Returns the (members, projects) scores of the project rankings, which list project names best first
+def project_scores(usernames, project_rankings, project_names):
+    project_to_index = {name: p for p, name in enumerate(project_names)}
+    scores = np.zeros((len(usernames), len(project_names)), dtype=np.float64)
+    for i, username in enumerate(usernames):
+        order = []
+        for name in project_rankings.get(username, '').split(', '):
+            if name in project_to_index and project_to_index[name] not in order:
+                order.append(project_to_index[name])
+        for position, p in enumerate(order):
+            scores[i, p] = 1.0 - position / len(order)
+    return scores
+
+
+class PreferenceMatrix(object):
+
+    def __init__(self, member_ids, usernames, rankings):
+        self.member_ids = list(member_ids)
+        self.usernames = list(usernames)
+        self.index = {member_id: i for i, member_id in enumerate(self.member_ids)}
+        self.ranked, self.wants_team = compile_rankings(self.usernames, rankings)
+        n = len(self.member_ids)
+        self.utility = np.zeros((n, n), dtype=np.float64)
+        for i, order in enumerate(self.ranked):
+            for position, j in enumerate(order):
+                self.utility[i, j] = 1.0 - position / len(order)
+
+    # Makes a matrix from arrays compiled earlier, like the read-only maps of main/formation/shared.py
+    @classmethod
+    def from_arrays(cls, member_ids, usernames, utility, ranked, wants_team):
+        matrix = cls.__new__(cls)
+        matrix.member_ids = list(member_ids)
+        matrix.usernames = list(usernames)
+        matrix.index = {member_id: i for i, member_id in enumerate(matrix.member_ids)}
+        matrix.utility = utility
+        matrix.ranked = ranked
+        matrix.wants_team = wants_team
+        return matrix
+
+    @classmethod
+    def from_space(cls, space):
+        return cls(*load_preferences(space))
+
+    def __len__(self):
+        return len(self.member_ids)
+
+    # Turns lists of member ids into lists of member numbers. Members no longer in the space are dropped and members
+    # missing from the teams get a team of their own. Teams left with nobody are dropped too, unless keep_empty is set
+    # so the teams keep their numbers
+    def teams_from_ids(self, teams, keep_empty=False):
+        indexed = []
+        seen = set()
+        for team in teams:
+            team = [self.index[member_id] for member_id in team if member_id in self.index]
+            if team or keep_empty:
+                indexed.append(team)
+                seen.update(team)
+        for i in range(len(self.member_ids)):
+            if i not in seen:
+                indexed.append([i])
+        return indexed
+
+    def teams_to_ids(self, teams):
+        return [[self.member_ids[i] for i in team] for team in teams if team]
+
+    def welfare(self, teams):
+        total = 0.0
+        for team in teams:
+            total += self.utility[np.ix_(team, team)].sum()
+        return float(total)
+
+
+# Returns the member ids and usernames of space, ordered by id, and their partner rankings ({username: members_ranking})
+def load_preferences(space):
+    members = list(space.member_set.exclude(name='Account in Progress').order_by('id').values_list('id', 'username'))
+    rankings = dict(Preferences.objects.filter(space=space).values_list('member__username', 'members_ranking'))
+    return [member[0] for member in members], [member[1] for member in members], rankings
+
+
+def cached_matrix(space):
+    key = (space.id, space.version)
+    with _cache_lock:
+        if key in _cache:
+            _cache.move_to_end(key)
+            return _cache[key]
+    matrix = PreferenceMatrix.from_space(space)
+    with _cache_lock:
+        _cache[key] = matrix
+        while len(_cache) > CACHE_SIZE:
+            _cache.popitem(last=False)
+    return matrix
@@ -0,0 +1,185 @@
+"""
+montecarlo.py runs Random Serial Dictatorship over thousands of random orderings at once and keeps the best outcome,
+instead of trusting the single ordering the jar draws
+-   In each ordering, every member not yet on a team takes their turn as dictator and forms a team with the (up to)
+    group size - 1 members they ranked highest that are still free. Members left alone who ranked @team@ are then
+    grouped in the order of the ordering
+-   The K orderings are rows of a (K, n) array and every turn is played for all of them with one set of NumPy
+    operations, so the Python loop runs n times rather than K * n times
+-   Each outcome is scored with the metrics of TeamScores.metrics() (main/formation/scoring.py): welfare, members with
+    a ranked teammate and members with their first choice
+-   form_monte_carlo_teams() saves the outcome with the highest welfare, or with keep='pareto' every outcome no other
+    outcome beats on all three metrics (up to PARETO_LIMIT), as MasterTeams along with how the welfare of all K
+    orderings was distributed
+"""
+
+import json
+import numpy as np
+from main.formation.profiling import FormationProfile
+from main.formation.shared import shared_matrix
+from main.formation.soulmates import find_soulmates
+from main.models import MasterTeam
+
+MONTE_CARLO_ALGORITHM_INDEX = 5
+ORDERINGS = 10000
+CHUNK = 1000  # orderings scored at once, which bounds the (CHUNK, n, longest ranking) arrays of score()
+PARETO_LIMIT = 5
+HISTOGRAM_BINS = 20
+OBJECTIVES = ('welfare', 'members_with_a_ranked_teammate', 'members_with_first_choice')
+
+FREE = -1
+NOBODY = -2  # team of the padding column, so padded ranking slots are never free and never teammates
+
+
+# Pads the rankings into an (n, L) array, using member number n (a column that is never free) as padding
+def padded_rankings(ranked, n):
+    longest = max([len(order) for order in ranked] + [1])
+    padded = np.full((n, longest), n, dtype=np.int64)
+    for i, order in enumerate(ranked):
+        padded[i, :len(order)] = order
+    return padded
+
+
+# Plays RSD for every row of orders, a (K, n) array of member numbers. Returns the (K, n) team of every member, where
+# each team is labelled by the number of one of its members
+def run_orderings(ranked, wants_team, group_size, orders, fixed_teams=()):
+    k, n = orders.shape
+    rankings = padded_rankings(ranked, n)
+    team_of = np.full((k, n + 1), FREE, dtype=np.int32)
+    team_of[:, n] = NOBODY
+    for team in fixed_teams:
+        team_of[:, team] = team[0]
+
+    rows = np.arange(k)
+    for turn in range(n):
+        dictators = orders[:, turn]
+        active = rows[team_of[rows, dictators] == FREE]
+        if not active.size:
+            continue
+        dictators = dictators[active]
+        team_of[active, dictators] = dictators
+        choices = rankings[dictators]
+        free = team_of[active[:, None], choices] == FREE
+        taken = free & (np.cumsum(free, axis=1) <= group_size - 1)
+        row, column = np.nonzero(taken)
+        team_of[active[row], choices[row, column]] = dictators[row]
+    team_of = team_of[:, :n]
+
+    # Members alone who would rather be on any team are grouped with each other, group_size at a time
+    sizes = np.bincount((team_of + rows[:, None] * n).ravel(), minlength=k * n).reshape(k, n)
+    alone = (sizes[rows[:, None], team_of] == 1) & wants_team[None, :]
+    row, position = np.nonzero(alone[rows[:, None], orders])
+    if row.size:
+        members = orders[row, position]
+        starts = np.searchsorted(row, row)
+        place = np.arange(row.size) - starts
+        team_of[row, members] = members[np.arange(row.size) - place % group_size]
+    return team_of
+
+
+# Scores every outcome of run_orderings(), returning one array per name in OBJECTIVES
+def score(utility, ranked, team_of):
+    k, n = team_of.shape
+    rankings = padded_rankings(ranked, n)
+    weights = np.zeros(rankings.shape, dtype=np.float64)
+    for i, order in enumerate(ranked):
+        weights[i, :len(order)] = utility[i, order]
+    scores = {name: np.zeros(k) for name in OBJECTIVES}
+    for start in range(0, k, CHUNK):
+        chunk = team_of[start:start + CHUNK]
+        chunk = np.concatenate([chunk, np.full((len(chunk), 1), NOBODY, dtype=chunk.dtype)], axis=1)
+        together = chunk[:, rankings] == chunk[:, :n, None]
+        satisfaction = np.einsum('knl,nl->kn', together, weights)
+        first_choice = (together & (weights >= 1.0)).any(axis=2)
+        scores['welfare'][start:start + CHUNK] = satisfaction.sum(axis=1)
+        scores['members_with_a_ranked_teammate'][start:start + CHUNK] = (satisfaction > 0).sum(axis=1)
+        scores['members_with_first_choice'][start:start + CHUNK] = first_choice.sum(axis=1)
+    return scores
+
+
+def teams_of(labels):
+    teams = {}
+    for i, label in enumerate(labels):
+        teams.setdefault(int(label), []).append(i)
+    return list(teams.values())
+
+
+# Numbers of the outcomes that no other outcome beats on every objective, best welfare first. Outcomes with the same
+# scores are counted once
+def pareto_front(scores, limit=PARETO_LIMIT):
+    points = np.stack([scores[name] for name in OBJECTIVES], axis=1)
+    front = []
+    for candidate in np.lexsort(points.T[::-1] * -1):
+        point = points[candidate]
+        if any((points[kept] >= point).all() for kept in front):
+            continue
+        front.append(int(candidate))
+        if len(front) == limit:
+            break
+    return front
+
+
+def distribution(values, orderings):
+    counts, edges = np.histogram(values, bins=HISTOGRAM_BINS)
+    percentiles = np.percentile(values, [0, 5, 25, 50, 75, 95, 100])
+    return {'orderings': orderings, 'metric': 'welfare', 'mean': round(float(values.mean()), 3),
+            'percentiles': dict(zip(['min', 'p5', 'p25', 'median', 'p75', 'p95', 'max'],
+                                    [round(float(value), 3) for value in percentiles])),
+            'histogram': {'counts': [int(count) for count in counts],
+                          'edges': [round(float(edge), 3) for edge in edges]}}
+
+
+# Plays RSD over orderings random orderings of matrix and returns the outcomes to keep as (teams, scores) along with
+# the scores of every ordering. progress, if given, is a JobProgress told the best welfare found so far
+def best_orderings(matrix, group_size, orderings=ORDERINGS, keep='best', iterative_soulmates=True, seed=None,
+                   progress=None):
+    rng = np.random.RandomState(seed)
+    n = len(matrix)
+    fixed_teams = find_soulmates(matrix.ranked, group_size) if iterative_soulmates else []
+    team_of = np.empty((orderings, n), dtype=np.int32)
+    scores = {name: np.empty(orderings) for name in OBJECTIVES}
+    for start in range(0, orderings, CHUNK):
+        size = min(CHUNK, orderings - start)
+        orders = np.argsort(rng.random_sample((size, n)), axis=1)
+        team_of[start:start + size] = run_orderings(matrix.ranked, matrix.wants_team, group_size, orders, fixed_teams)
+        for name, values in score(matrix.utility, matrix.ranked, team_of[start:start + size]).items():
+            scores[name][start:start + size] = values
+        if progress:
+            best = float(scores['welfare'][:start + size].max())
+            progress.report('orderings', 10 + 80 * (start + size) / orderings, best)
+
+    chosen = pareto_front(scores) if keep == 'pareto' else [int(np.argmax(scores['welfare']))]
+    kept = [(teams_of(team_of[k]), {name: float(scores[name][k]) for name in OBJECTIVES}) for k in chosen]
+    return kept, scores
+
+
+def form_monte_carlo_teams(space, group_size, orderings=ORDERINGS, keep='best', iterative_soulmates=True, seed=None,
+                           progress=None):
+    report = progress.report if progress else lambda stage, percent, best_metric=None: None
+    profile = FormationProfile()
+    profile.start()
+    try:
+        report('load', 0)
+        with profile.stage('load'):
+            matrix = shared_matrix(space)
+        with profile.stage('orderings'):
+            kept, scores = best_orderings(matrix, group_size, orderings, keep, iterative_soulmates, seed,
+                                          progress)
+        report('persist', 95, kept[0][1]['welfare'])
+        with profile.stage('persist'):
+            summary = distribution(scores['welfare'], orderings)
+            master_teams = []
+            for teams, chosen_scores in kept:
+                master_team = MasterTeam(space=space, number_of_members=group_size,
+                                         iterative_soulmates=iterative_soulmates,
+                                         algorithm_index=MONTE_CARLO_ALGORITHM_INDEX,
+                                         score_distribution=json.dumps(dict(summary, chosen=chosen_scores)))
+                master_team.set_teams(matrix.teams_to_ids(teams))
+                master_team.save()
+                master_teams.append(master_team)
+            space.teams_decided = False
+            space.save()
+    finally:
+        profile.stop()
+    profile.save(master_teams)
+    return master_teams[0]
@@ -0,0 +1,78 @@
+"""
+optimize.py improves an existing set of teams with a time budgeted local search
+-   Starting from any MasterTeam, it repeatedly scores a batch of random proposals (moving one member to a team with
+    room, or swapping two members of different teams) with TeamScores from main/formation/scoring.py, which only looks
+    at the teams involved, and takes the best proposal of the batch
+-   Proposals are accepted with simulated annealing: always when they help, and with a chance that shrinks over the
+    budget when they hurt. The best teams seen are kept, so stopping at any time gives a valid answer
+-   No team ever grows past the group size of the MasterTeam
+-   improve_master_team() saves the result as a new candidate MasterTeam for the owner to compare
+"""
+
+import math
+import time
+import numpy as np
+from main.formation.matrix import PreferenceMatrix
+from main.formation.scoring import TeamScores
+from main.models import MasterTeam
+
+LOCAL_SEARCH_ALGORITHM_INDEX = 3
+BATCH_SIZE = 32
+
+
+# progress, if given, is a JobProgress (see main/formation/progress.py) told the best welfare found so far
+def improve(matrix, teams, group_size, budget=2.0, seed=None, progress=None):
+    rng = np.random.RandomState(seed)
+    scores = TeamScores(matrix.utility, teams, capacity=group_size)
+    best = scores.welfare
+    best_teams = scores.teams()
+    members = np.flatnonzero(scores.team_of >= 0)
+    if len(members) < 2 or len(scores.size) < 2:
+        return best_teams, best
+
+    deadline = time.time() + budget
+    while True:
+        remaining = deadline - time.time()
+        if remaining <= 0:
+            break
+        temperature = max(1e-3, remaining / budget)
+        if progress:
+            progress.report('improve', 10 + 85 * (1 - remaining / budget), best)
+
+        first = rng.choice(members, BATCH_SIZE)
+        second = rng.choice(members, BATCH_SIZE)
+        targets = rng.randint(len(scores.size), size=BATCH_SIZE)
+        swaps = scores.evaluate_swaps(first, second)
+        moves = scores.evaluate_moves(first, targets)
+        k = int(np.argmax(np.maximum(swaps, moves)))
+        delta = max(swaps[k], moves[k])
+        if delta == -np.inf or (delta < 0 and rng.random_sample() >= math.exp(delta / temperature)):
+            continue
+        if swaps[k] >= moves[k]:
+            scores.swap(first[k], second[k])
+        else:
+            scores.move(first[k], targets[k])
+
+        if scores.welfare > best + 1e-9:
+            best = scores.welfare
+            best_teams = scores.teams()
+
+    return best_teams, best
+
+
+# Saves an improved copy of master_team as a new candidate MasterTeam and returns it
+def improve_master_team(master_team, budget=2.0, seed=None, progress=None):
+    if progress:
+        progress.report('load', 0)
+    matrix = PreferenceMatrix.from_space(master_team.space)
+    teams = matrix.teams_from_ids(master_team.team_member_ids())
+    improved_teams, welfare = improve(matrix, teams, master_team.number_of_members, budget, seed, progress)
+    if progress:
+        progress.report('persist', 95, welfare)
+
+    improved = MasterTeam(space=master_team.space, number_of_members=master_team.number_of_members,
+                          iterative_soulmates=master_team.iterative_soulmates,
+                          algorithm_index=LOCAL_SEARCH_ALGORITHM_INDEX)
+    improved.set_teams(matrix.teams_to_ids(improved_teams))
+    improved.save()
+    return improved
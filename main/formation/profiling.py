@@ -0,0 +1,110 @@
+"""
+profiling.py records how long each stage of a formation takes, so owners can see what dominates a slow formation
+-   A FormationProfile is filled in by form_teams() in main/formation/service.py with "with profile.stage(name):"
+    blocks for load, soulmates, encode, solve, decode and persist
+-   Stages that run once per component (encode, solve and decode) add up their seconds across the worker threads, and
+    count how many times they ran
+-   With settings.TEAM_FORMATION_PROFILE = True each stage also records the memory Python allocated and kept during
+    it, and the peak traced so far (with tracemalloc, which slows formation down). tracemalloc is process wide, so
+    profiles running at the same time (form_teams --workers, background jobs) share one trace: the first to start
+    turns it on and the last to stop turns it off, and tracing started by anything else is left running
+-   With settings.TEAM_FORMATION_PROFILE_DIR set, the whole formation is run under cProfile and the stats are dumped
+    there for pstats or snakeviz
+-   save() stores the stages as JSON on MasterTeam.profile, which is shown to the owner in choose_teams.html
+"""
+
+import cProfile
+import json
+import os
+import threading
+import time
+import tracemalloc
+from collections import OrderedDict
+from contextlib import contextmanager
+from django.conf import settings
+from main.models import MasterTeam
+
+STAGES = ('load', 'soulmates', 'encode', 'solve', 'decode', 'persist')
+
+_tracing_lock = threading.Lock()
+_tracing_profiles = 0  # profiles tracing memory right now
+_profiles_own_tracing = False  # whether the first of them turned tracemalloc on, and so the last should turn it off
+
+
+class FormationProfile(object):
+
+    def __init__(self, trace_memory=None):
+        if trace_memory is None:
+            trace_memory = getattr(settings, 'TEAM_FORMATION_PROFILE', False)
+        self.trace_memory = trace_memory
+        self.stages = OrderedDict()
+        self._lock = threading.Lock()
+        self._started_tracing = False
+
+    @contextmanager
+    def stage(self, name):
+        tracing = self.trace_memory and tracemalloc.is_tracing()
+        before = tracemalloc.get_traced_memory()[0] if tracing else 0
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            seconds = time.perf_counter() - started
+            with self._lock:
+                record = self.stages.setdefault(name, {'seconds': 0.0, 'runs': 0, 'memory_kb': None, 'peak_kb': None})
+                record['seconds'] += seconds
+                record['runs'] += 1
+                if tracing:
+                    current, peak = tracemalloc.get_traced_memory()
+                    record['memory_kb'] = (record['memory_kb'] or 0) + (current - before) // 1024
+                    record['peak_kb'] = max(record['peak_kb'] or 0, peak // 1024)
+
+    def start(self):
+        global _tracing_profiles, _profiles_own_tracing
+        if not self.trace_memory or self._started_tracing:
+            return
+        with _tracing_lock:
+            if _tracing_profiles == 0:
+                _profiles_own_tracing = not tracemalloc.is_tracing()
+                if _profiles_own_tracing:
+                    tracemalloc.start()
+            _tracing_profiles += 1
+        self._started_tracing = True
+
+    def stop(self):
+        global _tracing_profiles
+        if not self._started_tracing:
+            return
+        with _tracing_lock:
+            _tracing_profiles -= 1
+            if _tracing_profiles == 0 and _profiles_own_tracing:
+                tracemalloc.stop()
+        self._started_tracing = False
+
+    def dumps(self):
+        stages = [dict(record, name=name) for name, record in self.stages.items()]
+        for record in stages:
+            record['seconds'] = round(record['seconds'], 4)
+        return json.dumps(stages, separators=(',', ':'))
+
+    # Saves the stages on the MasterTeams a formation made, with update() so the timings do not bump space.version a
+    # second time
+    def save(self, master_teams):
+        profile = self.dumps()
+        for master_team in master_teams:
+            master_team.profile = profile
+        MasterTeam.objects.filter(pk__in=[master_team.pk for master_team in master_teams]).update(profile=profile)
+
+
+# Runs function under cProfile when settings.TEAM_FORMATION_PROFILE_DIR is set, dumping the stats to a file whose
+# name starts with label
+def run_profiled(label, function, *args, **kwargs):
+    directory = getattr(settings, 'TEAM_FORMATION_PROFILE_DIR', None)
+    if not directory:
+        return function(*args, **kwargs)
+    profiler = cProfile.Profile()
+    try:
+        return profiler.runcall(function, *args, **kwargs)
+    finally:
+        os.makedirs(directory, exist_ok=True)
+        profiler.dump_stats(os.path.join(directory, label + "-" + time.strftime("%Y%m%d-%H%M%S") + ".prof"))
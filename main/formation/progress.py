@@ -0,0 +1,154 @@
+"""
+progress.py runs formations and local searches as FormationJobs and writes their progress as they go
+-   start_job() makes the FormationJob and runs the work on a background thread after the request commits (see
+    main/background.py), or right away when settings.FORMATION_IN_BACKGROUND is False
+-   The work is handed a JobProgress, and calls progress.report(stage, percent, best_metric) whenever it gets further.
+    Reports are written to the FormationJob row with a single UPDATE, at most every MIN_INTERVAL seconds unless the
+    stage changes, so reporting never slows the solver down
+-   The ETA assumes the rest of the job goes as fast as the part already done
+-   The progress endpoints in main/views.py only read the FormationJob row: event_stream() yields server-sent events
+    as the row changes, and wait_for_change() holds a long-poll request until it does. Both give up after 20 seconds,
+    under gunicorn's 30 second timeout, so a request never holds a server thread for long, and the browser simply asks
+    again (EventSource reconnects after the retry delay sent first, and the long poll is sent again)
+-   A job on a background thread dies with its process, e.g. when gunicorn restarts a worker. While it runs, another
+    thread stamps FormationJob.heartbeat every HEARTBEAT_INTERVAL seconds, and the progress endpoints mark a queued or
+    running job failed once its heartbeat is older than ORPHANED_AFTER, so the owner is not left waiting forever
+"""
+
+import json
+import threading
+import time
+from django.conf import settings
+from django.db import connection
+from django.utils import timezone
+from main.background import run_in_background
+from main.formation.jar import JarError
+from main.models import FormationJob
+
+MIN_INTERVAL = 0.5
+POLL_INTERVAL = 0.5  # seconds between reads of the FormationJob row by the progress endpoints
+STREAM_TIMEOUT = 20
+LONG_POLL_TIMEOUT = 20
+HEARTBEAT_INTERVAL = 10
+ORPHANED_AFTER = 60  # seconds without a heartbeat after which a queued or running job is taken to be lost
+
+
+class JobProgress(object):
+
+    def __init__(self, job_id, metric=''):
+        self.job_id = job_id
+        self.metric = metric
+        self.started = time.time()
+        self.last_write = 0.0
+        self.stage = None
+
+    def report(self, stage, percent, best_metric=None):
+        now = time.time()
+        if stage == self.stage and now - self.last_write < MIN_INTERVAL:
+            return
+        self.stage = stage
+        self.last_write = now
+        percent = int(max(0, min(100, percent)))
+        elapsed = now - self.started
+        eta = elapsed * (100 - percent) / percent if percent > 0 else None
+        fields = {'status': 'running', 'stage': stage, 'percent': percent, 'eta_seconds': eta,
+                  'updated': timezone.now(), 'heartbeat': timezone.now()}
+        if best_metric is not None:
+            fields.update(metric=self.metric, best_metric=best_metric)
+        FormationJob.objects.filter(pk=self.job_id).update(**fields)
+
+
+# Runs function(*args, progress=JobProgress, **kwargs), which must return the MasterTeam it made
+def run_job(job_id, metric, function, *args, **kwargs):
+    progress = JobProgress(job_id, metric)
+    try:
+        master_team = function(*args, progress=progress, **kwargs)
+    except Exception as error:
+        FormationJob.objects.filter(pk=job_id).update(status='failed', error=str(error)[:300], eta_seconds=None,
+                                                      updated=timezone.now())
+        raise
+    FormationJob.objects.filter(pk=job_id).update(status='done', stage='done', percent=100, eta_seconds=0,
+                                                  master=master_team, updated=timezone.now())
+    return master_team
+
+
+def _beat(job_id, stop):
+    try:
+        while True:
+            FormationJob.objects.filter(pk=job_id).update(heartbeat=timezone.now())
+            if stop.wait(HEARTBEAT_INTERVAL):
+                return
+    finally:
+        connection.close()
+
+
+# Runs the job like run_job while another thread stamps its heartbeat, for jobs run on a background thread
+def run_job_with_heartbeat(job_id, metric, function, *args, **kwargs):
+    stop = threading.Event()
+    beat = threading.Thread(target=_beat, args=(job_id, stop), daemon=True)
+    beat.start()
+    try:
+        return run_job(job_id, metric, function, *args, **kwargs)
+    finally:
+        stop.set()
+        beat.join()
+
+
+def start_job(space, kind, metric, function, *args, **kwargs):
+    job = FormationJob.objects.create(space=space, kind=kind, metric=metric, heartbeat=timezone.now())
+    if getattr(settings, 'FORMATION_IN_BACKGROUND', False):
+        run_in_background(run_job_with_heartbeat, job.id, metric, function, *args, **kwargs)
+    else:
+        try:
+            run_job(job.id, metric, function, *args, **kwargs)
+        except JarError:
+            pass  # the job is marked failed with the jar's error, which the progress page shows
+        job.refresh_from_db()
+    return job
+
+
+# Marks the job failed if the thread running it stopped sending heartbeats, and returns it as it is now
+def fail_if_orphaned(job):
+    if job.finished() or (timezone.now() - (job.heartbeat or job.created)).total_seconds() < ORPHANED_AFTER:
+        return job
+    FormationJob.objects.filter(pk=job.pk, status__in=('queued', 'running')).update(
+        status='failed', error="The server stopped working on this formation. Please start it again.",
+        eta_seconds=None, updated=timezone.now())
+    job.refresh_from_db()
+    return job
+
+
+def progress_of(job):
+    progress = job.progress()
+    progress['updated'] = job.updated.timestamp()
+    return progress
+
+
+# Yields a server-sent event every time the job's progress changes, until it finishes or STREAM_TIMEOUT passes
+def event_stream(job_id, timeout=STREAM_TIMEOUT):
+    yield "retry: 2000\n\n"
+    deadline = time.time() + timeout
+    last = None
+    while True:
+        job = FormationJob.objects.filter(pk=job_id).first()
+        if job is None:
+            yield "event: gone\ndata: {}\n\n"
+            return
+        job = fail_if_orphaned(job)
+        progress = progress_of(job)
+        if progress != last:
+            yield "data: " + json.dumps(progress) + "\n\n"
+            last = progress
+        if job.finished() or time.time() >= deadline:
+            return
+        time.sleep(POLL_INTERVAL)
+
+
+# Returns the job as soon as it was updated after since (a timestamp from progress_of), it finishes, or timeout passes
+def wait_for_change(job_id, since, timeout=LONG_POLL_TIMEOUT):
+    deadline = time.time() + timeout
+    while True:
+        job = fail_if_orphaned(FormationJob.objects.get(pk=job_id))
+        if job.finished() or job.updated.timestamp() > since or time.time() >= deadline:
+            return job
+        time.sleep(POLL_INTERVAL)
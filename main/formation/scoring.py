@@ -0,0 +1,145 @@
+"""
+scoring.py keeps the welfare of a set of teams up to date as members move between them
+-   satisfaction[i] is the sum of utility[i, j] over member i's teammates, i.e. how happy i is with their team
+-   team_welfare[t] is the sum of satisfaction over the members of team t, so the welfare is team_welfare.sum()
+-   Teams are rows of the members array, padded with -1, so a move or a swap only touches the rows of the two teams
+    involved: O(group size) work instead of rescoring every team
+-   evaluate_moves() and evaluate_swaps() score K candidate moves or swaps at once with NumPy, without applying them
+-   Used by the local search in main/formation/optimize.py and the what-if editor in choose_teams.html
+"""
+
+import numpy as np
+
+
+class TeamScores(object):
+
+    def __init__(self, utility, teams, capacity=None):
+        self.utility = utility
+        self.pair = utility + utility.T  # what i and j gain together when they share a team
+        n = utility.shape[0]
+        largest = max([len(team) for team in teams] + [1])
+        self.capacity = capacity if capacity is not None else largest
+        width = max(self.capacity, largest) + 1  # one spare slot so a swap can pass through capacity + 1
+
+        self.members = np.full((len(teams), width), -1, dtype=np.int64)
+        self.size = np.zeros(len(teams), dtype=np.int64)
+        self.team_of = np.full(n, -1, dtype=np.int64)
+        self.slot = np.full(n, -1, dtype=np.int64)
+        for t, team in enumerate(teams):
+            for i in team:
+                self._place(i, t)
+
+        self.satisfaction = np.zeros(n, dtype=np.float64)
+        self.team_welfare = np.zeros(len(teams), dtype=np.float64)
+        for t in range(len(teams)):
+            team = self.teammates(t)
+            self.satisfaction[team] = utility[np.ix_(team, team)].sum(axis=1)
+            self.team_welfare[t] = self.satisfaction[team].sum()
+
+    def _place(self, i, t):
+        self.members[t, self.size[t]] = i
+        self.slot[i] = self.size[t]
+        self.team_of[i] = t
+        self.size[t] += 1
+
+    def _take(self, i):
+        t = self.team_of[i]
+        last = self.members[t, self.size[t] - 1]
+        self.members[t, self.slot[i]] = last
+        self.slot[last] = self.slot[i]
+        self.members[t, self.size[t] - 1] = -1
+        self.size[t] -= 1
+        self.team_of[i] = -1
+        self.slot[i] = -1
+
+    def teammates(self, t):
+        return self.members[t, :self.size[t]]
+
+    @property
+    def welfare(self):
+        return float(self.team_welfare.sum())
+
+    # What member i would gain from (or currently gets out of) the other members of team t
+    def gain(self, i, t):
+        team = self.teammates(t)
+        return float(self.pair[i, team[team != i]].sum())
+
+    def delta_move(self, i, t):
+        return self.gain(i, t) - self.gain(i, self.team_of[i])
+
+    def delta_swap(self, i, j):
+        a = self.team_of[i]
+        b = self.team_of[j]
+        if a == b:
+            return 0.0
+        return (self.gain(i, b) - self.pair[i, j] - self.gain(i, a)
+                + self.gain(j, a) - self.pair[j, i] - self.gain(j, b))
+
+    def move(self, i, t):
+        a = self.team_of[i]
+        if a == t:
+            return
+        old_team = self.teammates(a)
+        old_team = old_team[old_team != i]
+        self.team_welfare[a] -= self.pair[i, old_team].sum()
+        self.satisfaction[old_team] -= self.utility[old_team, i]
+        self._take(i)
+
+        new_team = self.teammates(t)
+        self.team_welfare[t] += self.pair[i, new_team].sum()
+        self.satisfaction[new_team] += self.utility[new_team, i]
+        self.satisfaction[i] = self.utility[i, new_team].sum()
+        self._place(i, t)
+
+    def swap(self, i, j):
+        a = self.team_of[i]
+        b = self.team_of[j]
+        if a != b:
+            self.move(i, b)
+            self.move(j, a)
+
+    # Gains of members[k] with the other members of teams[k], for K members at once
+    def _gains(self, members, teams):
+        rows = self.members[teams]
+        valid = (rows >= 0) & (rows != members[:, None])
+        return (self.pair[members[:, None], np.where(valid, rows, 0)] * valid).sum(axis=1)
+
+    # Welfare change of moving members[k] to teams[k]; -inf where the team is full or already theirs
+    def evaluate_moves(self, members, teams):
+        members = np.asarray(members, dtype=np.int64)
+        teams = np.asarray(teams, dtype=np.int64)
+        deltas = self._gains(members, teams) - self._gains(members, self.team_of[members])
+        invalid = (self.size[teams] >= self.capacity) | (self.team_of[members] == teams)
+        deltas[invalid] = -np.inf
+        return deltas
+
+    # Welfare change of swapping first[k] with second[k]; -inf where both are on the same team
+    def evaluate_swaps(self, first, second):
+        first = np.asarray(first, dtype=np.int64)
+        second = np.asarray(second, dtype=np.int64)
+        a = self.team_of[first]
+        b = self.team_of[second]
+        deltas = (self._gains(first, b) - self.pair[first, second] - self._gains(first, a)
+                  + self._gains(second, a) - self.pair[second, first] - self._gains(second, b))
+        deltas[a == b] = -np.inf
+        return deltas
+
+    def teams(self):
+        return [[int(i) for i in self.teammates(t)] for t in range(len(self.size)) if self.size[t] > 0]
+
+    def metrics(self):
+        placed = self.team_of >= 0
+        ranked_anyone = self.utility.max(axis=1) > 0
+        with_first_choice = np.zeros(len(self.team_of), dtype=bool)
+        for t in range(len(self.size)):
+            team = self.teammates(t)
+            with_first_choice[team] = (self.utility[np.ix_(team, team)] >= 1.0).any(axis=1)
+        return {
+            'welfare': round(self.welfare, 3),
+            'average_satisfaction': round(float(self.satisfaction[placed].mean()) if placed.any() else 0.0, 3),
+            'members_with_a_ranked_teammate': int(((self.satisfaction > 0) & placed).sum()),
+            'members_with_first_choice': int(with_first_choice.sum()),
+            'members_who_ranked': int(ranked_anyone.sum()),
+            'teams': int((self.size > 0).sum()),
+            'members_alone': int((self.size == 1).sum()),
+        }
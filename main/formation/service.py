@@ -0,0 +1,213 @@
+"""
+service.py forms candidate teams for a space, one stage at a time
+-   load:    the registered members of the space and their partner rankings, in two queries
+-   encode:  the setup data and preference strings the jar expects, with every member given a random rank
+-   solve:   running the jar (see main/formation/jar.py)
+-   decode:  turning the usernames printed by the jar back into lists of member ids
+-   persist: saving the teams packed on a new MasterTeam (see MasterTeam in main/models.py)
+-   form_teams() runs all of them and is what form_teams_view and the form_teams management command call
+-   solve_components() splits spaces of at least SPLIT_MIN_MEMBERS members into the weakly connected components of
+    the ranking graph, packs the components into batches of at least SPLIT_MIN_MEMBERS members and runs one jar per
+    batch at the same time. Members of components too small to fill a team, and members who wanted any team but were
+    left alone in theirs, are pooled and solved together at the end. Smaller spaces pay for one JVM start, as before
+-   form_teams() can also be given a JobProgress, so owners can follow a formation running as a FormationJob
+-   Every stage is timed with a FormationProfile (see main/formation/profiling.py) and the timings are saved on the
+    MasterTeam
+-   With settings.TEAM_FORMATION_SOULMATES = 'python', Iterative Soulmates groups are found before encoding by
+    main/formation/soulmates.py and only the members left over are sent to the jar
+"""
+
+import os
+import random
+from concurrent.futures import ThreadPoolExecutor
+from django.conf import settings
+from main.formation.graph import weak_components
+from main.formation.jar import run_jar, parse_output
+from main.formation.matrix import compile_rankings
+from main.formation.profiling import FormationProfile, run_profiled
+from main.formation.shared import preferences_key
+from main.formation.soulmates import find_soulmates_parallel
+from main.models import MasterTeam, Preferences
+
+SPLIT_MIN_MEMBERS = 300  # below this, starting one JVM per batch of components costs more than it saves
+
+
+def load(space):
+    # ordered, so runs over the same preferences number the members the same way and share what they publish
+    members = list(space.member_set.exclude(name='Account in Progress').order_by('id'))
+    rankings = dict(Preferences.objects.filter(space=space).values_list('member__username', 'members_ranking'))
+    return members, rankings
+
+
+def encode(members, rankings, group_size, algorithm_index, alpha, theta, iterative_soulmates=True):
+    alpha_adjusted = int(float(alpha) * 1000000)
+    theta_adjusted = int(float(theta) * 100)
+    setup_data = str(len(members)) + " " + str(group_size) + " " + ("1" if iterative_soulmates else "0") + " " \
+        + str(algorithm_index) + " " + str(alpha_adjusted) + " " + str(theta_adjusted)
+
+    # Assigns each member a rank and sets up easy lookup between usernames and rankings
+    random_array = random.sample(range(0, len(members)), len(members))
+    user_to_rank_dict = {}
+    for count, member in enumerate(members):
+        user_to_rank_dict[member.username] = random_array[count]
+
+    # Gets member preferences ready for the java program
+    user_preferences = ""
+    for member in members:
+        member_data = member.username + " " + str(user_to_rank_dict[member.username]) + " "
+        if member.username in rankings:
+            wants_any_team = False
+            finished = False
+            pref_data = ""
+            for preference in rankings[member.username].split(' '):
+                if preference == "@myself@":
+                    finished = True
+                elif preference == "@team@":
+                    wants_any_team = True
+                if preference in user_to_rank_dict and not finished:
+                    pref_data += str(user_to_rank_dict[preference]) + " "
+            if wants_any_team:
+                pref_data = "team " + pref_data
+            else:
+                pref_data = "alone " + pref_data
+            member_data += " " + pref_data
+        else:
+            member_data += "alone "
+        user_preferences += member_data
+    return setup_data, user_preferences
+
+
+# Names the rankings published for the soulmates workers after the members and rankings that were loaded
+def soulmates_key(space, members, rankings):
+    return preferences_key(space.id, [member.id for member in members], [member.username for member in members],
+                           rankings) + "-rankings"
+
+
+# Takes the Iterative Soulmates groups out of members, returns them as lists of member ids with the members left over
+def split_soulmates(members, rankings, group_size, key=None):
+    ranked, wants_team = compile_rankings([member.username for member in members], rankings)
+    groups = find_soulmates_parallel(ranked, group_size, key=key)
+    matched = set(i for group in groups for i in group)
+    teams = [[members[i].id for i in group] for group in groups]
+    return teams, [member for i, member in enumerate(members) if i not in matched]
+
+
+def solve(setup_data, user_preferences):
+    return run_jar(setup_data, user_preferences)
+
+
+def decode(lines, members):
+    user_to_id_dict = {member.username: member.id for member in members}
+    teams = []
+    for usernames in parse_output(lines):
+        team = [user_to_id_dict[username] for username in usernames if username in user_to_id_dict]
+        if team:
+            teams.append(team)
+    return teams
+
+
+# Joins components, which cannot affect each other, into batches of at least min_members members
+def batch_components(components, min_members):
+    batches = []
+    batch = []
+    for component in components:
+        batch = batch + component
+        if len(batch) >= min_members:
+            batches.append(batch)
+            batch = []
+    if batch and batches:
+        batches[-1].extend(batch)
+    elif batch:
+        batches.append(batch)
+    return batches
+
+
+# Forms teams for members one batch of weakly connected components at a time. Each batch spends its time in its own
+# java process, so threads are enough to solve them in parallel
+def solve_components(members, rankings, group_size, algorithm_index, alpha, theta, iterative_soulmates=True,
+                     workers=None, profile=None, progress=None):
+    profile = profile or FormationProfile(trace_memory=False)
+    ranked, wants_team = compile_rankings([member.username for member in members], rankings)
+
+    def run(numbers):
+        part = [members[i] for i in numbers]
+        with profile.stage('encode'):
+            setup_data, user_preferences = encode(part, rankings, group_size, algorithm_index, alpha, theta,
+                                                  iterative_soulmates)
+        with profile.stage('solve'):
+            lines = solve(setup_data, user_preferences)
+        with profile.stage('decode'):
+            return decode(lines, part)
+
+    if len(members) < SPLIT_MIN_MEMBERS:
+        return run(list(range(len(members))))
+    components = weak_components(ranked)
+    large = batch_components([component for component in components if len(component) >= group_size],
+                             SPLIT_MIN_MEMBERS)
+    leftovers = [i for component in components if len(component) < group_size for i in component]
+
+    teams = []
+    workers = workers or getattr(settings, 'TEAM_FORMATION_WORKERS', None) or os.cpu_count() or 1
+    with ThreadPoolExecutor(max_workers=max(1, min(workers, len(large) or 1))) as pool:
+        for done, component_teams in enumerate(pool.map(run, large), 1):
+            teams.extend(component_teams)
+            if progress:
+                placed = sum(len(team) for team in teams if len(team) > 1)
+                progress.report('solve', 20 + 70 * done / (len(large) + 1), placed)
+
+    # Members who would rather be on any team get another chance with the members of the other components
+    index = {member.id: i for i, member in enumerate(members)}
+    alone = set(team[0] for team in teams if len(team) == 1 and wants_team[index[team[0]]])
+    if alone:
+        teams = [team for team in teams if not (len(team) == 1 and team[0] in alone)]
+        leftovers.extend(index[member_id] for member_id in alone)
+    if len(leftovers) > 1:
+        teams.extend(run(sorted(leftovers)))
+    else:
+        teams.extend([members[i].id] for i in leftovers)
+    return teams
+
+
+def persist(space, teams, group_size, algorithm_index, iterative_soulmates=True):
+    master_team = MasterTeam(space=space, iterative_soulmates=iterative_soulmates,
+                             number_of_members=group_size, algorithm_index=algorithm_index)
+    master_team.set_teams(teams)
+    master_team.save()
+    space.teams_decided = False
+    space.save()
+    return master_team
+
+
+# Forms one candidate MasterTeam for the space with the jar's algorithm number algorithm_index. progress, if given, is
+# a JobProgress (see main/formation/progress.py) told how many members are on teams so far
+def form_teams(space, group_size, algorithm_index, alpha, theta, iterative_soulmates=True, progress=None):
+    return run_profiled("form_teams-" + str(space.id), _form_teams, space, group_size, algorithm_index, alpha, theta,
+                        iterative_soulmates, progress)
+
+
+def _form_teams(space, group_size, algorithm_index, alpha, theta, iterative_soulmates, progress):
+    report = progress.report if progress else lambda stage, percent, best_metric=None: None
+    profile = FormationProfile()
+    profile.start()
+    try:
+        report('load', 0)
+        with profile.stage('load'):
+            members, rankings = load(space)
+        teams = []
+        jar_soulmates = iterative_soulmates
+        if iterative_soulmates and getattr(settings, 'TEAM_FORMATION_SOULMATES', 'jar') == 'python':
+            report('soulmates', 10)
+            with profile.stage('soulmates'):
+                teams, members = split_soulmates(members, rankings, group_size, soulmates_key(space, members, rankings))
+            jar_soulmates = False
+        if members:
+            report('solve', 20, sum(len(team) for team in teams))
+            teams += solve_components(members, rankings, group_size, algorithm_index, alpha, theta, jar_soulmates,
+                                      profile=profile, progress=progress)
+        report('persist', 95, sum(len(team) for team in teams if len(team) > 1))
+        with profile.stage('persist'):
+            master_team = persist(space, teams, group_size, algorithm_index, iterative_soulmates)
+    finally:
+        profile.stop()
+    profile.save([master_team])
+    return master_team
@@ -0,0 +1,110 @@
+"""
+shared.py publishes compiled arrays once as .npy files so worker processes can map them read-only instead of each
+getting their own pickled copy
+-   publish(key, arrays) writes a dict of NumPy arrays to a directory named key under settings.TEAM_FORMATION_CACHE_DIR
+    and returns that directory, which is all a worker needs to be sent. Publishing a key that already exists reuses it
+-   attach(directory) maps the arrays read-only (np.load with mmap_mode='r'), so every process attached to the same
+    directory shares the operating system's one copy of the pages
+-   shared_matrix(space) loads the partner rankings of a space and returns them as a PreferenceMatrix attached to the
+    copy published for them, compiling and publishing it only if no formation has yet. The copy is named by
+    preferences_key(), a digest of the members and rankings that were loaded, so it always matches the data the job
+    read, even if space.version moved between the request and the job
+-   Python 3.6 has no multiprocessing.shared_memory, and memory-mapped files also outlive a crashed worker, so old
+    directories are removed by prune() instead
+"""
+
+import hashlib
+import json
+import os
+import shutil
+import tempfile
+import numpy as np
+from django.conf import settings
+from main.formation.graph import csr_from_lists
+from main.formation.matrix import PreferenceMatrix, load_preferences
+
+KEEP = 16  # published directories kept by prune()
+_attached = {}  # directory -> arrays, so a worker maps each directory once
+
+
+def cache_dir():
+    directory = getattr(settings, 'TEAM_FORMATION_CACHE_DIR', None) or \
+        os.path.join(tempfile.gettempdir(), 'team-formation')
+    os.makedirs(directory, exist_ok=True)
+    return directory
+
+
+# Writes arrays to a fresh directory and renames it into place, so workers never see a half written key
+def publish(key, arrays, metadata=None):
+    directory = os.path.join(cache_dir(), key)
+    if os.path.isdir(directory):
+        return directory
+    staging = tempfile.mkdtemp(prefix='.' + key + '-', dir=cache_dir())
+    for name, array in arrays.items():
+        np.save(os.path.join(staging, name + '.npy'), np.ascontiguousarray(array))
+    with open(os.path.join(staging, 'metadata.json'), 'w') as metadata_file:
+        json.dump(metadata or {}, metadata_file)
+    try:
+        os.rename(staging, directory)
+    except OSError:  # another process published the same key first
+        shutil.rmtree(staging, ignore_errors=True)
+    return directory
+
+
+def attach(directory):
+    if directory not in _attached:
+        arrays = {}
+        for filename in os.listdir(directory):
+            if filename.endswith('.npy'):
+                arrays[filename[:-4]] = np.load(os.path.join(directory, filename), mmap_mode='r')
+        with open(os.path.join(directory, 'metadata.json')) as metadata_file:
+            arrays['metadata'] = json.load(metadata_file)
+        _attached[directory] = arrays
+    return _attached[directory]
+
+
+def remove(directory):
+    _attached.pop(directory, None)
+    shutil.rmtree(directory, ignore_errors=True)
+
+
+# Removes all but the keep most recently published directories
+def prune(keep=KEEP):
+    root = cache_dir()
+    directories = [os.path.join(root, name) for name in os.listdir(root) if not name.startswith('.')]
+    directories.sort(key=os.path.getmtime, reverse=True)
+    for directory in directories[keep:]:
+        remove(directory)
+
+
+# Names what is published for the members (ids and usernames, in order) and partner rankings a formation loaded
+def preferences_key(space_id, member_ids, usernames, rankings):
+    digest = hashlib.sha1(json.dumps([list(member_ids), list(usernames), sorted(rankings.items())]).encode('utf-8'))
+    return "space-" + str(space_id) + "-" + digest.hexdigest()[:20]
+
+
+def publish_matrix(matrix, key):
+    indptr, indices = csr_from_lists(matrix.ranked)
+    return publish(key, {'utility': matrix.utility, 'ranked_indptr': indptr, 'ranked_indices': indices,
+                         'wants_team': matrix.wants_team, 'member_ids': np.array(matrix.member_ids, dtype=np.int64)},
+                   {'usernames': matrix.usernames})
+
+
+# Returns a PreferenceMatrix whose arrays are read-only maps of the published files
+def attach_matrix(directory):
+    arrays = attach(directory)
+    indptr, indices = arrays['ranked_indptr'], arrays['ranked_indices']
+    return PreferenceMatrix.from_arrays(
+        [int(member_id) for member_id in arrays['member_ids']], arrays['metadata']['usernames'], arrays['utility'],
+        [indices[indptr[i]:indptr[i + 1]] for i in range(len(indptr) - 1)], arrays['wants_team'])
+
+
+def shared_matrix(space):
+    member_ids, usernames, rankings = load_preferences(space)
+    key = preferences_key(space.id, member_ids, usernames, rankings)
+    directory = os.path.join(cache_dir(), key)
+    if not os.path.isdir(directory):
+        directory = publish_matrix(PreferenceMatrix(member_ids, usernames, rankings), key)
+        prune()
+    return attach_matrix(directory)
+
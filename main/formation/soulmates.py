@@ -0,0 +1,128 @@
+"""
+soulmates.py finds Iterative Soulmates groups in Python instead of inside the jar
+-   A group of n members are soulmates if each of them ranks all the others within their top n-1 available choices
+-   Each round builds the mutual top-(n-1) graph (i and j are linked if each is in the other's top n-1) as CSR arrays,
+    and enumerates its n-cliques in degeneracy order. Since no member has more than n-1 links, each member is in at
+    most one clique and every clique found is a soulmates group
+-   The groups found are taken out, which changes what is "available" for everyone else, so rounds repeat until no new
+    group appears
+-   Members in different weakly connected components of the ranking graph can never affect each other, so large
+    spaces solve their components in parallel worker processes, which map the rankings published once by
+    main/formation/shared.py instead of each being sent a copy
+"""
+
+import heapq
+import os
+import uuid
+from concurrent.futures import ProcessPoolExecutor
+from main.formation.graph import csr_from_lists, neighbours, weak_components
+from main.formation.shared import attach, prune, publish, remove
+
+PARALLEL_MIN_MEMBERS = 2000  # below this, starting worker processes costs more than it saves
+
+
+def _mutual_graph(ranked, available, group_size):
+    top = {}
+    for i in available:
+        choices = [j for j in ranked[i] if j in available][:group_size - 1]
+        if len(choices) == group_size - 1:
+            top[i] = set(choices)
+    return csr_from_lists([[j for j in top[i] if j in top and i in top[j]] if i in top else []
+                           for i in range(len(ranked))])
+
+
+def _degeneracy_order(indptr, indices, vertices):
+    degree = {v: len(neighbours(indptr, indices, v)) for v in vertices}
+    heap = [(degree[v], v) for v in vertices]
+    heapq.heapify(heap)
+    order = []
+    removed = set()
+    while heap:
+        d, v = heapq.heappop(heap)
+        if v in removed or d != degree[v]:
+            continue
+        removed.add(v)
+        order.append(v)
+        for u in neighbours(indptr, indices, v):
+            u = int(u)
+            if u in degree and u not in removed:
+                degree[u] -= 1
+                heapq.heappush(heap, (degree[u], u))
+    return order
+
+
+# Returns the cliques of the given size, each found from its earliest vertex in degeneracy order
+def _cliques(indptr, indices, vertices, size):
+    order = _degeneracy_order(indptr, indices, vertices)
+    position = {v: p for p, v in enumerate(order)}
+    cliques = []
+
+    def extend(clique, candidates):
+        if len(clique) == size:
+            cliques.append(list(clique))
+            return
+        for k, v in enumerate(candidates):
+            linked = set(int(u) for u in neighbours(indptr, indices, v))
+            extend(clique + [v], [u for u in candidates[k + 1:] if u in linked])
+
+    for v in order:
+        later = sorted((int(u) for u in neighbours(indptr, indices, v) if position.get(int(u), -1) > position[v]),
+                       key=position.get)
+        if len(later) >= size - 1:
+            extend([v], later)
+    return cliques
+
+
+# ranked[i] lists the members i ranked, best first. Returns the soulmates groups as lists of member numbers
+def find_soulmates(ranked, group_size, members=None):
+    available = set(range(len(ranked)) if members is None else members)
+    groups = []
+    while len(available) >= group_size:
+        indptr, indices = _mutual_graph(ranked, available, group_size)
+        vertices = [v for v in available if indptr[v + 1] - indptr[v] == group_size - 1]
+        found = []
+        used = set()
+        for clique in _cliques(indptr, indices, vertices, group_size):
+            if not used.intersection(clique):
+                found.append(sorted(clique))
+                used.update(clique)
+        if not found:
+            break
+        groups.extend(found)
+        available -= used
+    return groups
+
+
+# Solves one component renumbered 0..len(component)-1. Workers read the rankings of the component from the arrays
+# published by find_soulmates_parallel, so only the member numbers of the component are sent to them
+def _solve_component(args):
+    directory, component, group_size = args
+    arrays = attach(directory)
+    indptr, indices = arrays['ranked_indptr'], arrays['ranked_indices']
+    local = {member: k for k, member in enumerate(component)}
+    local_ranked = [[local[j] for j in indices[indptr[member]:indptr[member + 1]].tolist() if j in local]
+                    for member in component]
+    return [[component[k] for k in group] for group in find_soulmates(local_ranked, group_size)]
+
+
+# Same as find_soulmates, but solves independent components in parallel worker processes for large spaces. The
+# rankings are published once under key (see main/formation/shared.py), or under a temporary key if none is given
+def find_soulmates_parallel(ranked, group_size, workers=None, key=None):
+    components = [component for component in weak_components(ranked) if len(component) >= group_size]
+    workers = workers or os.cpu_count() or 1
+    if len(ranked) < PARALLEL_MIN_MEMBERS or len(components) < 2 or workers == 1:
+        return find_soulmates(ranked, group_size)
+    indptr, indices = csr_from_lists(ranked)
+    directory = publish(key or "soulmates-" + uuid.uuid4().hex, {'ranked_indptr': indptr, 'ranked_indices': indices})
+    tasks = [(directory, component, group_size) for component in components]
+    groups = []
+    try:
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            for component_groups in pool.map(_solve_component, tasks, chunksize=max(1, len(tasks) // (workers * 4))):
+                groups.extend(component_groups)
+    finally:
+        if key is None:
+            remove(directory)
+        else:
+            prune()
+    return groups
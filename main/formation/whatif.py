@@ -0,0 +1,65 @@
+"""
+whatif.py lets the owner try hand edits on a candidate MasterTeam and see the welfare change right away
+-   Edits are ["move", username, team number] (team numbers start at 1, as listed in choose_teams.html) or
+    ["swap", username, username]
+-   The edits are replayed on TeamScores (main/formation/scoring.py) built from the cached preference matrix, so an
+    edit costs O(group size) and no Preferences or Team queries
+-   Nothing is saved unless the owner asks for it, in which case the edited teams become a new candidate MasterTeam
+"""
+
+from main.formation.matrix import cached_matrix
+from main.formation.scoring import TeamScores
+from main.models import MasterTeam
+
+EDITED_ALGORITHM_INDEX = 4
+
+
+class EditError(ValueError):
+    pass
+
+
+def apply_edits(master_team, edits):
+    matrix = cached_matrix(master_team.space)
+    # teams whose members all left the space are kept, so the numbers match the rosters listed in choose_teams.html
+    scores = TeamScores(matrix.utility, matrix.teams_from_ids(master_team.team_member_ids(), keep_empty=True),
+                        capacity=master_team.number_of_members)
+    baseline = scores.metrics()
+    user_to_index = {username: i for i, username in enumerate(matrix.usernames)}
+
+    if not isinstance(edits, list):
+        raise EditError("The edits must be a list of moves and swaps.")
+    for number, edit in enumerate(edits, 1):
+        if not isinstance(edit, (list, tuple)) or len(edit) != 3 or edit[0] not in ("move", "swap") \
+                or not isinstance(edit[1], str) or (edit[0] == "swap" and not isinstance(edit[2], str)):
+            raise EditError("Edit " + str(number) + " is not a move or a swap.")
+        if edit[1] not in user_to_index:
+            raise EditError(str(edit[1]) + " is not a member of " + master_team.space.name + ".")
+        i = user_to_index[edit[1]]
+        if edit[0] == "move":
+            try:
+                team = int(edit[2]) - 1
+            except (TypeError, ValueError):
+                team = -1
+            if team < 0 or team >= len(scores.size):
+                raise EditError("There is no team " + str(edit[2]) + ".")
+            if scores.team_of[i] != team and scores.size[team] >= scores.capacity:
+                raise EditError("Team " + str(edit[2]) + " already has " + str(scores.capacity) + " members.")
+            scores.move(i, team)
+        else:
+            if edit[2] not in user_to_index:
+                raise EditError(str(edit[2]) + " is not a member of " + master_team.space.name + ".")
+            scores.swap(i, user_to_index[edit[2]])
+    return matrix, scores, baseline
+
+
+# Team rosters as usernames, keeping empty teams so team numbers do not shift while editing
+def rosters(matrix, scores):
+    return [[matrix.usernames[i] for i in scores.teammates(t)] for t in range(len(scores.size))]
+
+
+def save_edits(master_team, matrix, scores):
+    edited = MasterTeam(space=master_team.space, number_of_members=master_team.number_of_members,
+                        iterative_soulmates=master_team.iterative_soulmates, algorithm_index=EDITED_ALGORITHM_INDEX)
+    edited.set_teams(matrix.teams_to_ids(scores.teams()))
+    edited.save()
+    return edited
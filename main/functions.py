@@ -2,7 +2,9 @@
 functions.py are the helper functions that contain code mostly used by main/views.py
 """
 
-from main.models import Member, Team
+from main.models import Member, Team, Preferences, TeamProject
+from main.pagination import keyset_page
+from django.db.models import Q
 from django.core.mail import send_mail, EmailMessage
 import csv
 import io
@@ -21,6 +23,63 @@ def get_user(request):
     return member
 
 
+# Pairs each participant of a space with their partner preferences as names, used by the members list of space.html
+def participants_with_preferences(space, participants):
+    preferences = {preference.member_id: preference for preference in Preferences.objects.filter(space=space)}
+    ranked_usernames = set()
+    for preference in preferences.values():
+        ranked_usernames.update(preference.members_ranking.split(" "))
+    ranked_usernames = sorted(ranked_usernames)
+    names = {}
+    for start in range(0, len(ranked_usernames), 500):  # keeps each IN list under SQLite's variable limit
+        chunk = ranked_usernames[start:start + 500]
+        names.update(Member.objects.filter(username__in=chunk).values_list('username', 'name'))
+    zipped = []
+    for participant in participants:
+        if participant.id in preferences:
+            prefs = preferences[participant.id].preferences_as_names(names)
+        else:
+            prefs = "No partner preferences submitted"
+        zipped.append((participant, prefs))
+    return zipped
+
+
+# Returns one page of the registered participants of a space (other than the one searching) whose name, any word of
+# their name, or username starts with query, ordered by name, and the cursor of the next page. The case insensitive and
+# word matches cannot use a plain index, so this scans the members of the space, which a class sized space keeps cheap
+def search_participants(space, searcher, query, cursor=None, limit=20):
+    participants = space.member_set.exclude(name='Account in Progress').exclude(pk=searcher.pk)
+    query = query.strip()
+    if query:
+        participants = participants.filter(Q(name__istartswith=query) | Q(name__icontains=' ' + query) |
+                                           Q(username__istartswith=query))
+    return keyset_page(participants.values('id', 'name', 'username'), ('name', 'id'), cursor, limit)
+
+
+# Turns the ranking submitted by rankpreferences.html (member ids, "@myself@" and "@team@") into the members_ranking
+# string of Preferences. Ids of members outside the space are left out
+def ranking_from_ids(space, tokens):
+    ids = [int(token) for token in tokens if str(token).isdigit()]
+    usernames = dict(space.member_set.filter(pk__in=ids).values_list('id', 'username'))
+    ranking = ""
+    for token in tokens:
+        if token in ("@myself@", "@team@"):
+            ranking += token + " "
+        elif str(token).isdigit() and int(token) in usernames:
+            ranking += usernames[int(token)] + " "
+    return ranking
+
+
+# Pairs each team with its own project assignments for view_assignments.html, so the template does not have to compare
+# every assignment against every team
+def team_assignments(space, teams):
+    assignments_by_team = {}
+    assignments = TeamProject.objects.filter(space=space).select_related('team', 'project', 'representative')
+    for assignment in assignments:
+        assignments_by_team.setdefault(assignment.team_id, []).append(assignment)
+    return [(team, assignments_by_team.get(team.id, [])) for team in teams]
+
+
 def send_new_space_email(owner, space, email, already_registered):
     sender_email = 'teamformation.notify@gmail.com'
     if already_registered:
@@ -43,7 +102,7 @@ def send_owner_spreadsheet(master_teams, space):
     owner = Member.objects.get(username=space.teacher)
     csvfile = io.StringIO()
     writer = csv.writer(csvfile)
-    teams = Team.objects.filter(master=master_teams)
+    teams = Team.objects.filter(master=master_teams).with_rosters()
     number_of_members = master_teams.number_of_members
 
     # determining head row based on how many members a team can have (2 is default option)
@@ -62,7 +121,7 @@ def send_owner_spreadsheet(master_teams, space):
     team_number = 1
     for team in teams:
         row_data = str(team_number) + ","
-        members = Member.objects.filter(teams=team)
+        members = team.member_set.all()
         for member in members:
             row_data += member.name + ","
         row_data = row_data[0:-1] # remove the extra "," at the end
@@ -0,0 +1,213 @@
+"""
+loadtest.py simulates a class submitting their preferences right before a deadline, to measure how many students the
+site can take at once. It is run with the load_test management command
+-   prepare_space() makes (or reuses) a space with an owner, a project and the given number of students, all with the
+    same password
+-   Each simulated student logs in, opens the space, opens the rank page (which loads the first page of participants
+    from the search endpoint) and saves a peer ranking of member ids the same way rankpreferences.html does, and the
+    time of every step is recorded
+-   By default the requests go straight to the WSGI app in this process through django.test.Client, one thread per
+    concurrent student. With a base url they go over HTTP to a running server instead (manage.py runserver, gunicorn)
+-   The database under test is whatever DATABASES['default'] points at, so setting DATABASE_URL to a local Postgres
+    runs the same flows against Postgres
+-   Lock contention is reported as the requests that failed because the database was locked (SQLite) or deadlocked,
+    and on Postgres as the number of lock requests waiting in pg_locks, sampled while the test runs
+"""
+
+import http.cookiejar
+import json
+import threading
+import time
+import urllib.error
+import urllib.parse
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+from django.contrib.auth.models import User
+from django.db import connection, connections
+from django.test import Client
+from main.models import Member, Project, Space
+
+STEPS = ('login', 'space', 'rank', 'save')
+LOCK_ERRORS = ('database is locked', 'deadlock detected', 'could not obtain lock', 'lock timeout')
+
+
+def prepare_space(url, students, password):
+    owner_username = url[:11] + "owner"
+    space, created = Space.objects.get_or_create(url=url, defaults={'name': url, 'teacher': owner_username,
+                                                                    'description': "Load test space",
+                                                                    'password': password})
+    Project.objects.get_or_create(space=space, name="Load Test Project", defaults={'url': "Load_Test_Project"})
+    usernames = []
+    for number in range(students + 1):
+        username = owner_username if number == students else url[:11] + str(number)
+        if not User.objects.filter(username=username).exists():
+            User.objects.create_user(username, password=password)
+        member, created = Member.objects.get_or_create(username=username,
+                                                       defaults={'name': "Student " + str(number),
+                                                                 'owner': number == students})
+        if number < students:
+            member.spaces.add(space)
+            usernames.append(username)
+    return space, usernames
+
+
+# Keeps urllib from following redirects, so both clients report the 302 a successful login returns
+class NoRedirects(urllib.request.HTTPRedirectHandler):
+
+    def redirect_request(self, req, fp, code, msg, headers, newurl):
+        return None
+
+
+# Sends requests over HTTP to a running server, keeping cookies and the csrf token like a browser would
+class LiveClient(object):
+
+    def __init__(self, base_url):
+        self.base_url = base_url.rstrip('/')
+        self.cookies = http.cookiejar.CookieJar()
+        self.opener = urllib.request.build_opener(urllib.request.HTTPCookieProcessor(self.cookies), NoRedirects)
+
+    def csrf_token(self):
+        for cookie in self.cookies:
+            if cookie.name == 'csrftoken':
+                return cookie.value
+        return ''
+
+    def request(self, path, data=None, ajax=False):
+        headers = {'X-Requested-With': 'XMLHttpRequest'} if ajax else {}
+        if data is not None:
+            data = urllib.parse.urlencode(dict(data, csrfmiddlewaretoken=self.csrf_token())).encode('utf-8')
+            headers.update({'X-CSRFToken': self.csrf_token(), 'Referer': self.base_url + path})
+        request = urllib.request.Request(self.base_url + path, data=data, headers=headers)
+        try:
+            with self.opener.open(request) as response:
+                return response.status
+        except urllib.error.HTTPError as error:
+            return error.code
+
+    def get(self, path):
+        return self.request(path)
+
+    def post(self, path, data, ajax=False):
+        return self.request(path, data, ajax)
+
+
+# Gives the test client the same interface as LiveClient
+class InProcessClient(object):
+
+    def __init__(self):
+        self.client = Client()
+
+    def get(self, path):
+        return self.client.get(path).status_code
+
+    def post(self, path, data, ajax=False):
+        headers = {'HTTP_X_REQUESTED_WITH': 'XMLHttpRequest'} if ajax else {}
+        return self.client.post(path, data, **headers).status_code
+
+
+# Runs the login -> space -> rank -> save flow for one student and returns the seconds each step took and the error
+# that stopped it, if any
+def student_flow(client, space, username, password, classmate_ids):
+    rank_url = '/' + space.url + '/' + username + '/rank/'
+    ranking = json.dumps(list(classmate_ids) + ["@team@"])
+
+    def rank():
+        status = client.get(rank_url)
+        # rankpreferences.html loads the first page of participants as soon as it opens
+        return client.get('/' + space.url + '/participants/') if status == 200 else status
+
+    def login():
+        client.get('/login/')  # sets the csrf cookie
+        return client.post('/login/', {'username': username, 'password': password})
+
+    # a successful login redirects, a failed one shows the login page again
+    steps = (
+        ('login', 302, login),
+        ('space', 200, lambda: client.get('/space/' + space.url + '/')),
+        ('rank', 200, rank),
+        ('save', 200, lambda: client.post(rank_url, {'category': 'peer', 'peer_ids': ranking}, ajax=True)),
+    )
+    timings = {}
+    for name, expected, step in steps:
+        started = time.perf_counter()
+        try:
+            status = step()
+        except Exception as error:
+            return timings, name + ": " + str(error)
+        timings[name] = time.perf_counter() - started
+        if status != expected:
+            return timings, name + ": HTTP " + str(status)
+    return timings, None
+
+
+# Samples how many lock requests are waiting on Postgres until stop is set
+def sample_lock_waits(stop, samples, interval=0.1):
+    with connections['default'].cursor() as cursor:
+        while not stop.is_set():
+            cursor.execute("SELECT count(*) FROM pg_locks WHERE NOT granted")
+            samples.append(cursor.fetchone()[0])
+            stop.wait(interval)
+    connections['default'].close()
+
+
+def percentile(values, fraction):
+    if not values:
+        return 0.0
+    values = sorted(values)
+    return values[min(len(values) - 1, int(round(fraction * (len(values) - 1))))]
+
+
+# Runs every student's flow with concurrency students at a time and returns the report
+def run_load_test(space, usernames, password, concurrency, base_url=None, ramp=0.0):
+    timings = {name: [] for name in STEPS}
+    errors = []
+    lock_samples = []
+    stop = threading.Event()
+    sampler = None
+    if connection.vendor == 'postgresql':
+        sampler = threading.Thread(target=sample_lock_waits, args=(stop, lock_samples), daemon=True)
+        sampler.start()
+
+    member_ids = dict(Member.objects.filter(username__in=usernames).values_list('username', 'id'))
+
+    def simulate(number):
+        if ramp:
+            time.sleep(ramp * number / len(usernames))
+        client = LiveClient(base_url) if base_url else InProcessClient()
+        username = usernames[number]
+        classmates = [member_ids[usernames[(number + offset) % len(usernames)]] for offset in (1, 2, 3)
+                      if (number + offset) % len(usernames) != number]
+        try:
+            return student_flow(client, space, username, password, classmates)
+        finally:
+            if not base_url:
+                connection.close()  # each thread has its own connection to the database under test
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        for student_timings, error in pool.map(simulate, range(len(usernames))):
+            for name, seconds in student_timings.items():
+                timings[name].append(seconds)
+            if error:
+                errors.append(error)
+    elapsed = time.perf_counter() - started
+    stop.set()
+    if sampler:
+        sampler.join()
+
+    requests = sum(len(values) for values in timings.values())
+    return {
+        'database': connection.vendor,
+        'students': len(usernames),
+        'concurrency': concurrency,
+        'seconds': elapsed,
+        'requests': requests,
+        'throughput': requests / elapsed if elapsed else 0.0,
+        'steps': {name: {'count': len(values), 'p50': percentile(values, 0.5), 'p90': percentile(values, 0.9),
+                         'p99': percentile(values, 0.99), 'max': max(values) if values else 0.0}
+                  for name, values in timings.items()},
+        'errors': errors,
+        'lock_errors': sum(1 for error in errors if any(lock in error.lower() for lock in LOCK_ERRORS)),
+        'lock_waits': {'max': max(lock_samples), 'mean': sum(lock_samples) / len(lock_samples)}
+        if lock_samples else None,
+    }
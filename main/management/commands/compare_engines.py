@@ -0,0 +1,58 @@
+import json
+from django.core.management.base import BaseCommand, CommandError
+from main.formation.differential import ENGINES, SIZES, compare
+from main.formation.jar import JarError
+
+
+def _format(value, pattern):
+    return "-" if value is None else pattern % value
+
+
+class Command(BaseCommand):
+    help = "Runs random preferences through the jar and an in-process engine (see main/formation/differential.py), " \
+           "and reports whether they agree and how their time and memory compare for each instance size"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--engine', default='rsd', choices=ENGINES,
+                            help="rsd must form the same teams as the jar, montecarlo must do at least as well")
+        parser.add_argument('--sizes', type=int, nargs='+', default=list(SIZES), help="Numbers of members to try")
+        parser.add_argument('--trials', type=int, default=3, help="Random instances of each size")
+        parser.add_argument('--group-size', type=int, default=2, choices=[2, 3, 4, 5])
+        parser.add_argument('--orderings', type=int, default=1000, help="Orderings tried by the montecarlo engine")
+        parser.add_argument('--seed', type=int, default=0)
+        parser.add_argument('--no-jar', action='store_true', help="Only time the engine")
+        parser.add_argument('--json', help="Also write the full report, with every run, to this file")
+
+    def handle(self, *args, **options):
+        if options['trials'] < 1 or min(options['sizes']) < 2:
+            raise CommandError("Use at least 1 trial and 2 members.")
+        try:
+            report = compare(options['sizes'], options['trials'], options['group_size'], options['engine'],
+                             options['orderings'], options['seed'], not options['no_jar'])
+        except JarError as error:
+            raise CommandError(str(error))
+
+        self.stdout.write("Engine: " + report['engine'] + ", group size " + str(report['group_size']) + ", jar: " +
+                          report['jar'])
+        self.stdout.write("%7s %5s %9s %9s %8s %10s %10s %6s %8s %10s %10s" % (
+            'members', 'runs', 'jar ms', 'engine ms', 'speedup', 'jar wel', 'engine wel', 'same', 'not wrs',
+            'jar KB', 'engine KB'))
+        for size in report['sizes']:
+            self.stdout.write("%7d %5d %9s %9s %8s %10s %10s %6s %8s %10s %10s" % (
+                size['members'], size['runs'], _format(size['jar_seconds'] and size['jar_seconds'] * 1000, "%.1f"),
+                _format(size['engine_seconds'] * 1000, "%.1f"), _format(size['speedup'], "%.1fx"),
+                _format(size['jar_welfare'], "%.2f"), _format(size['engine_welfare'], "%.2f"),
+                _format(size['same_partitions'], "%d"), _format(size['engine_not_worse'], "%d"),
+                _format(size['jar_peak_kb'], "%d"), _format(size['engine_peak_kb'], "%d")))
+        if options['json']:
+            with open(options['json'], 'w') as output:
+                json.dump(report, output, indent=2)
+            self.stdout.write("Wrote the full report to " + options['json'])
+
+        compared = [row for row in report['runs'] if row['same_partition'] is not None]
+        if report['engine'] == 'rsd':
+            differing = [row for row in compared if not row['same_partition']]
+        else:
+            differing = [row for row in compared if row['engine_welfare'] < row['jar_welfare'] - 1e-9]
+        if differing:
+            raise CommandError(str(len(differing)) + " of " + str(len(compared)) + " instances did not match the jar.")
@@ -0,0 +1,84 @@
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from main.formation.montecarlo import form_monte_carlo_teams, MONTE_CARLO_ALGORITHM_INDEX, ORDERINGS
+from main.formation.joint import form_joint_teams, JOINT_ALGORITHM_INDEX, PROJECT_WEIGHT
+from main.formation.service import form_teams
+from main.models import Space
+
+
+class Command(BaseCommand):
+    help = "Forms a candidate MasterTeam for many spaces at once, the same way the Form Teams page does for one space"
+
+    def add_arguments(self, parser):
+        parser.add_argument('space_urls', nargs='*', help="Urls of the spaces to form teams for")
+        parser.add_argument('--all', action='store_true', help="Form teams for every space")
+        parser.add_argument('--teacher', help="Only spaces owned by this username")
+        parser.add_argument('--undecided', action='store_true', help="Skip spaces whose teams are already finalized")
+        parser.add_argument('--group-size', type=int, default=2, choices=[2, 3, 4, 5])
+        parser.add_argument('--algorithm', type=int, default=0, choices=[0, 1, 2, MONTE_CARLO_ALGORITHM_INDEX,
+                                                                     JOINT_ALGORITHM_INDEX],
+                            help="0 = Random Serial Dictatorship, 1 = Heuristic, 2 = Rotational Proposer Mechanism, "
+                                 "5 = Monte Carlo Random Serial Dictatorship, 6 = Joint Teams and Projects")
+        parser.add_argument('--orderings', type=int, default=ORDERINGS,
+                            help="Orderings tried by Monte Carlo Random Serial Dictatorship")
+        parser.add_argument('--pareto', action='store_true',
+                            help="Keep every Monte Carlo outcome no other beats on all metrics, not just the best")
+        parser.add_argument('--project-weight', type=float, default=PROJECT_WEIGHT,
+                            help="Weight of projects over partners (0 to 1) for Joint Teams and Projects")
+        parser.add_argument('--alpha', type=float, default=0.001)
+        parser.add_argument('--theta', type=float, default=0.0)
+        parser.add_argument('--workers', type=int, default=os.cpu_count() or 1,
+                            help="Number of formations to run at the same time")
+
+    def handle(self, *args, **options):
+        spaces = Space.objects.order_by('url')
+        if options['space_urls']:
+            spaces = spaces.filter(url__in=options['space_urls'])
+        elif not options['all'] and not options['teacher']:
+            raise CommandError("Give space urls, --teacher or --all.")
+        if options['teacher']:
+            spaces = spaces.filter(teacher=options['teacher'])
+        if options['undecided']:
+            spaces = spaces.filter(teams_decided=False)
+        spaces = list(spaces)
+        if not spaces:
+            raise CommandError("No spaces matched.")
+
+        # Each formation spends most of its time in its own java process, so threads are enough to run them in parallel
+        started = time.time()
+        failures = 0
+        with ThreadPoolExecutor(max_workers=max(1, options['workers'])) as pool:
+            futures = {pool.submit(self.form, space, options): space for space in spaces}
+            for count, future in enumerate(as_completed(futures), 1):
+                space = futures[future]
+                prefix = "[" + str(count) + "/" + str(len(spaces)) + "] " + space.url + ": "
+                try:
+                    teams, seconds = future.result()
+                except Exception as error:
+                    failures += 1
+                    self.stderr.write(prefix + "failed (" + str(error) + ")")
+                    continue
+                self.stdout.write(prefix + str(teams) + " teams in " + "%.2f" % seconds + "s")
+
+        self.stdout.write("Formed teams for " + str(len(spaces) - failures) + " of " + str(len(spaces)) +
+                          " spaces in " + "%.2f" % (time.time() - started) + "s")
+        if failures:
+            raise CommandError(str(failures) + " spaces failed.")
+
+    def form(self, space, options):
+        started = time.time()
+        try:
+            if options['algorithm'] == MONTE_CARLO_ALGORITHM_INDEX:
+                master_team = form_monte_carlo_teams(space, options['group_size'], options['orderings'],
+                                                     'pareto' if options['pareto'] else 'best')
+            elif options['algorithm'] == JOINT_ALGORITHM_INDEX:
+                master_team = form_joint_teams(space, options['group_size'], options['project_weight'])
+            else:
+                master_team = form_teams(space, options['group_size'], options['algorithm'], options['alpha'],
+                                         options['theta'])
+            return len(master_team.team_member_ids()), time.time() - started
+        finally:
+            connection.close()  # each worker thread has its own database connection
@@ -0,0 +1,32 @@
+from django.core.management.base import BaseCommand, CommandError
+from main.models import Space
+from main.preference_import import import_preferences, format_for_filename
+
+
+class Command(BaseCommand):
+    help = "Imports the peer and project rankings of a space from a CSV or NDJSON file (see main/preference_import.py)"
+
+    def add_arguments(self, parser):
+        parser.add_argument('space_url')
+        parser.add_argument('path')
+        parser.add_argument('--format', choices=['csv', 'ndjson'], default=None,
+                            help="File format, guessed from the file extension if left out")
+
+    def handle(self, *args, **options):
+        try:
+            space = Space.objects.get(url=options['space_url'])
+        except Space.DoesNotExist:
+            raise CommandError("There is no space with the url " + options['space_url'])
+        file_format = options['format'] or format_for_filename(options['path'])
+
+        try:
+            with open(options['path'], encoding='utf-8-sig', newline='') as lines:
+                imported, errors = import_preferences(space, lines, file_format)
+        except UnicodeDecodeError:
+            raise CommandError(options['path'] + " is not UTF-8 text.")
+
+        if errors:
+            for error in errors:
+                self.stderr.write(error)
+            raise CommandError("No preferences were imported because of the errors above.")
+        self.stdout.write("Imported preferences for " + str(imported) + " members of " + space.name + ".")
@@ -0,0 +1,46 @@
+from django.core.management.base import BaseCommand, CommandError
+from main.loadtest import STEPS, prepare_space, run_load_test
+
+
+class Command(BaseCommand):
+    help = "Simulates students logging in, opening their space and saving their preferences all at once (see " \
+           "main/loadtest.py), and reports throughput, latency percentiles and lock contention"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--space', default='loadtest', help="Url of the space to make or reuse for the test")
+        parser.add_argument('--students', type=int, default=100)
+        parser.add_argument('--concurrency', type=int, default=20, help="Students using the site at the same time")
+        parser.add_argument('--password', default='loadtest123')
+        parser.add_argument('--ramp', type=float, default=0.0,
+                            help="Seconds over which students arrive, 0 sends them all at once")
+        parser.add_argument('--base-url', default=None,
+                            help="Send requests to a running server (like http://127.0.0.1:8000) instead of the app "
+                                 "in this process")
+
+    def handle(self, *args, **options):
+        if options['students'] < 2 or options['concurrency'] < 1:
+            raise CommandError("Use at least 2 students and a concurrency of 1.")
+        if len(options['space']) > 11:
+            raise CommandError("Space urls for load tests can have at most 11 characters, so usernames fit.")
+        space, usernames = prepare_space(options['space'], options['students'], options['password'])
+        self.stdout.write("Running " + str(len(usernames)) + " students, " + str(options['concurrency']) +
+                          " at a time, against " + (options['base_url'] or "the app in this process") + "...")
+        report = run_load_test(space, usernames, options['password'], options['concurrency'], options['base_url'],
+                               options['ramp'])
+
+        self.stdout.write("Database: " + report['database'])
+        self.stdout.write(str(report['requests']) + " flow steps in " + "%.2f" % report['seconds'] + "s (" +
+                          "%.1f" % report['throughput'] + " steps/s)")
+        self.stdout.write("%-8s %7s %9s %9s %9s %9s" % ('step', 'count', 'p50 ms', 'p90 ms', 'p99 ms', 'max ms'))
+        for name in STEPS:
+            step = report['steps'][name]
+            self.stdout.write("%-8s %7d %9.1f %9.1f %9.1f %9.1f" % (name, step['count'], step['p50'] * 1000,
+                                                                  step['p90'] * 1000, step['p99'] * 1000,
+                                                                  step['max'] * 1000))
+        self.stdout.write("Failed flows: " + str(len(report['errors'])) + ", because of database locks: " +
+                          str(report['lock_errors']))
+        for error in sorted(set(report['errors']))[:10]:
+            self.stderr.write("  " + error)
+        if report['lock_waits']:
+            self.stdout.write("Postgres lock requests waiting: max " + str(report['lock_waits']['max']) + ", mean " +
+                              "%.2f" % report['lock_waits']['mean'])
@@ -0,0 +1,20 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.11 on 2026-10-19 11:03
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('main', '0007_teamproject_representative'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='space',
+            name='version',
+            field=models.IntegerField(default=0),
+        ),
+    ]
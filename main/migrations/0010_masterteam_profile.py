@@ -0,0 +1,20 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.11 on 2026-10-19 11:19
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('main', '0009_masterteam_packed_teams'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='masterteam',
+            name='profile',
+            field=models.TextField(default=''),
+        ),
+    ]
@@ -0,0 +1,34 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.11 on 2026-10-19 11:27
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('main', '0010_masterteam_profile'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='FormationJob',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('kind', models.CharField(default='form', max_length=16)),
+                ('status', models.CharField(default='queued', max_length=8)),
+                ('stage', models.CharField(default='', max_length=16)),
+                ('percent', models.IntegerField(default=0)),
+                ('metric', models.CharField(default='', max_length=30)),
+                ('best_metric', models.FloatField(default=None, null=True)),
+                ('eta_seconds', models.FloatField(default=None, null=True)),
+                ('error', models.CharField(default='', max_length=300)),
+                ('created', models.DateTimeField(auto_now_add=True)),
+                ('updated', models.DateTimeField(auto_now=True)),
+                ('master', models.ForeignKey(default=None, null=True, on_delete=django.db.models.deletion.SET_NULL, to='main.MasterTeam')),
+                ('space', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='main.Space')),
+            ],
+        ),
+    ]
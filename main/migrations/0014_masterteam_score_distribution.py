@@ -0,0 +1,20 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.11 on 2026-10-19 11:39
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('main', '0013_preferences_updated_at'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='masterteam',
+            name='score_distribution',
+            field=models.TextField(default=''),
+        ),
+    ]
@@ -0,0 +1,26 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.11 on 2026-10-19 11:42
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('main', '0014_masterteam_score_distribution'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='teamproject',
+            name='project',
+            field=models.ForeignKey(default=None, null=True, on_delete=django.db.models.deletion.CASCADE, to='main.Project'),
+        ),
+        migrations.AlterField(
+            model_name='teamproject',
+            name='representative',
+            field=models.ForeignKey(default=None, null=True, on_delete=django.db.models.deletion.CASCADE, to='main.Member'),
+        ),
+    ]
@@ -0,0 +1,25 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.11 on 2026-10-19 11:46
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('main', '0015_teamproject_nullable'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='project',
+            name='max_teams',
+            field=models.PositiveIntegerField(default=1),
+        ),
+        migrations.AddField(
+            model_name='project',
+            name='min_teams',
+            field=models.PositiveIntegerField(default=0),
+        ),
+    ]
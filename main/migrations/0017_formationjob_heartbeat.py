@@ -0,0 +1,20 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.11 on 2026-10-19 12:21
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('main', '0016_project_capacity'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='formationjob',
+            name='heartbeat',
+            field=models.DateTimeField(default=None, null=True),
+        ),
+    ]
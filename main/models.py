@@ -6,7 +6,9 @@ Models.py explains the data for this project and is the Model part of the MVC pa
 -   Author: Joshua Stafford (joshua.o.stafford@vanderbilt.edu) Contact with any questions
 """
 
-from django.db import models
+import json
+from django.db import models, transaction
+from django.utils import timezone
 
 
 #   Spaces are virtual classrooms created by owner members and filled with non-owner members, all stored in
@@ -19,6 +21,8 @@ from django.db import models
 #       of the space to all members to be viewed
 #   -   Members and projects can be deleted from a space from the space url by the owner of the space
 #   -   To check if a member is the owner of a space, you would use member.username == space.teacher
+#   -   space.version is bumped (and space.updated_at set) whenever the space or its members, preferences, projects,
+#       teams or project assignments change, so cached fragments and the ETags of main/conditional.py can be keyed on it
 class Space(models.Model):
     name = models.CharField(max_length=16)
     teacher = models.CharField(max_length=30)  # this is the owner of the space's username
@@ -26,6 +30,18 @@ class Space(models.Model):
     password = models.CharField(max_length=16, default='')
     url = models.CharField(max_length=16, default=name)  # needed to access the space via url
     teams_decided = models.BooleanField(default=False)  # if true, the owner has already decided the teams for the space
+    version = models.IntegerField(default=0)  # bumped by main/signals.py whenever the space's content changes
+    updated_at = models.DateTimeField(default=timezone.now)  # set along with version, sent as Last-Modified
+
+    # version and updated_at are only moved forward with update() by main/signals.py. Saving an instance loaded before
+    # a bump (like the one a formation job holds for seconds) leaves them out, so it cannot rewind the version to one
+    # that already has cache entries
+    def save(self, *args, **kwargs):
+        if self.pk is not None and not self._state.adding and kwargs.get('update_fields') is None \
+                and not kwargs.get('force_insert'):
+            kwargs['update_fields'] = [field.name for field in self._meta.concrete_fields
+                                       if not field.primary_key and field.name not in ('version', 'updated_at')]
+        super(Space, self).save(*args, **kwargs)
 
     def __unicode__(self):
         return self.name
@@ -37,11 +53,19 @@ class Space(models.Model):
 #   -   MasterTeams are created by form_teams_view in main/views.py and are then compared in choose_teams.html
 #   -   When the owner of a space chooses a team in choose_teams.html, compare_teams_view will delete all the other
 #   -   MasterTeams for that space and alert the members of the space of the teams via email
+#   -   While a MasterTeam is only a candidate, its teams are kept in packed_teams as one JSON array of member ids plus
+#       the offset where each team starts. Team rows (and member.teams) are only made by materialize() once the owner
+#       finalizes the candidate, so discarded candidates never touch the Team tables
+#   -   Candidates formed together with their projects (main/formation/joint.py) also keep the project id of each team
+#       in packed_teams, and materialize() writes their TeamProject rows along with the Team rows
 class MasterTeam(models.Model):
     space = models.ForeignKey(Space)
     number_of_members = models.IntegerField(default=2)
     iterative_soulmates = models.BooleanField(default=False)
     algorithm_index = models.IntegerField(default=0)
+    packed_teams = models.TextField(default='')  # {"members": [member ids], "offsets": [start of each team, total]}
+    profile = models.TextField(default='')  # JSON list of the timed formation stages, see main/formation/profiling.py
+    score_distribution = models.TextField(default='')  # JSON, see main/formation/montecarlo.py
 
     def algorithm_type(self):
         info = ""
@@ -51,8 +75,152 @@ class MasterTeam(models.Model):
             info = "Heuristic"
         elif self.algorithm_index == 2:
             info = "Rotational Proposer Mechanism"
+        elif self.algorithm_index == 3:
+            info = "Local Search Improvement"
+        elif self.algorithm_index == 4:
+            info = "Edited by Owner"
+        elif self.algorithm_index == 5:
+            info = "Monte Carlo Random Serial Dictatorship"
+        elif self.algorithm_index == 6:
+            info = "Joint Teams and Projects"
         return info
 
+    # Returns the timed stages of the formation that made this MasterTeam, for owners to see in choose_teams.html
+    def stages(self):
+        if self.profile == '':
+            return []
+        return json.loads(self.profile)
+
+    # How the welfare of every ordering tried by a Monte Carlo formation was spread, and the scores of these teams
+    def distribution(self):
+        if self.score_distribution == '':
+            return None
+        return json.loads(self.score_distribution)
+
+    # teams is a list of lists of member ids, one list per team, and projects the project id (or None) of each team
+    def set_teams(self, teams, projects=None):
+        members = []
+        offsets = [0]
+        for team in teams:
+            members.extend(team)
+            offsets.append(len(members))
+        packed = {'members': members, 'offsets': offsets}
+        if projects is not None:
+            packed['projects'] = list(projects)
+        self.packed_teams = json.dumps(packed, separators=(',', ':'))
+        self._rosters = None
+
+    # The project id of each team, or None when the teams were formed without projects
+    def team_project_ids(self):
+        if self.packed_teams == '':
+            return None
+        return json.loads(self.packed_teams).get('projects')
+
+    # Pairs each roster with the name of its project ('' without one), for candidates formed with their projects
+    def rosters_with_projects(self):
+        project_ids = self.team_project_ids() or []
+        names = dict(Project.objects.filter(id__in=[i for i in project_ids if i]).values_list('id', 'name'))
+        return [(roster, names.get(project_ids[i], '') if i < len(project_ids) else '')
+                for i, roster in enumerate(self.rosters())]
+
+    def team_member_ids(self):
+        if self.packed_teams == '':  # teams made before candidates were packed only exist as Team rows
+            return [[member.id for member in team.member_set.all()] for team in self.team_set.all()]
+        packed = json.loads(self.packed_teams)
+        members = packed['members']
+        offsets = packed['offsets']
+        return [members[offsets[i]:offsets[i + 1]] for i in range(len(offsets) - 1)]
+
+    # Returns the teams as lists of Member objects, loading them with load_rosters() if that has not happened yet. After
+    # defer_rosters(), the first call loads the rosters of every MasterTeam in its group that still needs them
+    def rosters(self):
+        if getattr(self, '_rosters', None) is None:
+            group = getattr(self, '_roster_group', [self])
+            MasterTeam.load_rosters([master_team for master_team in group
+                                     if getattr(master_team, '_rosters', None) is None])
+        return self._rosters
+
+    # Lets several MasterTeams load their rosters together only once one of them is asked for, so a page whose roster
+    # fragments are all cached makes no roster queries at all
+    @staticmethod
+    def defer_rosters(master_teams):
+        for master_team in master_teams:
+            master_team._roster_group = master_teams
+
+    # Loads the members of every team of several MasterTeams with a single query
+    @staticmethod
+    def load_rosters(master_teams):
+        team_ids = {}
+        all_ids = set()
+        for master_team in master_teams:
+            team_ids[master_team] = master_team.team_member_ids()
+            for team in team_ids[master_team]:
+                all_ids.update(team)
+        members = Member.objects.in_bulk(all_ids)
+        for master_team in master_teams:
+            master_team._rosters = [[members[member_id] for member_id in team if member_id in members]
+                                    for team in team_ids[master_team]]
+
+    # Creates the Team rows, member.teams links and any TeamProjects of a finalized candidate in bulk
+    def materialize(self):
+        from main.signals import bump_space_version, delete_in_bulk  # main.signals imports this module
+        if self.packed_teams == '' or self.team_set.exists():
+            return
+        teams = self.team_member_ids()
+        through = Member.teams.through
+        with transaction.atomic():
+            Team.objects.bulk_create([Team(space_id=self.space_id, master=self) for team in teams])
+            team_rows = self.team_set.order_by('id')
+            through.objects.bulk_create([through(member_id=member_id, team_id=team_row.id)
+                                         for team_row, team in zip(team_rows, teams) for member_id in team])
+            project_ids = self.team_project_ids()
+            if project_ids is not None:
+                delete_in_bulk(TeamProject.objects.filter(space_id=self.space_id))
+                TeamProject.objects.bulk_create([TeamProject(space_id=self.space_id, team_id=team_row.id,
+                                                             project_id=project_id, assigned=project_id is not None)
+                                                 for team_row, project_id in zip(team_rows, project_ids)])
+            bump_space_version([self.space_id])
+
+
+#   FormationJobs follow a formation or local search running in the background, so the owner can watch its progress
+#   (formationprogress.html) instead of waiting on a hung request
+#   -   Jobs are made by start_job() in main/formation/progress.py, which also writes their progress as they run
+#   -   master is the MasterTeam the job made, once it is done
+class FormationJob(models.Model):
+    space = models.ForeignKey(Space)
+    kind = models.CharField(max_length=16, default='form')  # 'form' or 'improve'
+    status = models.CharField(max_length=8, default='queued')  # queued, running, done or failed
+    stage = models.CharField(max_length=16, default='')
+    percent = models.IntegerField(default=0)
+    metric = models.CharField(max_length=30, default='')  # what best_metric measures, like "welfare"
+    best_metric = models.FloatField(null=True, default=None)
+    eta_seconds = models.FloatField(null=True, default=None)
+    error = models.CharField(max_length=300, default='')
+    master = models.ForeignKey(MasterTeam, null=True, default=None, on_delete=models.SET_NULL)
+    created = models.DateTimeField(auto_now_add=True)
+    updated = models.DateTimeField(auto_now=True)
+    heartbeat = models.DateTimeField(null=True, default=None)  # last sign of life from the thread running the job
+
+    def finished(self):
+        return self.status in ('done', 'failed')
+
+    # What the progress endpoints send to the browser
+    def progress(self):
+        return {'status': self.status, 'stage': self.stage, 'percent': self.percent, 'metric': self.metric,
+                'best_metric': self.best_metric, 'eta_seconds': self.eta_seconds, 'error': self.error}
+
+
+#   Team rosters are read through this queryset so that listing many teams does not cost one query per team
+#   -   Team.objects.for_spaces(spaces) returns every team of the given spaces along with its members
+#   -   Any other team queryset (including member.teams) can call with_rosters() to load the members up front
+class TeamQuerySet(models.QuerySet):
+    def with_rosters(self):
+        roster = models.Prefetch('member_set', queryset=Member.objects.order_by('id'))
+        return self.select_related('space').prefetch_related(roster)
+
+    def for_spaces(self, spaces):
+        return self.filter(space__in=spaces).with_rosters()
+
 
 #   Each team object is identified by its space and it's MasterTeam
 #   -   To get the teams of a member, use member.teams
@@ -61,8 +229,10 @@ class Team(models.Model):
     space = models.ForeignKey(Space)
     master = models.ForeignKey(MasterTeam, default=None)
 
+    objects = TeamQuerySet.as_manager()
+
     def __str__(self):
-        members = Member.objects.filter(teams=self)
+        members = self.member_set.all()  # uses the prefetched roster when the team came from with_rosters()
         temp = ""
         for member in members:
             temp += member.name + ", "
@@ -79,6 +249,8 @@ class Project(models.Model):
     description = models.CharField(max_length=500)
     qualifications = models.CharField(max_length=300)
     space = models.ForeignKey(Space)  # each project is associated with one space
+    min_teams = models.PositiveIntegerField(default=0)  # staffing the assignment tries to meet first
+    max_teams = models.PositiveIntegerField(default=1)  # most teams that can work on the project
 
     def __unicode__(self):
         return self.name
@@ -118,6 +290,7 @@ class Preferences(models.Model):
     space = models.ForeignKey(Space)
     projects_ranking = models.CharField(max_length=1000, default='')
     members_ranking = models.CharField(max_length=1000, default='')
+    updated_at = models.DateTimeField(auto_now=True)  # lets the API in main/api.py send only changed preferences
 
     def __unicode__(self):
         return self.member.username + ": " + self.space.name
@@ -125,15 +298,17 @@ class Preferences(models.Model):
     def __str__(self):
         return self.member.username + ": " + self.space.name
 
-    def preferences_as_names(self):
+    # names maps usernames to names, pass it in when formatting many preferences to avoid a query per ranked member
+    def preferences_as_names(self, names=None):
         all_preferences = str(self.members_ranking)
         pref_user_names = all_preferences.split(" ")
+        if names is None:
+            names = dict(Member.objects.filter(username__in=pref_user_names).values_list('username', 'name'))
         names_string_raw = ""
         for pref_username in pref_user_names:
             if len(pref_username) >= 3:
-                if Member.objects.filter(username=pref_username).exists():
-                    preferred_user = Member.objects.get(username=pref_username)
-                    name = preferred_user.name
+                if pref_username in names:
+                    name = names[pref_username]
                 elif pref_username == "@myself@":
                     name = "Rather be by Myself"
                 elif pref_username == "@team@":
@@ -162,11 +337,13 @@ class Preferences(models.Model):
 
 
 #   This model holds the assignment of a project to a team in a space
-#   - If there are more teams than projects, the project field is defaulted to None and assigned field is set to False
-#   - The assign_teams_view in views.py assigns projects to teams based on member preferences.
+#   - If the projects have no room left for a team, the project field is defaulted to None and assigned field is set to
+#     False
+#   - The assign_*_teams_view views in views.py assign projects to teams based on member preferences, with the
+#     min-cost flow of main/formation/assignment.py
 class TeamProject(models.Model):
     space = models.ForeignKey(Space)
-    project = models.ForeignKey(Project, default=None)
+    project = models.ForeignKey(Project, null=True, default=None)
     team = models.ForeignKey(Team)
     assigned = models.BooleanField(default=False)
-    representative = models.ForeignKey(Member, default=None)
+    representative = models.ForeignKey(Member, null=True, default=None)
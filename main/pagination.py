@@ -0,0 +1,59 @@
+"""
+pagination.py pages through querysets with keyset cursors instead of OFFSET
+-   A page is the first limit rows after the cursor in the order of order_fields (which must end with a unique field,
+    like id), so every page costs the same however deep the reader goes, and rows added meanwhile are not skipped
+-   The cursor handed to the client is the order_fields values of the last row of the page, as url safe base64 JSON.
+    Dates are sent as ISO strings, which Django parses back when filtering
+-   A cursor that cannot be read raises InvalidCursor, which views answer with a 400
+"""
+
+import base64
+import binascii
+import datetime
+import json
+from django.db.models import Q
+
+
+class InvalidCursor(ValueError):
+    pass
+
+
+def encode_cursor(values):
+    values = [value.isoformat() if isinstance(value, (datetime.date, datetime.datetime)) else value
+              for value in values]
+    return base64.urlsafe_b64encode(json.dumps(values).encode('utf-8')).decode('ascii').rstrip('=')
+
+
+def decode_cursor(cursor, length):
+    try:
+        values = json.loads(base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4)).decode('utf-8'))
+    except (binascii.Error, UnicodeDecodeError, ValueError):
+        raise InvalidCursor("The cursor is not valid.")
+    if not isinstance(values, list) or len(values) != length:
+        raise InvalidCursor("The cursor is not valid.")
+    return values
+
+
+# Rows strictly after values in the order of order_fields: (a > x) or (a = x and b > y) or ...
+def _after(order_fields, values):
+    condition = Q()
+    for i, field in enumerate(order_fields):
+        step = Q(**{field + '__gt': values[i]})
+        for previous, value in zip(order_fields[:i], values[:i]):
+            step &= Q(**{previous: value})
+        condition |= step
+    return condition
+
+
+# Returns the rows of one page and the cursor of the next page (None on the last page)
+def keyset_page(queryset, order_fields, cursor=None, limit=20):
+    queryset = queryset.order_by(*order_fields)
+    if cursor:
+        queryset = queryset.filter(_after(order_fields, decode_cursor(cursor, len(order_fields))))
+    rows = list(queryset[:limit + 1])
+    if len(rows) <= limit:
+        return rows, None
+    rows = rows[:limit]
+    last = rows[-1]
+    values = [last[field] if isinstance(last, dict) else getattr(last, field) for field in order_fields]
+    return rows, encode_cursor(values)
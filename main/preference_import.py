@@ -0,0 +1,127 @@
+"""
+preference_import.py loads the rankings of a whole space at once, e.g. from an external survey
+-   Used by import_preferences_view in main/views.py and the import_preferences management command
+-   Each row names a member (username or email), the peers they want to work with in order and the projects they want
+    to work on in order. Peers can also be @myself@ or @team@, just like the rankings made in rankpreferences.html
+-   CSV rows look like:  member,peer1;peer2;@team@,Project A;Project B   (a header row starting with "member" is skipped)
+-   NDJSON rows look like:  {"member": "...", "peers": ["...", "@team@"], "projects": ["Project A", "Project B"]}
+-   Rows are parsed one line at a time and checked against members and projects loaded once up front. A member may
+    only have one row, and rankings must fit in the Preferences columns. Nothing is written unless every row is valid,
+    and then the old Preferences are removed with one DELETE and replaced with one bulk_create in a transaction
+-   Files should be decoded as utf-8-sig, since spreadsheets and survey tools often start their exports with a BOM
+"""
+
+import csv
+import json
+from django.db import transaction
+from main.models import Member, Preferences, Project
+from main.signals import bump_space_version, delete_in_bulk
+
+SPECIAL_PEERS = ("@myself@", "@team@")
+
+
+def format_for_filename(filename):
+    if filename.lower().endswith(('.ndjson', '.jsonl', '.json')):
+        return "ndjson"
+    return "csv"
+
+
+def _split(value):
+    return [item.strip() for item in value.split(';') if item.strip() != '']
+
+
+# Decodes the lines of an uploaded file. Returns (lines, None), or (None, error) naming the first line that is not
+# UTF-8 text
+def decode_upload(raw_lines):
+    lines = []
+    for line_number, raw_line in enumerate(raw_lines, 1):
+        try:
+            lines.append(raw_line.decode("utf-8-sig"))
+        except UnicodeDecodeError:
+            return None, "Line " + str(line_number) + ": is not UTF-8 text. Save the file as UTF-8 and upload it again."
+    return lines, None
+
+
+# Drops a byte order mark left at the start of the first line by a caller that decoded with plain utf-8
+def _without_bom(lines):
+    for line_number, line in enumerate(lines, 1):
+        yield line.lstrip('\ufeff') if line_number == 1 else line
+
+
+# Yields (line number, member, peers, projects) for every row of the file, as plain strings
+def parse_rows(lines, file_format):
+    lines = _without_bom(lines)
+    if file_format == "ndjson":
+        for line_number, line in enumerate(lines, 1):
+            if line.strip() == '':
+                continue
+            try:
+                row = json.loads(line)
+                yield line_number, row['member'], list(row.get('peers', [])), list(row.get('projects', []))
+            except (ValueError, KeyError, TypeError):
+                yield line_number, None, [], []
+    else:
+        for line_number, row in enumerate(csv.reader(lines), 1):
+            if not row or (line_number == 1 and row[0].strip().lower() == "member"):
+                continue
+            row = row + [''] * (3 - len(row))
+            yield line_number, row[0].strip(), _split(row[1]), _split(row[2])
+
+
+# Returns (number of preferences imported, list of error messages). Nothing is saved if there are any errors.
+def import_preferences(space, lines, file_format="csv"):
+    members = Member.objects.filter(spaces=space).exclude(name='Account in Progress')
+    by_identifier = {}
+    for member in members:
+        by_identifier[member.username.lower()] = member
+        by_identifier[member.email.lower()] = member
+    project_names = set(Project.objects.filter(space=space).values_list('name', flat=True))
+
+    rankings = {}
+    row_of = {}
+    errors = []
+    longest = {name: Preferences._meta.get_field(name).max_length for name in ('members_ranking', 'projects_ranking')}
+    for line_number, identifier, peers, projects in parse_rows(lines, file_format):
+        if identifier is None:
+            errors.append("Line " + str(line_number) + ": could not be read.")
+            continue
+        member = by_identifier.get(identifier.lower())
+        if member is None:
+            errors.append("Line " + str(line_number) + ": " + identifier + " is not a member of " + space.name + ".")
+            continue
+        if member.id in row_of:
+            errors.append("Line " + str(line_number) + ": " + identifier + " already has a row on line " +
+                          str(row_of[member.id]) + ".")
+            continue
+        row_of[member.id] = line_number
+
+        members_ranking = ""
+        for peer in peers:
+            if peer in SPECIAL_PEERS:
+                members_ranking += peer + " "
+            elif peer.lower() in by_identifier and by_identifier[peer.lower()] != member:
+                members_ranking += by_identifier[peer.lower()].username + " "
+            else:
+                errors.append("Line " + str(line_number) + ": " + peer + " cannot be ranked by " + identifier + ".")
+        for project in projects:
+            if project not in project_names:
+                errors.append("Line " + str(line_number) + ": " + project + " is not a project in " + space.name + ".")
+        projects_ranking = ", ".join(projects)
+        if len(members_ranking) > longest['members_ranking']:
+            errors.append("Line " + str(line_number) + ": the peers of " + identifier + " are longer than " +
+                          str(longest['members_ranking']) + " characters.")
+        if len(projects_ranking) > longest['projects_ranking']:
+            errors.append("Line " + str(line_number) + ": the projects of " + identifier + " are longer than " +
+                          str(longest['projects_ranking']) + " characters.")
+        rankings[member.id] = (members_ranking, projects_ranking)
+
+    if errors:
+        return 0, errors
+
+    with transaction.atomic():
+        delete_in_bulk(Preferences.objects.filter(space=space, member_id__in=list(rankings)))
+        Preferences.objects.bulk_create([Preferences(member_id=member_id, space=space, members_ranking=ranking[0],
+                                                     projects_ranking=ranking[1])
+                                         for member_id, ranking in rankings.items()], batch_size=500)
+        bump_space_version([space.id])  # neither delete_in_bulk nor bulk_create send the signals that do this
+    return len(rankings), errors
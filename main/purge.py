@@ -0,0 +1,83 @@
+"""
+purge.py deletes MasterTeams and whole spaces with a handful of set based DELETE statements
+-   Calling .delete() on a space or MasterTeam makes Django load every related Team, member.teams row, TeamProject and
+    Preferences into memory so it can cascade and send signals one row at a time
+-   The functions below instead delete each table's rows in dependency order (member.teams rows, TeamProject, Team,
+    FormationJob, MasterTeam, ...) inside one transaction, and bump space.version once since no signals are sent
+-   Pass defer=True to run the purge on a background thread after the request commits (see main/background.py)
+"""
+
+from django.db import connection, transaction
+from main.background import run_in_background
+from main.models import Space, MasterTeam, Team, Project, Member, Preferences, TeamProject, FormationJob
+from main.routing import mark_written
+from main.signals import bump_space_version
+
+
+def _table(model):
+    return connection.ops.quote_name(model._meta.db_table)
+
+
+def _column(model, field_name):
+    return connection.ops.quote_name(model._meta.get_field(field_name).column)
+
+
+def _delete(cursor, model, where, params):
+    cursor.execute("DELETE FROM " + _table(model) + " WHERE " + where, params)
+
+
+# SQL selecting the ids of the teams whose column (space or master) matches the given placeholders
+def _team_ids(column, placeholders):
+    return "SELECT id FROM " + _table(Team) + " WHERE " + _column(Team, column) + " IN (" + placeholders + ")"
+
+
+def _purge_teams(cursor, column, ids):
+    placeholders = ", ".join(["%s"] * len(ids))
+    team_ids = _team_ids(column, placeholders)
+    _delete(cursor, Member.teams.through, _column(Member.teams.through, 'team') + " IN (" + team_ids + ")", ids)
+    _delete(cursor, TeamProject, _column(TeamProject, 'team') + " IN (" + team_ids + ")", ids)
+    _delete(cursor, Team, _column(Team, column) + " IN (" + placeholders + ")", ids)
+
+
+def _purge_master_teams(master_team_ids):
+    master_team_ids = list(master_team_ids)
+    if not master_team_ids:
+        return
+    space_ids = MasterTeam.objects.filter(pk__in=master_team_ids).values_list('space_id', flat=True).distinct()
+    space_ids = list(space_ids)
+    placeholders = ", ".join(["%s"] * len(master_team_ids))
+    with transaction.atomic(), connection.cursor() as cursor:
+        _purge_teams(cursor, 'master', master_team_ids)
+        job_master = _column(FormationJob, 'master')
+        cursor.execute("UPDATE " + _table(FormationJob) + " SET " + job_master + " = NULL WHERE " + job_master +
+                       " IN (" + placeholders + ")", master_team_ids)
+        _delete(cursor, MasterTeam, "id IN (" + placeholders + ")", master_team_ids)
+        bump_space_version(space_ids)
+
+
+def _purge_space(space_id):
+    with transaction.atomic(), connection.cursor() as cursor:
+        _purge_teams(cursor, 'space', [space_id])
+        _delete(cursor, TeamProject, _column(TeamProject, 'space') + " = %s", [space_id])
+        _delete(cursor, FormationJob, _column(FormationJob, 'space') + " = %s", [space_id])
+        _delete(cursor, MasterTeam, _column(MasterTeam, 'space') + " = %s", [space_id])
+        _delete(cursor, Preferences, _column(Preferences, 'space') + " = %s", [space_id])
+        _delete(cursor, Project, _column(Project, 'space') + " = %s", [space_id])
+        _delete(cursor, Member.spaces.through, _column(Member.spaces.through, 'space') + " = %s", [space_id])
+        _delete(cursor, Space, "id = %s", [space_id])
+
+
+def purge_master_teams(master_team_ids, defer=False):
+    mark_written()
+    if defer:
+        run_in_background(_purge_master_teams, list(master_team_ids))
+    else:
+        _purge_master_teams(master_team_ids)
+
+
+def purge_space(space_id, defer=False):
+    mark_written()
+    if defer:
+        run_in_background(_purge_space, space_id)
+    else:
+        _purge_space(space_id)
@@ -0,0 +1,93 @@
+"""
+routing.py lets the read-only pages read from a replica database so they do not compete with the writes of team
+formation and assignment
+-   The replica is the 'replica' entry of settings.DATABASES, set from the REPLICA_DATABASE_URL environment variable.
+    Without one every query goes to 'default' as before
+-   ReplicaRouter sends every write to 'default'. Reads only go to the replica inside a view decorated with
+    read_from_replica, so background threads, management commands and every other view keep reading 'default'
+-   Read after write: once a request writes, the rest of its reads go to 'default', and ReplicaPinMiddleware keeps the
+    session reading 'default' for settings.REPLICA_PIN_SECONDS afterwards, so a member sees their own change even while
+    the replica has not caught up with it. Writes through a raw cursor, like those of main/purge.py, are not routed, so
+    they call mark_written() themselves
+-   To try it locally with two SQLite files, copy db.sqlite3 to replica.sqlite3 and start the server with
+    REPLICA_DATABASE_URL=sqlite:///<path to replica.sqlite3>. The test suite runs without a replica and checks the
+    routing decisions directly
+"""
+
+import threading
+import time
+from functools import wraps
+from django.conf import settings
+
+REPLICA = 'replica'
+PIN_SESSION_KEY = '_read_primary_until'
+
+_state = threading.local()  # what the request being served on this thread may read from
+
+
+def replica_configured():
+    return REPLICA in settings.DATABASES
+
+
+def _pinned(request):
+    session = getattr(request, 'session', None)
+    return session is not None and session.get(PIN_SESSION_KEY, 0) > time.time()
+
+
+# Sends the rest of this request's reads to 'default' and pins its session there. The router calls it for every ORM
+# write; code that writes through a raw cursor, which Django does not route, has to call it itself
+def mark_written():
+    _state.wrote = True
+
+
+class ReplicaRouter(object):
+
+    def db_for_read(self, model, **hints):
+        if getattr(_state, 'replica', False) and not getattr(_state, 'wrote', False) and replica_configured():
+            return REPLICA
+        return 'default'
+
+    def db_for_write(self, model, **hints):
+        mark_written()
+        return 'default'
+
+    # The replica holds the same rows as 'default', so objects read from either may be related
+    def allow_relation(self, obj1, obj2, **hints):
+        databases = ('default', REPLICA)
+        if obj1._state.db in databases and obj2._state.db in databases:
+            return True
+        return None
+
+    # Only 'default' is migrated; the replica gets the schema through replication
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        return db == 'default'
+
+
+# Reads the GET and HEAD requests of a view from the replica, unless the session has written recently
+def read_from_replica(view):
+    @wraps(view)
+    def wrapper(request, *args, **kwargs):
+        if request.method not in ('GET', 'HEAD') or _pinned(request):
+            return view(request, *args, **kwargs)
+        _state.replica = True
+        try:
+            return view(request, *args, **kwargs)
+        finally:
+            _state.replica = False
+    return wrapper
+
+
+# Clears the routing state of each request, and pins the session to 'default' after a request that wrote
+class ReplicaPinMiddleware(object):
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        _state.replica = False
+        _state.wrote = False
+        response = self.get_response(request)
+        if _state.wrote and replica_configured() and hasattr(request, 'session'):
+            request.session[PIN_SESSION_KEY] = time.time() + getattr(settings, 'REPLICA_PIN_SECONDS', 5)
+        _state.wrote = False
+        return response
@@ -0,0 +1,79 @@
+"""
+signals.py keeps Space.version and Space.updated_at up to date so pages built from a space's content can be cached
+-   Every handler below bumps the version of the space(s) whose members, preferences, projects, teams or project
+    assignments changed, or that were saved themselves
+-   The cached fragments in space.html and choose_teams.html include space.version in their key, so a bump makes the
+    next visit render fresh content and old entries simply expire. The ETags of main/conditional.py are built on it too
+-   The handlers are connected in MainConfig.ready() in main/apps.py
+-   Code replacing many rows at once (preference imports, project assignment, finalizing teams) deletes them with
+    delete_in_bulk() and bumps the version once itself, instead of once per row through post_delete
+"""
+
+from django.db.models import F
+from django.db.models.signals import post_save, post_delete, m2m_changed
+from django.utils import timezone
+from main.models import Space, MasterTeam, Team, Project, Member, Preferences, TeamProject
+
+
+def bump_space_version(space_ids):
+    space_ids = [space_id for space_id in set(space_ids) if space_id is not None]
+    if space_ids:
+        Space.objects.filter(pk__in=space_ids).update(version=F('version') + 1, updated_at=timezone.now())
+
+
+# Deletes the rows of queryset with one DELETE, where queryset.delete() would send post_delete, and so update the space
+# row, once per deleted row. Nothing cascades and no signals are sent, so it is only for models no other table points
+# at (Preferences, TeamProject), and the caller bumps the version of the space once with bump_space_version()
+def delete_in_bulk(queryset):
+    return queryset._raw_delete(queryset.db)
+
+
+# Preferences, projects, teams, project assignments and candidate teams all belong to exactly one space
+def space_content_changed(sender, instance, **kwargs):
+    bump_space_version([instance.space_id])
+
+
+# The space itself was edited (like its teams being finalized). Space.save() never writes version or updated_at, so
+# this bump is what moves them
+def space_saved(sender, instance, **kwargs):
+    bump_space_version([instance.pk])
+
+
+# A member's name or bio is shown in every space they are in
+def member_changed(sender, instance, **kwargs):
+    if instance.pk is not None:
+        bump_space_version(instance.spaces.values_list('id', flat=True))
+
+
+# Members joining or leaving a space, from either side of the relation
+def member_spaces_changed(sender, instance, action, reverse, pk_set, **kwargs):
+    if action not in ('post_add', 'post_remove', 'pre_clear'):
+        return
+    if reverse:
+        bump_space_version([instance.pk])
+    elif action == 'pre_clear':
+        bump_space_version(instance.spaces.values_list('id', flat=True))
+    else:
+        bump_space_version(pk_set)
+
+
+# Members being put on or taken off a team, from either side of the relation
+def member_teams_changed(sender, instance, action, reverse, pk_set, **kwargs):
+    if action not in ('post_add', 'post_remove', 'pre_clear'):
+        return
+    if reverse:
+        bump_space_version([instance.space_id])
+    elif action == 'pre_clear':
+        bump_space_version(instance.teams.values_list('space_id', flat=True))
+    else:
+        bump_space_version(Team.objects.filter(pk__in=pk_set).values_list('space_id', flat=True))
+
+
+def connect_signals():
+    for model in (Preferences, Project, Team, MasterTeam, TeamProject):
+        post_save.connect(space_content_changed, sender=model, dispatch_uid='space_version_save_' + model.__name__)
+        post_delete.connect(space_content_changed, sender=model, dispatch_uid='space_version_delete_' + model.__name__)
+    post_save.connect(space_saved, sender=Space, dispatch_uid='space_version_space_save')
+    post_save.connect(member_changed, sender=Member, dispatch_uid='space_version_member_save')
+    m2m_changed.connect(member_spaces_changed, sender=Member.spaces.through, dispatch_uid='space_version_member_spaces')
+    m2m_changed.connect(member_teams_changed, sender=Member.teams.through, dispatch_uid='space_version_member_teams')
@@ -1,5 +1,43 @@
-from django.test import TestCase
+import itertools
+import json
+import os
+import subprocess
+import tempfile
+import time
+import tracemalloc
+from datetime import timedelta
+from unittest import mock
+import numpy as np
+from django.core.cache import cache
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.db import connection
+from django.test import TestCase, RequestFactory
+from django.test.utils import CaptureQueriesContext
+from django.contrib.auth.models import User
+from django.utils import timezone
 from main import models
+from main.functions import team_assignments
+from main.signals import delete_in_bulk
+from main.purge import purge_master_teams, purge_space
+from main.preference_import import import_preferences
+from main import routing
+from main.routing import ReplicaRouter, ReplicaPinMiddleware, read_from_replica, PIN_SESSION_KEY
+from main.pagination import encode_cursor
+from main.loadtest import InProcessClient, percentile, prepare_space, student_flow
+from main.formation import service
+from main.formation import shared
+from main.formation.graph import csr_from_lists, weak_components
+from main.formation.matrix import PreferenceMatrix
+from main.formation.profiling import FormationProfile
+from main.formation.progress import start_job, event_stream
+from main.formation.optimize import improve, improve_master_team
+from main.formation import montecarlo
+from main.formation import differential
+from main.formation import jar
+from main.formation.joint import JointScores, form_joint_teams
+from main.formation.assignment import UNITS, assign_projects, min_cost_assignment
+from main.formation.scoring import TeamScores
+from main.formation.soulmates import find_soulmates, _solve_component
 
 # Create your tests here
 
@@ -21,3 +59,1097 @@ class TestDatabase(TestCase):
         cat = models.Space.objects.get(name="cat")
         self.assertEqual(lion.name, 'lion')
         self.assertEqual(cat.teacher, 'yo')
+
+
+class TestSpaceVersion(TestCase):
+
+    def setUp(self):
+        self.space = models.Space.objects.create(name="tiger", teacher="roar", description="fake", password="test")
+        self.member = models.Member.objects.create(name="Tony", username="tony", email="tony@test.com")
+
+    def version(self):
+        return models.Space.objects.get(pk=self.space.pk).version
+
+    def test_saving_a_stale_space_does_not_rewind_its_version(self):
+        stale = models.Space.objects.get(pk=self.space.pk)
+        self.member.spaces.add(self.space)
+        self.member.spaces.remove(self.space)
+        bumped = self.version()
+        stale.teams_decided = True
+        stale.save()
+        self.assertGreater(self.version(), bumped)
+        self.assertTrue(models.Space.objects.get(pk=self.space.pk).teams_decided)
+
+    def test_bulk_delete_costs_one_query(self):
+        self.member.spaces.add(self.space)
+        for number in range(20):
+            member = models.Member.objects.create(name="m" + str(number), username="m" + str(number))
+            models.Preferences.objects.create(member=member, space=self.space, members_ranking="tony ")
+        with self.assertNumQueries(1):
+            self.assertEqual(delete_in_bulk(models.Preferences.objects.filter(space=self.space)), 20)
+        self.assertFalse(models.Preferences.objects.exists())
+
+    def test_joining_space_bumps_version(self):
+        before = self.version()
+        self.member.spaces.add(self.space)
+        self.assertGreater(self.version(), before)
+
+    def test_preferences_bump_version(self):
+        self.member.spaces.add(self.space)
+        before = self.version()
+        preference = models.Preferences.objects.create(member=self.member, space=self.space, members_ranking="bob ")
+        self.assertGreater(self.version(), before)
+        before = self.version()
+        preference.delete()
+        self.assertGreater(self.version(), before)
+
+    def test_team_membership_bumps_version(self):
+        master_team = models.MasterTeam.objects.create(space=self.space)
+        team = models.Team.objects.create(space=self.space, master=master_team)
+        before = self.version()
+        self.member.teams.add(team)
+        self.assertGreater(self.version(), before)
+
+
+class TestTeamRosters(TestCase):
+
+    def setUp(self):
+        self.space = models.Space.objects.create(name="bear", teacher="roar", description="fake", password="test")
+        master_team = models.MasterTeam.objects.create(space=self.space)
+        for number in range(4):
+            team = models.Team.objects.create(space=self.space, master=master_team)
+            for seat in range(3):
+                username = "bear" + str(number) + str(seat)
+                member = models.Member.objects.create(name=username, username=username)
+                member.teams.add(team)
+
+    def test_for_spaces_loads_rosters_up_front(self):
+        with self.assertNumQueries(2):
+            rosters = [str(team) for team in models.Team.objects.for_spaces([self.space])]
+        self.assertEqual(len(rosters), 4)
+        self.assertEqual(rosters[0], "bear00, bear01, bear02")
+
+
+class TestTeamAssignments(TestCase):
+
+    def test_assignments_are_grouped_by_team(self):
+        space = models.Space.objects.create(name="wolf", teacher="roar", description="fake", password="test")
+        master_team = models.MasterTeam.objects.create(space=space)
+        representative = models.Member.objects.create(name="Wendy", username="wendy")
+        project = models.Project.objects.create(name="Howl", space=space)
+        teams = [models.Team.objects.create(space=space, master=master_team) for number in range(3)]
+        models.TeamProject.objects.create(space=space, project=project, team=teams[1], assigned=True,
+                                          representative=representative)
+        with self.assertNumQueries(1):
+            grouped = team_assignments(space, teams)
+            self.assertEqual(grouped[1][1][0].project.name, "Howl")
+        self.assertEqual([len(assignments) for team, assignments in grouped], [0, 1, 0])
+
+
+class TestQueryBudgets(TestCase):
+    """The pages below must not cost more queries as a space gets more members"""
+
+    owner_pages = ['/space/moth/', '/choose_teams/moth/', '/mona/teams/', '/moth/all_teams/', '/moth/view_assignments/',
+                   '/mona/preferences', '/mona/joinspace/']
+    member_pages = ['/space/moth/', '/mick0/teams/', '/mick0/preferences', '/mick0/joinspace/']
+
+    # Makes a finalized space with size members in teams of two, each with preferences and an assigned project
+    def build_space(self, size):
+        User.objects.create_user("mona", password="password123")
+        owner = models.Member.objects.create(name="Mona", username="mona", owner=True)
+        space = models.Space.objects.create(name="moth", url="moth", teacher="mona", description="fake",
+                                            password="test", teams_decided=True)
+        owner.spaces.add(space)
+        project = models.Project.objects.create(name="Lamp", url="Lamp", space=space)
+        master_team = models.MasterTeam.objects.create(space=space)
+        members = []
+        for number in range(size):
+            username = "mick" + str(number)
+            User.objects.create_user(username, password="password123")
+            member = models.Member.objects.create(name="Mick " + str(number), username=username)
+            member.spaces.add(space)
+            models.Preferences.objects.create(member=member, space=space, members_ranking="mick0 mona @team@ ",
+                                              projects_ranking="Lamp")
+            members.append(member)
+        for number in range(0, size, 2):
+            team = models.Team.objects.create(space=space, master=master_team)
+            for member in members[number:number + 2]:
+                member.teams.add(team)
+            models.TeamProject.objects.create(space=space, project=project, team=team, assigned=True,
+                                              representative=members[number])
+
+    def count_queries(self, username, pages):
+        self.client.login(username=username, password="password123")
+        counts = {}
+        for page in pages:
+            cache.clear()  # the cached fragments of space.html and choose_teams.html would hide the queries
+            with CaptureQueriesContext(connection) as queries:
+                response = self.client.get(page)
+            self.assertEqual(response.status_code, 200, page)
+            counts[page] = len(queries)
+        return counts
+
+    def test_queries_do_not_grow_with_members(self):
+        counts = []
+        for size in (2, 12):
+            self.build_space(size)
+            owner_counts = self.count_queries("mona", self.owner_pages)
+            counts.append((owner_counts, self.count_queries("mick0", self.member_pages)))
+            models.Space.objects.all().delete()
+            models.Member.objects.all().delete()
+            User.objects.all().delete()
+        self.assertEqual(counts[0], counts[1])
+
+    def test_query_budgets(self):
+        self.build_space(6)
+        # space, teams and view_assignments each spend one query on their ETag (see main/conditional.py)
+        budgets = {'/space/moth/': 15, '/choose_teams/moth/': 9, '/mona/teams/': 5, '/moth/all_teams/': 8,
+                   '/moth/view_assignments/': 8, '/mona/preferences': 7, '/mona/joinspace/': 4}
+        self.assertEqual(self.count_queries("mona", self.owner_pages), budgets)
+
+    def test_cached_rosters_are_not_loaded_again(self):
+        self.build_space(4)
+        space = models.Space.objects.get(url="moth")
+        for offset in range(2):
+            candidate = models.MasterTeam(space=space)
+            candidate.set_teams([[member.id] for member in space.member_set.all()[offset:]])
+            candidate.save()
+        self.client.login(username="mona", password="password123")
+        cache.clear()
+        with CaptureQueriesContext(connection) as cold:
+            self.client.get('/choose_teams/moth/')
+        with CaptureQueriesContext(connection) as warm:
+            self.client.get('/choose_teams/moth/')
+        roster_queries = [query['sql'] for query in cold if 'FROM "main_member" WHERE "main_member"."id" IN' in
+                          query['sql']]
+        self.assertEqual(len(roster_queries), 1)
+        self.assertFalse([query['sql'] for query in warm if query['sql'] in roster_queries])
+
+
+class TestConditionalPages(TestCase):
+
+    def setUp(self):
+        for username in ("nina", "nell"):
+            User.objects.create_user(username, password="password123")
+        self.owner = models.Member.objects.create(name="Nina", username="nina", owner=True)
+        self.student = models.Member.objects.create(name="Nell", username="nell")
+        self.space = models.Space.objects.create(name="newt", url="newt", teacher="nina", description="fake",
+                                                 password="test")
+        self.student.spaces.add(self.space)
+
+    def revalidate(self, page):
+        first = self.client.get(page)
+        self.assertEqual(first.status_code, 200)
+        return self.client.get(page, HTTP_IF_NONE_MATCH=first['ETag'])
+
+    def test_unchanged_pages_are_not_modified(self):
+        self.client.login(username="nell", password="password123")
+        for page in ('/space/newt/', '/nell/teams/', '/newt/view_assignments/'):
+            response = self.revalidate(page)
+            self.assertEqual(response.status_code, 304, page)
+            self.assertEqual(response.content, b'')
+
+    def test_changes_and_other_users_get_a_new_page(self):
+        self.client.login(username="nell", password="password123")
+        etag = self.client.get('/space/newt/')['ETag']
+        models.Project.objects.create(name="Pond", url="Pond", space=self.space)
+        self.assertEqual(self.client.get('/space/newt/', HTTP_IF_NONE_MATCH=etag).status_code, 200)
+        etag = self.client.get('/space/newt/')['ETag']
+        self.client.login(username="nina", password="password123")
+        self.assertEqual(self.client.get('/space/newt/', HTTP_IF_NONE_MATCH=etag).status_code, 200)
+
+    def test_finalizing_teams_changes_the_etag(self):
+        self.client.login(username="nell", password="password123")
+        etag = self.client.get('/nell/teams/')['ETag']
+        self.space.teams_decided = True
+        self.space.save()
+        self.assertEqual(self.client.get('/nell/teams/', HTTP_IF_NONE_MATCH=etag).status_code, 200)
+
+
+class TestParticipantSearch(TestCase):
+
+    def setUp(self):
+        User.objects.create_user("pia", password="password123")
+        self.space = models.Space.objects.create(name="puma", url="puma", teacher="pat", description="fake",
+                                                 password="test")
+        self.ids = {}
+        for name, username in (("Pia Park", "pia"), ("Paul Pine", "paul"), ("Ada Pope", "adap"), ("Bo Lee", "bolee"),
+                               ("Pam Ray", "pam")):
+            member = models.Member.objects.create(name=name, username=username)
+            member.spaces.add(self.space)
+            self.ids[username] = member.id
+        self.client.login(username="pia", password="password123")
+
+    def search(self, **params):
+        return json.loads(self.client.get('/puma/participants/', params).content.decode())
+
+    def test_prefix_search_pages_with_cursor(self):
+        first = self.search(q="p", limit=2)
+        self.assertEqual([row['username'] for row in first['results']], ["adap", "pam"])
+        second = self.search(q="p", limit=2, cursor=first['next'])
+        self.assertEqual([row['username'] for row in second['results']], ["paul"])
+        self.assertIsNone(second['next'])
+        self.assertEqual(self.search(q="bol")['results'][0]['name'], "Bo Lee")
+        self.assertEqual(self.client.get('/puma/participants/', {'cursor': "nonsense"}).status_code, 400)
+
+    def test_ranking_is_saved_by_member_id(self):
+        ranking = json.dumps([self.ids["pam"], 999999, self.ids["bolee"], "@myself@"])
+        self.client.post('/puma/pia/rank/', {'category': 'peer', 'peer_ids': ranking},
+                         HTTP_X_REQUESTED_WITH='XMLHttpRequest')
+        preference = models.Preferences.objects.get(member__username="pia", space=self.space)
+        self.assertEqual(preference.members_ranking, "pam bolee @myself@ ")
+
+
+class TestReadApi(TestCase):
+
+    def setUp(self):
+        for username in ("rita", "rob"):
+            User.objects.create_user(username, password="password123")
+        self.space = models.Space.objects.create(name="raven", url="raven", teacher="rita", description="fake",
+                                                 password="test")
+        self.members = []
+        for name, username in (("Rob Reed", "rob"), ("Ria Ross", "ria"), ("Rex Rowe", "rex")):
+            member = models.Member.objects.create(name=name, username=username)
+            member.spaces.add(self.space)
+            self.members.append(member)
+            models.Preferences.objects.create(member=member, space=self.space, members_ranking="@myself@ ")
+        self.client.login(username="rita", password="password123")
+
+    def get(self, path, **params):
+        response = self.client.get('/api/v1/' + path, params)
+        return response.status_code, json.loads(response.content.decode())
+
+    def test_members_page_with_cursor_and_fields(self):
+        status, first = self.get('spaces/raven/members/', limit=2, fields="id,username")
+        self.assertEqual(status, 200)
+        self.assertEqual(first['results'], [{'id': self.members[0].id, 'username': "rob"},
+                                            {'id': self.members[1].id, 'username': "ria"}])
+        status, second = self.get('spaces/raven/members/', limit=2, cursor=first['next'])
+        self.assertEqual([row['username'] for row in second['results']], ["rex"])
+        self.assertIsNone(second['next'])
+        self.assertEqual(self.get('spaces/raven/members/', fields="password")[0], 400)
+        self.assertEqual(self.get('spaces/raven/members/', cursor="nonsense")[0], 400)
+
+    def test_only_the_owner_can_read_a_space(self):
+        self.assertEqual([space['url'] for space in self.get('spaces/')[1]['results']], ["raven"])
+        self.client.login(username="rob", password="password123")
+        self.assertEqual(self.get('spaces/raven/preferences/')[0], 404)
+        self.assertEqual(self.get('spaces/')[1]['results'], [])
+        self.client.logout()
+        self.assertEqual(self.get('spaces/')[0], 401)
+
+    def test_etag_and_since_only_send_changes(self):
+        first = self.client.get('/api/v1/spaces/raven/preferences/')
+        self.assertEqual(self.client.get('/api/v1/spaces/raven/preferences/',
+                                         HTTP_IF_NONE_MATCH=first['ETag']).status_code, 304)
+        changes = json.loads(first.content.decode())['changes']
+        status, unchanged = self.get('spaces/raven/preferences/', since=changes)
+        self.assertTrue(unchanged['unchanged'])
+        preference = models.Preferences.objects.get(member=self.members[2])
+        preference.members_ranking = "rob @myself@ "
+        preference.save()
+        status, changed = self.get('spaces/raven/preferences/', since=changes)
+        self.assertEqual([(row['username'], row['members_ranking']) for row in changed['results']],
+                         [("rex", "rob @myself@ ")])
+        self.assertEqual(self.client.get('/api/v1/spaces/raven/preferences/',
+                                         HTTP_IF_NONE_MATCH=first['ETag']).status_code, 200)
+
+    def test_forged_since_cursors_are_rejected(self):
+        forged = [encode_cursor(values) for values in ([0, "yesterday"], [0, 5], ["1", "2026-01-01T00:00:00+00:00"],
+                                                      [0, "2026-13-45T00:00:00+00:00"], [0, "2026-01-01T00:00:00"])]
+        for since in forged + ["garbage"]:
+            self.assertEqual(self.get('spaces/', since=since)[0], 400)
+            self.assertEqual(self.get('spaces/raven/preferences/', since=since)[0], 400)
+
+    def test_teams_and_master_teams(self):
+        master = models.MasterTeam.objects.create(space=self.space)
+        master.set_teams([[self.members[0].id, self.members[1].id], [self.members[2].id]])
+        master.save()
+        team = models.Team.objects.create(space=self.space, master=master)
+        team.member_set.add(self.members[0])
+        self.assertEqual(self.get('spaces/raven/master_teams/')[1]['results'][0]['teams'],
+                         [[self.members[0].id, self.members[1].id], [self.members[2].id]])
+        self.assertEqual(self.get('spaces/raven/teams/')[1]['results'],
+                         [{'id': team.id, 'master': master.id, 'members': [self.members[0].id]}])
+
+
+class TestReplicaRouting(TestCase):
+
+    def setUp(self):
+        User.objects.create_user("rhea", password="password123")
+        self.router = ReplicaRouter()
+
+    def serve(self, view, method='get', pinned_until=0):
+        request = getattr(RequestFactory(), method)('/')
+        request.session = {PIN_SESSION_KEY: pinned_until}
+        return ReplicaPinMiddleware(read_from_replica(view))(request)
+
+    def read(self, request):
+        return self.router.db_for_read(models.Space)
+
+    def write_then_read(self, request):
+        self.router.db_for_write(models.Space)
+        return self.read(request)
+
+    @mock.patch('main.routing.replica_configured', return_value=True)
+    def test_only_decorated_reads_use_the_replica(self, configured):
+        self.assertEqual(self.serve(self.read), 'replica')
+        self.assertEqual(self.serve(self.read, 'post'), 'default')
+        self.assertEqual(self.serve(self.read, pinned_until=time.time() + 60), 'default')
+        self.assertEqual(self.serve(self.write_then_read), 'default')
+        self.assertEqual(self.read(None), 'default')
+
+    @mock.patch('main.routing.replica_configured', return_value=False)
+    def test_without_a_replica_everything_reads_default(self, configured):
+        self.assertEqual(self.serve(self.read), 'default')
+
+    @mock.patch('main.routing.replica_configured', return_value=True)
+    def test_writing_pins_the_session_to_default(self, configured):
+        self.client.post('/login/', {'username': "rhea", 'password': "password123"})
+        self.assertGreater(self.client.session[PIN_SESSION_KEY], time.time())
+
+    @mock.patch('main.routing.replica_configured', return_value=True)
+    def test_raw_purges_pin_the_session_to_default(self, configured):
+        space = models.Space.objects.create(name="ibis", teacher="rhea", description="fake", password="test")
+
+        def purge_then_read(request):
+            purge_space(space.id)
+            return self.read(request)
+        self.assertEqual(self.serve(purge_then_read), 'default')
+        self.assertFalse(models.Space.objects.filter(pk=space.pk).exists())
+
+    # Records whether each read of a request would have gone to the replica, while still reading 'default'
+    def replica_reads(self, url):
+        reads = []
+
+        def record(router, model, **hints):
+            reads.append(getattr(routing._state, 'replica', False))
+            return 'default'
+        with mock.patch.object(ReplicaRouter, 'db_for_read', autospec=True, side_effect=record):
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        return reads
+
+    def test_owner_pages_read_from_the_replica(self):
+        models.Member.objects.create(name="Rhea", username="rhea", owner=True)
+        models.Space.objects.create(name="heron", url="heron", teacher="rhea", description="fake", password="test")
+        self.client.login(username="rhea", password="password123")
+        self.assertIn(True, self.replica_reads('/heron/all_teams/'))
+        self.assertIn(True, self.replica_reads('/rhea/heron/preferences'))
+
+
+class TestLoadTest(TestCase):
+
+    def test_student_flow_saves_preferences(self):
+        space, usernames = prepare_space("mole", 3, "password123")
+        classmate_ids = [models.Member.objects.get(username=username).id for username in usernames[1:]]
+        timings, error = student_flow(InProcessClient(), space, usernames[0], "password123", classmate_ids)
+        self.assertIsNone(error)
+        self.assertEqual(sorted(timings), ['login', 'rank', 'save', 'space'])
+        preference = models.Preferences.objects.get(member__username=usernames[0], space=space)
+        self.assertEqual(preference.members_ranking, "mole1 mole2 @team@ ")
+
+    def test_percentile(self):
+        self.assertEqual(percentile([0.3, 0.1, 0.2, 0.4], 0.5), 0.3)
+        self.assertEqual(percentile([], 0.9), 0.0)
+
+
+class TestPackedMasterTeam(TestCase):
+
+    def setUp(self):
+        self.space = models.Space.objects.create(name="fox", teacher="roar", description="fake", password="test")
+        self.members = [models.Member.objects.create(name="fox" + str(number), username="fox" + str(number))
+                        for number in range(5)]
+        self.master_team = models.MasterTeam.objects.create(space=self.space, number_of_members=2)
+        ids = [member.id for member in self.members]
+        self.master_team.set_teams([ids[0:2], ids[2:4], ids[4:5]])
+        self.master_team.save()
+
+    def test_candidates_do_not_create_team_rows(self):
+        master_team = models.MasterTeam.objects.get(pk=self.master_team.pk)
+        self.assertEqual(len(master_team.team_member_ids()), 3)
+        self.assertEqual([member.name for member in master_team.rosters()[1]], ["fox2", "fox3"])
+        self.assertFalse(models.Team.objects.filter(space=self.space).exists())
+
+    def test_materialize_creates_teams_and_memberships(self):
+        self.master_team.materialize()
+        teams = models.Team.objects.filter(master=self.master_team).order_by('id')
+        self.assertEqual([str(team) for team in teams], ["fox0, fox1", "fox2, fox3", "fox4"])
+        self.assertEqual(self.members[4].teams.get().master, self.master_team)
+
+
+class TestPurge(TestCase):
+
+    def setUp(self):
+        self.space = models.Space.objects.create(name="owl", teacher="roar", description="fake", password="test")
+        self.member = models.Member.objects.create(name="Olive", username="olive")
+        self.member.spaces.add(self.space)
+        models.Preferences.objects.create(member=self.member, space=self.space, members_ranking="olive ")
+        project = models.Project.objects.create(name="Hoot", space=self.space)
+        self.master_teams = [models.MasterTeam.objects.create(space=self.space) for number in range(2)]
+        for master_team in self.master_teams:
+            team = models.Team.objects.create(space=self.space, master=master_team)
+            self.member.teams.add(team)
+            models.TeamProject.objects.create(space=self.space, project=project, team=team, assigned=True,
+                                              representative=self.member)
+
+    def test_purge_master_teams_removes_their_teams(self):
+        purge_master_teams([self.master_teams[0].id])
+        self.assertEqual(list(models.MasterTeam.objects.all()), [self.master_teams[1]])
+        self.assertEqual(self.member.teams.get().master, self.master_teams[1])
+        self.assertEqual(models.TeamProject.objects.count(), 1)
+
+    def test_purge_space_removes_everything_in_it(self):
+        purge_space(self.space.id)
+        self.assertFalse(models.Space.objects.exists())
+        for model in (models.MasterTeam, models.Team, models.TeamProject, models.Preferences, models.Project):
+            self.assertFalse(model.objects.exists())
+        self.assertFalse(self.member.spaces.exists())
+        self.assertTrue(models.Member.objects.filter(pk=self.member.pk).exists())
+
+
+class TestPreferenceImport(TestCase):
+
+    def setUp(self):
+        self.space = models.Space.objects.create(name="deer", teacher="roar", description="fake", password="test")
+        models.Project.objects.create(name="Antlers", space=self.space)
+        models.Project.objects.create(name="Hooves", space=self.space)
+        for username in ("dana", "doug", "dora"):
+            member = models.Member.objects.create(name=username, username=username, email=username + "@test.com")
+            member.spaces.add(self.space)
+
+    def test_csv_rows_replace_preferences(self):
+        lines = ["member,peers,projects", "dana,doug;@team@,Hooves;Antlers", "DORA@test.com,dana,"]
+        imported, errors = import_preferences(self.space, lines, "csv")
+        self.assertEqual((imported, errors), (2, []))
+        dana = models.Preferences.objects.get(member__username="dana")
+        self.assertEqual(dana.members_ranking, "doug @team@ ")
+        self.assertEqual(dana.projects_ranking, "Hooves, Antlers")
+        self.assertEqual(models.Preferences.objects.get(member__username="dora").members_ranking, "dana ")
+
+    def test_ndjson_with_unknown_names_saves_nothing(self):
+        lines = ['{"member": "dana", "peers": ["doug"], "projects": ["Antlers"]}',
+                 '{"member": "doug", "peers": ["nobody"], "projects": ["Tail"]}']
+        imported, errors = import_preferences(self.space, lines, "ndjson")
+        self.assertEqual(imported, 0)
+        self.assertEqual(len(errors), 2)
+        self.assertFalse(models.Preferences.objects.exists())
+
+    def test_bom_duplicates_and_oversized_rankings(self):
+        lines = ["\ufeffmember,peers,projects", "dana,doug,Hooves", "doug,dana,", "DANA@test.com,dora,"]
+        imported, errors = import_preferences(self.space, lines, "csv")
+        self.assertEqual(errors, ["Line 4: DANA@test.com already has a row on line 2."])
+        imported, errors = import_preferences(self.space, lines[:3], "csv")
+        self.assertEqual((imported, errors), (2, []))
+        oversized = ";".join(["@team@"] * 200)
+        imported, errors = import_preferences(self.space, ["dora," + oversized + ","], "csv")
+        self.assertEqual(errors, ["Line 1: the peers of dora are longer than 1000 characters."])
+
+    def test_upload_with_a_bom_is_read(self):
+        User.objects.create_user("roar", password="password123")
+        models.Member.objects.create(name="Roar", username="roar", owner=True)
+        self.space.url = "deer"
+        self.space.save()
+        self.client.login(username="roar", password="password123")
+        upload = SimpleUploadedFile("survey.csv", "member,peers,projects\ndana,doug,Hooves\n".encode("utf-8-sig"))
+        self.client.post('/deer/import_preferences/', {'preferences_file': upload})
+        self.assertEqual(models.Preferences.objects.get(member__username="dana").members_ranking, "doug ")
+        latin = SimpleUploadedFile("survey.csv", "member,peers\ndora,dana\ndoug,Ren\u00e9e\n".encode("latin-1"))
+        response = self.client.post('/deer/import_preferences/', {'preferences_file': latin})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.context['errors'][0][:7], "Line 3:")
+        self.assertEqual(self.client.post('/deer/import_preferences/', {}).status_code, 200)
+
+    def test_reimport_deletes_in_one_query(self):
+        lines = ["dana,doug,Hooves", "doug,dana,", "dora,dana,"]
+        import_preferences(self.space, lines, "csv")
+        with CaptureQueriesContext(connection) as queries:
+            self.assertEqual(import_preferences(self.space, lines, "csv"), (3, []))
+        self.assertEqual(len([query for query in queries if query['sql'].startswith('DELETE')]), 1)
+        self.assertEqual(len([query for query in queries if query['sql'].startswith('UPDATE')]), 1)
+
+
+class TestFormationProtocol(TestCase):
+
+    def setUp(self):
+        self.space = models.Space.objects.create(name="hawk", teacher="roar", description="fake", password="test")
+        for username in ("hank", "hope", "hugo"):
+            member = models.Member.objects.create(name=username, username=username)
+            member.spaces.add(self.space)
+        hank = models.Member.objects.get(username="hank")
+        models.Preferences.objects.create(member=hank, space=self.space, members_ranking="hugo @team@ ")
+
+    def test_encode_marks_rankings_and_any_team(self):
+        members, rankings = service.load(self.space)
+        setup_data, user_preferences = service.encode(members, rankings, 2, 1, 0.001, 0.5)
+        self.assertEqual(setup_data, "3 2 1 1 1000 50")
+        tokens = user_preferences.split()
+        ranks = {tokens[i]: tokens[i + 1] for i in range(len(tokens)) if tokens[i] in ("hank", "hope", "hugo")}
+        hank = tokens.index("hank")
+        self.assertEqual(tokens[hank + 2:hank + 4], ["team", ranks["hugo"]])
+        self.assertEqual(tokens[tokens.index("hope") + 2], "alone")
+
+    def test_decode_reads_teams_and_solos(self):
+        members, rankings = service.load(self.space)
+        ids = {member.username: member.id for member in members}
+        teams = service.decode(["T: hank hugo \n", "S: hope\n", "done\n"], members)
+        self.assertEqual(teams, [[ids["hank"], ids["hugo"]], [ids["hope"]]])
+
+
+class TestComponentFormation(TestCase):
+
+    def setUp(self):
+        self.space = models.Space.objects.create(name="wolf", teacher="roar", description="fake", password="test")
+        self.members = []
+        for username in ("wade", "will", "wren", "wyatt"):
+            member = models.Member.objects.create(name=username, username=username)
+            member.spaces.add(self.space)
+            self.members.append(member)
+        rankings = (("wade", "will "), ("will", "wade "), ("wren", "@team@ "), ("wyatt", "@team@ "))
+        for username, ranking in rankings:
+            models.Preferences.objects.create(member=models.Member.objects.get(username=username), space=self.space,
+                                              members_ranking=ranking)
+
+    # Stands in for the jar by putting everyone it is given on one team
+    @staticmethod
+    def fake_solve(setup_data, user_preferences):
+        usernames = [token for token in user_preferences.split() if token.isalpha() and token not in ("team", "alone")]
+        return ["T: " + " ".join(usernames) + "\n"]
+
+    def test_small_spaces_run_one_jar(self):
+        members, rankings = service.load(self.space)
+        with mock.patch.object(service, 'solve', side_effect=self.fake_solve) as solve:
+            teams = service.solve_components(members, rankings, 2, 0, 0.001, 0.0, workers=2)
+        self.assertEqual(solve.call_count, 1)
+        self.assertEqual(len(teams), 1)
+
+    def test_components_are_batched(self):
+        self.assertEqual(service.batch_components([[0, 1], [2, 3, 4], [5, 6], [7, 8]], 4),
+                         [[0, 1, 2, 3, 4], [5, 6, 7, 8]])
+        self.assertEqual(service.batch_components([[0, 1], [2, 3, 4], [5]], 4), [[0, 1, 2, 3, 4, 5]])
+        self.assertEqual(service.batch_components([[0, 1]], 4), [[0, 1]])
+
+    @mock.patch.object(service, 'SPLIT_MIN_MEMBERS', 2)
+    def test_components_and_leftovers_are_solved_separately(self):
+        members, rankings = service.load(self.space)
+        with mock.patch.object(service, 'solve', side_effect=self.fake_solve) as solve:
+            teams = service.solve_components(members, rankings, 2, 0, 0.001, 0.0, workers=2)
+        self.assertEqual(solve.call_count, 2)
+        ids = {member.username: member.id for member in self.members}
+        self.assertEqual(sorted(sorted(team) for team in teams),
+                         sorted([sorted([ids["wade"], ids["will"]]), sorted([ids["wren"], ids["wyatt"]])]))
+
+    @mock.patch.object(service, 'SPLIT_MIN_MEMBERS', 2)
+    def test_form_teams_saves_stage_timings(self):
+        with mock.patch.object(service, 'solve', side_effect=self.fake_solve):
+            master_team = service.form_teams(self.space, 2, 0, 0.001, 0.0, iterative_soulmates=False)
+        stages = models.MasterTeam.objects.get(pk=master_team.pk).stages()
+        self.assertEqual([stage['name'] for stage in stages], ['load', 'encode', 'solve', 'decode', 'persist'])
+        self.assertEqual(stages[1]['runs'], 2)
+
+
+class TestFormationProfile(TestCase):
+
+    def test_overlapping_profiles_share_tracing(self):
+        first = FormationProfile(trace_memory=True)
+        second = FormationProfile(trace_memory=True)
+        first.start()
+        second.start()
+        first.stop()
+        self.assertTrue(tracemalloc.is_tracing())
+        with second.stage('solve'):
+            list(range(100000))
+        self.assertIsNotNone(second.stages['solve']['peak_kb'])
+        second.stop()
+        self.assertFalse(tracemalloc.is_tracing())
+
+    def test_tracing_started_elsewhere_is_left_running(self):
+        tracemalloc.start()
+        try:
+            profile = FormationProfile(trace_memory=True)
+            profile.start()
+            profile.stop()
+            self.assertTrue(tracemalloc.is_tracing())
+        finally:
+            tracemalloc.stop()
+
+
+    def test_saving_does_not_bump_the_space_version(self):
+        space = models.Space.objects.create(name="kite", teacher="roar", description="fake", password="test")
+        master_teams = [models.MasterTeam.objects.create(space=space) for i in range(2)]
+        version = models.Space.objects.get(pk=space.pk).version
+        profile = FormationProfile(trace_memory=False)
+        with profile.stage('solve'):
+            pass
+        with self.assertNumQueries(1):
+            profile.save(master_teams)
+        self.assertEqual(models.Space.objects.get(pk=space.pk).version, version)
+        self.assertEqual([json.loads(master_team.profile)[0]['name'] for master_team in
+                          models.MasterTeam.objects.filter(space=space)], ['solve', 'solve'])
+
+
+class TestFormationJobs(TestCase):
+
+    def setUp(self):
+        User.objects.create_user("olga", password="password123")
+        models.Member.objects.create(name="Olga", username="olga", owner=True)
+        self.space = models.Space.objects.create(name="orca", url="orca", teacher="olga", description="fake",
+                                                 password="test")
+
+    def make_teams(self, progress):
+        progress.report('solve', 50, 3)
+        self.assertEqual(models.FormationJob.objects.get(space=self.space).percent, 50)
+        return models.MasterTeam.objects.create(space=self.space)
+
+    def test_job_records_progress_and_result(self):
+        with self.settings(FORMATION_IN_BACKGROUND=False):
+            job = start_job(self.space, 'form', "members on teams", self.make_teams)
+        self.assertEqual((job.status, job.percent, job.best_metric), ('done', 100, 3.0))
+        self.assertEqual(job.master, models.MasterTeam.objects.get(space=self.space))
+        events = list(event_stream(job.id))
+        self.assertEqual(events[0], "retry: 2000\n\n")
+        self.assertEqual(json.loads(events[1][len("data: "):])['status'], 'done')
+
+    def test_failed_job_keeps_the_error(self):
+        def fail(progress):
+            raise ValueError("no members")
+        with self.settings(FORMATION_IN_BACKGROUND=False), self.assertRaises(ValueError):
+            start_job(self.space, 'form', "members on teams", fail)
+        job = models.FormationJob.objects.get(space=self.space)
+        self.assertEqual((job.status, job.error), ('failed', "no members"))
+
+    def test_jobs_without_a_heartbeat_are_failed(self):
+        self.client.login(username="olga", password="password123")
+        lost = models.FormationJob.objects.create(space=self.space, status='running',
+                                                  heartbeat=timezone.now() - timedelta(minutes=5))
+        alive = models.FormationJob.objects.create(space=self.space, status='running', heartbeat=timezone.now())
+        poll = self.client.get('/choose_teams/orca/progress/' + str(lost.id) + '/poll/', {'since': 0})
+        self.assertEqual(json.loads(poll.content.decode())['status'], 'failed')
+        self.assertIn("stopped working", models.FormationJob.objects.get(pk=lost.pk).error)
+        poll = self.client.get('/choose_teams/orca/progress/' + str(alive.id) + '/poll/', {'since': 0})
+        self.assertEqual(json.loads(poll.content.decode())['status'], 'running')
+
+    def test_owner_is_sent_to_progress_page(self):
+        self.client.login(username="olga", password="password123")
+        response = self.client.post('/orca/form_teams/', {'Group_Options': '2', 'optradio': '0', 'alpha': '0.001',
+                                                          'theta': '0.0'})
+        job = models.FormationJob.objects.get(space=self.space)
+        self.assertRedirects(response, '/choose_teams/orca/progress/' + str(job.id) + '/')
+        self.assertEqual(self.client.get('/choose_teams/orca/progress/' + str(job.id) + '/').status_code, 200)
+        poll = self.client.get('/choose_teams/orca/progress/' + str(job.id) + '/poll/', {'since': 0})
+        self.assertEqual(json.loads(poll.content.decode())['status'], 'queued')
+
+
+class TestSoulmates(TestCase):
+
+    def test_mutual_triangle_is_found(self):
+        # 0, 1 and 2 rank each other first and second, 3 ranks 0 but nobody ranks 3
+        ranked = [[1, 2, 3], [2, 0], [0, 1], [0, 1]]
+        self.assertEqual(find_soulmates(ranked, 3), [[0, 1, 2]])
+
+    def test_groups_are_found_iteratively(self):
+        # 0 first wants 1, who is taken by 2, so 0 and 3 only become soulmates in the second round
+        ranked = [[1, 3], [2, 0], [1], [0]]
+        self.assertEqual(find_soulmates(ranked, 2), [[1, 2], [0, 3]])
+
+    def test_components_are_solved_separately(self):
+        ranked = [[1], [0], [3], [2], []]
+        components = weak_components(ranked)
+        self.assertEqual(components, [[0, 1], [2, 3], [4]])
+        indptr, indices = csr_from_lists(ranked)
+        directory = shared.publish("test-components", {'ranked_indptr': indptr, 'ranked_indices': indices})
+        try:
+            self.assertEqual(_solve_component((directory, components[1], 2)), [[2, 3]])
+        finally:
+            shared.remove(directory)
+
+
+class TestSharedMatrix(TestCase):
+
+    def setUp(self):
+        self.space = models.Space.objects.create(name="newt", teacher="roar", description="fake", password="test")
+        for username, ranking in (("ada", "cy bo "), ("bo", "@team@ ada "), ("cy", "ada ")):
+            member = models.Member.objects.create(name=username, username=username)
+            member.spaces.add(self.space)
+            models.Preferences.objects.create(member=member, space=self.space, members_ranking=ranking)
+
+    def test_attached_matrix_is_a_read_only_copy(self):
+        matrix = PreferenceMatrix.from_space(self.space)
+        with tempfile.TemporaryDirectory() as directory, self.settings(TEAM_FORMATION_CACHE_DIR=directory):
+            published = shared.publish_matrix(matrix, "test-matrix")
+            self.assertEqual(shared.publish_matrix(matrix, "test-matrix"), published)
+            attached = shared.attach_matrix(published)
+            self.assertTrue(np.array_equal(attached.utility, matrix.utility))
+            self.assertEqual(attached.usernames, matrix.usernames)
+            self.assertEqual([list(order) for order in attached.ranked], matrix.ranked)
+            self.assertEqual(attached.welfare([[0, 2], [1]]), matrix.welfare([[0, 2], [1]]))
+            with self.assertRaises(ValueError):
+                attached.utility[0, 0] = 1.0
+            shared.remove(published)
+
+    # The copy is named after the preferences that were loaded, not the version the request saw
+    def test_formations_over_the_same_preferences_share_one_copy(self):
+        with tempfile.TemporaryDirectory() as directory, self.settings(TEAM_FORMATION_CACHE_DIR=directory), \
+                mock.patch.object(shared, 'publish_matrix', wraps=shared.publish_matrix) as publish:
+            montecarlo.form_monte_carlo_teams(self.space, 2, orderings=50, seed=1)
+            models.Space.objects.filter(pk=self.space.pk).update(version=self.space.version + 5)
+            form_joint_teams(self.space, 2, budget=0.1, seed=1)
+            self.assertEqual(publish.call_count, 1)
+            models.Preferences.objects.filter(member__username="cy").update(members_ranking="bo ")
+            montecarlo.form_monte_carlo_teams(self.space, 2, orderings=50, seed=1)
+            self.assertEqual(publish.call_count, 2)
+            for name in os.listdir(directory):
+                shared.remove(os.path.join(directory, name))
+
+
+class TestMonteCarlo(TestCase):
+
+    def setUp(self):
+        self.space = models.Space.objects.create(name="mole", url="mole", teacher="mo", description="fake",
+                                                 password="test")
+        rankings = {"ann": "bea", "bea": "cal ann", "cal": "bea", "dan": "cal @team@", "eve": "@team@"}
+        for username, ranking in rankings.items():
+            member = models.Member.objects.create(name=username, username=username)
+            member.spaces.add(self.space)
+            models.Preferences.objects.create(member=member, space=self.space, members_ranking=ranking + " ")
+        self.matrix = PreferenceMatrix.from_space(self.space)
+
+    def test_every_ordering_gives_valid_teams(self):
+        orders = np.array(list(itertools.permutations(range(len(self.matrix)))))
+        team_of = montecarlo.run_orderings(self.matrix.ranked, self.matrix.wants_team, 2, orders)
+        scores = montecarlo.score(self.matrix.utility, self.matrix.ranked, team_of)
+        for labels, welfare in zip(team_of, scores['welfare']):
+            teams = montecarlo.teams_of(labels)
+            self.assertTrue(all(len(team) <= 2 for team in teams))
+            self.assertAlmostEqual(self.matrix.welfare(teams), welfare)
+        kept, all_scores = montecarlo.best_orderings(self.matrix, 2, orderings=2000, iterative_soulmates=False, seed=3)
+        self.assertEqual(kept[0][1]['welfare'], scores['welfare'].max())
+        # dan and eve are left alone in some orderings and then grouped, since both ranked @team@
+        self.assertTrue(any(labels[self.matrix.usernames.index("dan")] == labels[self.matrix.usernames.index("eve")]
+                            for labels in team_of))
+
+    def test_saves_the_pareto_set_with_the_distribution(self):
+        best = montecarlo.form_monte_carlo_teams(self.space, 2, orderings=500, keep='pareto', seed=4)
+        saved = models.MasterTeam.objects.filter(space=self.space)
+        self.assertGreaterEqual(saved.count(), 1)
+        self.assertEqual(best.algorithm_type(), "Monte Carlo Random Serial Dictatorship")
+        distribution = best.distribution()
+        self.assertEqual(distribution['orderings'], 500)
+        self.assertEqual(sum(distribution['histogram']['counts']), 500)
+        self.assertEqual(distribution['chosen']['welfare'], distribution['percentiles']['max'])
+        self.assertTrue(all(master_team.stages() for master_team in saved))
+
+
+class TestJointFormation(TestCase):
+
+    def setUp(self):
+        self.space = models.Space.objects.create(name="lynx", url="lynx", teacher="roar", description="fake",
+                                                 password="test")
+        self.alpha = models.Project.objects.create(name="Alpha", space=self.space)
+        self.beta = models.Project.objects.create(name="Beta", space=self.space)
+        self.ids = {}
+        # lea & lou and lia & luc want each other, and each pair agrees on its favourite project
+        for username, partner, projects in (("lea", "lou", "Alpha, Beta"), ("lou", "lea", "Alpha"),
+                                            ("lia", "luc", "Beta, Alpha"), ("luc", "lia", "Beta")):
+            member = models.Member.objects.create(name=username, username=username)
+            member.spaces.add(self.space)
+            self.ids[username] = member.id
+            models.Preferences.objects.create(member=member, space=self.space, members_ranking=partner + " ",
+                                              projects_ranking=projects)
+
+    def test_finalizing_writes_teams_with_their_projects(self):
+        master_team = form_joint_teams(self.space, 2, project_weight=0.5, budget=0.2, seed=1)
+        self.assertEqual(master_team.algorithm_type(), "Joint Teams and Projects")
+        self.assertEqual(sorted((sorted(roster_ids), project) for roster_ids, project in
+                                zip(master_team.team_member_ids(), master_team.team_project_ids())),
+                         sorted([(sorted([self.ids["lea"], self.ids["lou"]]), self.alpha.id),
+                                 (sorted([self.ids["lia"], self.ids["luc"]]), self.beta.id)]))
+        master_team.materialize()
+        assignments = team_assignments(self.space, models.Team.objects.filter(space=self.space).with_rosters())
+        self.assertEqual(sorted((str(team), [a.project.name for a in project_teams])
+                                for team, project_teams in assignments),
+                         [("lea, lou", ["Alpha"]), ("lia, luc", ["Beta"])])
+
+    def test_project_capacities_are_respected(self):
+        models.Preferences.objects.filter(space=self.space).update(projects_ranking="Alpha")
+        self.alpha.max_teams = 2
+        self.alpha.save()
+        master_team = form_joint_teams(self.space, 2, project_weight=0.5, budget=0.2, seed=1)
+        self.assertEqual(master_team.team_project_ids(), [self.alpha.id, self.alpha.id])
+
+        self.beta.min_teams = 1
+        self.beta.save()
+        master_team = form_joint_teams(self.space, 2, project_weight=0.5, budget=0.2, seed=1)
+        self.assertEqual(sorted(master_team.team_project_ids()), [self.alpha.id, self.beta.id])
+
+    def test_giving_a_held_project_swaps_it(self):
+        scores = np.array([[1.0, 0.0], [1.0, 0.0], [0.0, 1.0], [0.0, 1.0]])
+        state = JointScores(np.zeros((4, 4)), scores, [[0, 1], [2, 3]], 2, 1.0, [1, 0])
+        self.assertEqual(state.objective, 0.0)
+        self.assertEqual(list(state.evaluate_projects(np.array([0]), np.array([0]))), [4.0])
+        state.give_project(0, 0)
+        self.assertEqual(list(state.project_of), [0, 1])
+        self.assertEqual(state.objective, 4.0)
+        state.give_project(1, 2)  # no project
+        self.assertEqual(list(state.holder), [0, -1, -1])
+
+
+class TestProjectAssignment(TestCase):
+
+    def setUp(self):
+        User.objects.create_user("owen", password="password123")
+        models.Member.objects.create(name="Owen", username="owen", owner=True)
+        self.space = models.Space.objects.create(name="otter", url="otter", teacher="owen", description="fake",
+                                                 password="test")
+        self.popular = models.Project.objects.create(name="Popular", space=self.space, max_teams=2)
+        self.needed = models.Project.objects.create(name="Needed", space=self.space, min_teams=1, max_teams=1)
+        master_team = models.MasterTeam.objects.create(space=self.space)
+        for number in range(4):
+            team = models.Team.objects.create(space=self.space, master=master_team)
+            member = models.Member.objects.create(name="otter" + str(number), username="otter" + str(number))
+            member.spaces.add(self.space)
+            member.teams.add(team)
+            models.Preferences.objects.create(member=member, space=self.space, projects_ranking="Popular, Needed")
+
+    # Tries every assignment: most teams placed, then most minimums met, then the highest score
+    def best_by_brute_force(self, scores, min_teams, max_teams):
+        best = None
+        for choice in itertools.product(range(-1, scores.shape[1]), repeat=scores.shape[0]):
+            choice = np.array(choice)
+            load = np.bincount(choice[choice >= 0], minlength=scores.shape[1])
+            if (load > max_teams).any():
+                continue
+            key = ((choice >= 0).sum(), np.minimum(load, min_teams).sum(),
+                   round(sum(scores[t, p] for t, p in enumerate(choice) if p >= 0) * UNITS))
+            best = key if best is None or key > best else best
+        return best
+
+    def test_flow_matches_brute_force(self):
+        rng = np.random.RandomState(5)
+        for trial in range(60):
+            scores = np.round(rng.rand(rng.randint(1, 6), rng.randint(1, 4)), 3)
+            max_teams = rng.randint(0, 3, scores.shape[1])
+            min_teams = np.minimum(rng.randint(0, 3, scores.shape[1]), max_teams)
+            choice = min_cost_assignment(scores, min_teams, max_teams)
+            load = np.bincount(choice[choice >= 0], minlength=scores.shape[1])
+            self.assertTrue((load <= max_teams).all())
+            key = ((choice >= 0).sum(), np.minimum(load, min_teams).sum(),
+                   round(sum(scores[t, p] for t, p in enumerate(choice) if p >= 0) * UNITS))
+            self.assertEqual(key, self.best_by_brute_force(scores, min_teams, max_teams))
+
+    def test_capacities_and_minimum_staffing(self):
+        self.client.login(username="owen", password="password123")
+        response = self.client.get('/otter/assign_comprehensive_teams/')
+        self.assertEqual(response.status_code, 200)
+        assignments = models.TeamProject.objects.filter(space=self.space)
+        self.assertEqual(sorted((row.project.name if row.project else "", row.assigned) for row in assignments),
+                         [("", False), ("Needed", True), ("Popular", True), ("Popular", True)])
+        self.needed.min_teams = self.needed.max_teams = 5
+        self.needed.save()
+        self.assertEqual(assign_projects(self.space), ["Needed"])
+        self.assertEqual(models.TeamProject.objects.filter(space=self.space, project=self.needed).count(), 4)
+
+    def test_reassigning_replaces_rows_in_bulk(self):
+        assign_projects(self.space)
+        version = models.Space.objects.get(pk=self.space.pk).version
+        with CaptureQueriesContext(connection) as queries:
+            assign_projects(self.space)
+        self.assertEqual(len([query for query in queries if query['sql'].startswith('DELETE')]), 1)
+        self.assertEqual(len([query for query in queries if query['sql'].startswith('UPDATE')]), 1)
+        self.assertEqual(models.Space.objects.get(pk=self.space.pk).version, version + 1)
+
+
+class TestDifferentialHarness(TestCase):
+
+    # Stands in for the jar's Random Serial Dictatorship: dictators go in rank order and take their top choices still
+    # free, then members left alone who wanted any team are grouped in rank order. java is not installed where these
+    # tests run, so the engines are only checked against this fake, and compare_engines has to be run on a machine with
+    # java to check them against the real jar
+    @staticmethod
+    def fake_jar(setup_data, user_preferences):
+        group_size = int(setup_data.split()[1])
+        members = [chunk.split() for chunk in (" " + user_preferences).split(" member")[1:]]
+        by_rank = {int(tokens[1]): ["member" + tokens[0], tokens[2] == "team", [int(r) for r in tokens[3:]]]
+                   for tokens in members}
+        team_of = {}
+        for rank in sorted(by_rank):
+            if rank not in team_of:
+                team_of[rank] = rank
+                free = [choice for choice in by_rank[rank][2] if choice not in team_of][:group_size - 1]
+                team_of.update((choice, rank) for choice in free)
+        sizes = {team: list(team_of.values()).count(team) for team in team_of.values()}
+        alone = [rank for rank in sorted(by_rank) if sizes[team_of[rank]] == 1 and by_rank[rank][1]]
+        for position, rank in enumerate(alone):
+            team_of[rank] = alone[position - position % group_size]
+        teams = {}
+        for rank in sorted(team_of):
+            teams.setdefault(team_of[rank], []).append(by_rank[rank][0])
+        return [("T: " if len(team) > 1 else "S: ") + " ".join(team) + "\n" for team in teams.values()], 1024
+
+    def test_rsd_forms_the_same_teams_as_the_jar(self):
+        with mock.patch.object(differential, 'jar_unavailable', return_value=None), \
+                mock.patch.object(differential, 'run_jar_measured', side_effect=self.fake_jar):
+            report = differential.compare(sizes=(12, 30), trials=3, group_size=3, engine='rsd')
+        self.assertEqual(report['jar'], "ran")
+        self.assertTrue(all(row['same_partition'] for row in report['runs']))
+        self.assertTrue(all(row['engine_welfare'] == row['jar_welfare'] for row in report['runs']))
+        self.assertEqual([size['same_partitions'] for size in report['sizes']], [3, 3])
+        self.assertEqual(report['sizes'][0]['jar_peak_kb'], 1024)
+
+    def test_a_crashing_jar_is_an_error(self):
+        def crash(args, **kwargs):
+            return subprocess.Popen(['sh', '-c', 'echo OutOfMemoryError; exit 3'], **kwargs)
+        with mock.patch.object(jar, 'Popen', side_effect=crash):
+            with self.assertRaisesRegex(jar.JarError, "status 3: OutOfMemoryError"):
+                jar.run_jar_measured("2 2 0 0 1000 0", "ann 0 alone bo 1 alone ")
+
+    def test_a_crashing_jar_fails_the_formation_job(self):
+        space = models.Space.objects.create(name="wasp", url="wasp", teacher="roar", description="fake",
+                                            password="test")
+        for username in ("wade", "will"):
+            models.Member.objects.create(name=username, username=username).spaces.add(space)
+
+        def crash(args, **kwargs):
+            return subprocess.Popen(['sh', '-c', 'echo Exception in thread main; exit 1'], **kwargs)
+        with self.settings(FORMATION_IN_BACKGROUND=False), mock.patch.object(jar, 'Popen', side_effect=crash):
+            job = start_job(space, 'form', "members on teams", service.form_teams, space, 2, 0, 0.001, 0.0)
+        self.assertEqual((job.status, job.error), ('failed', "The jar exited with status 1: Exception in thread main"))
+        self.assertFalse(models.MasterTeam.objects.filter(space=space).exists())
+
+    def test_runs_the_engine_alone_without_java(self):
+        with mock.patch.object(differential, 'jar_unavailable', return_value="java is not installed"):
+            report = differential.compare(sizes=(10,), trials=2, engine='montecarlo', orderings=50)
+        self.assertEqual(report['jar'], "java is not installed")
+        self.assertTrue(all(row['jar_seconds'] is None and row['engine_seconds'] > 0 for row in report['runs']))
+        self.assertIsNone(report['sizes'][0]['speedup'])
+
+
+class TestLocalSearch(TestCase):
+
+    def setUp(self):
+        self.space = models.Space.objects.create(name="seal", teacher="roar", description="fake", password="test")
+        usernames = ["sam", "sue", "sid", "sal"]
+        members = []
+        for username in usernames:
+            member = models.Member.objects.create(name=username, username=username)
+            member.spaces.add(self.space)
+            members.append(member)
+        # sam & sue and sid & sal want each other, but the candidate pairs them up the wrong way
+        for member, partner in (("sam", "sue"), ("sue", "sam"), ("sid", "sal"), ("sal", "sid")):
+            models.Preferences.objects.create(member=models.Member.objects.get(username=member), space=self.space,
+                                              members_ranking=partner + " ")
+        self.ids = {member.username: member.id for member in members}
+        self.master_team = models.MasterTeam.objects.create(space=self.space, number_of_members=2)
+        self.master_team.set_teams([[self.ids["sam"], self.ids["sid"]], [self.ids["sue"], self.ids["sal"]]])
+        self.master_team.save()
+
+    def test_improve_finds_mutual_pairs(self):
+        improved = improve_master_team(self.master_team, budget=0.2, seed=1)
+        teams = sorted(sorted(team) for team in improved.team_member_ids())
+        expected = sorted([sorted([self.ids["sam"], self.ids["sue"]]), sorted([self.ids["sid"], self.ids["sal"]])])
+        self.assertEqual(teams, expected)
+        self.assertEqual(improved.algorithm_type(), "Local Search Improvement")
+        self.assertEqual(models.MasterTeam.objects.filter(space=self.space).count(), 2)
+
+    def test_improve_respects_group_size(self):
+        matrix = PreferenceMatrix.from_space(self.space)
+        teams, welfare = improve(matrix, [[0], [1], [2], [3]], 2, budget=0.1, seed=2)
+        self.assertTrue(all(len(team) <= 2 for team in teams))
+        self.assertEqual(welfare, 4.0)
+
+
+class TestTeamScores(TestCase):
+
+    def setUp(self):
+        random = np.random.RandomState(3)
+        self.utility = random.rand(9, 9)
+        np.fill_diagonal(self.utility, 0.0)
+        self.teams = [[0, 1, 2], [3, 4, 5], [6, 7], [8]]
+
+    def welfare(self, teams):
+        return sum(self.utility[np.ix_(team, team)].sum() for team in teams)
+
+    def test_moves_and_swaps_match_full_rescoring(self):
+        scores = TeamScores(self.utility, self.teams, capacity=3)
+        self.assertAlmostEqual(scores.welfare, self.welfare(self.teams))
+        delta = scores.delta_swap(0, 4)
+        before = scores.welfare
+        scores.swap(0, 4)
+        self.assertAlmostEqual(scores.welfare, before + delta)
+        delta = scores.delta_move(7, 3)
+        before = scores.welfare
+        scores.move(7, 3)
+        self.assertAlmostEqual(scores.welfare, before + delta)
+        self.assertAlmostEqual(scores.welfare, self.welfare(scores.teams()))
+
+    def test_batched_evaluation_matches_single_evaluation(self):
+        scores = TeamScores(self.utility, self.teams, capacity=3)
+        first = np.array([0, 1, 3, 6, 2])
+        second = np.array([4, 8, 7, 0, 1])
+        swaps = scores.evaluate_swaps(first, second)
+        for k in range(len(first)):
+            if scores.team_of[first[k]] == scores.team_of[second[k]]:
+                self.assertEqual(swaps[k], -np.inf)
+            else:
+                self.assertAlmostEqual(swaps[k], scores.delta_swap(first[k], second[k]))
+        moves = scores.evaluate_moves(first, np.array([3, 2, 0, 3, 0]))
+        self.assertAlmostEqual(moves[0], scores.delta_move(0, 3))
+        self.assertAlmostEqual(moves[1], scores.delta_move(1, 2))
+        self.assertEqual(moves[2], -np.inf)  # team 0 is full
+        self.assertEqual(moves[4], -np.inf)  # member 2 is already on team 0
+
+
+class TestWhatIf(TestCase):
+
+    def setUp(self):
+        User.objects.create_user("roar", password="roar-password")
+        models.Member.objects.create(name="Roar", username="roar", owner=True)
+        self.space = models.Space.objects.create(name="crab", teacher="roar", description="fake", password="test",
+                                                 url="crab")
+        ids = []
+        for username in ("cal", "cat", "cid", "cy"):
+            member = models.Member.objects.create(name=username, username=username)
+            member.spaces.add(self.space)
+            ids.append(member.id)
+        cal = models.Member.objects.get(username="cal")
+        models.Preferences.objects.create(member=cal, space=self.space, members_ranking="cid ")
+        self.master_team = models.MasterTeam.objects.create(space=self.space, number_of_members=2)
+        self.master_team.set_teams([ids[0:2], ids[2:4]])
+        self.master_team.save()
+        self.client.login(username="roar", password="roar-password")
+        self.url = "/choose_teams/crab/what_if/" + str(self.master_team.id) + "/"
+
+    def test_swap_reports_new_metrics_without_saving(self):
+        response = self.client.post(self.url, {'edits': json.dumps([["swap", "cat", "cid"]])})
+        self.assertEqual(response.status_code, 200)
+        result = json.loads(response.content.decode("utf-8"))
+        self.assertEqual(result['baseline']['welfare'], 0.0)
+        self.assertEqual(result['metrics']['welfare'], 1.0)
+        self.assertEqual([sorted(team) for team in result['teams']], [["cal", "cid"], ["cat", "cy"]])
+        self.assertEqual(models.MasterTeam.objects.count(), 1)
+
+    def test_move_into_full_team_is_rejected(self):
+        response = self.client.post(self.url, {'edits': json.dumps([["move", "cal", 2]])})
+        self.assertEqual(response.status_code, 400)
+
+    def test_teams_are_numbered_as_on_the_candidates_page(self):
+        departed = models.Member.objects.create(name="cob", username="cob")
+        teams = self.master_team.team_member_ids()
+        self.master_team.set_teams([[departed.id]] + teams)
+        self.master_team.save()
+        self.assertEqual(len(self.master_team.rosters()), 3)
+        response = self.client.post(self.url, {'edits': json.dumps([["move", "cal", 1]])})
+        self.assertEqual(response.status_code, 200)
+        result = json.loads(response.content.decode("utf-8"))
+        self.assertEqual([sorted(team) for team in result['teams']], [["cal"], ["cat"], ["cid", "cy"]])
+
+    def test_malformed_edits_are_rejected(self):
+        for edits in ('5', '{}', '"move"', '[1]', '[["move", ["cal"], 1]]', '[["swap", "cal", {}]]', 'not json'):
+            response = self.client.post(self.url, {'edits': edits})
+            self.assertEqual(response.status_code, 400, edits)
+            self.assertIn('error', json.loads(response.content.decode("utf-8")))
+
+    def test_save_adds_candidate(self):
+        self.client.post(self.url, {'edits': json.dumps([["swap", "cat", "cid"]]), 'save': '1'})
+        edited = models.MasterTeam.objects.get(algorithm_index=4)
+        self.assertEqual(len(edited.team_member_ids()), 2)
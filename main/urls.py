@@ -9,7 +9,7 @@ main/urls.py routes each url that a user could visit to the appropriate view fun
 from django.conf.urls import url
 from django.contrib.auth import views as auth_views
 from main.forms import LoginForm
-from main import views
+from main import views, api
 
 urlpatterns = [
     url(r'^$', views.home_view, name='home'),
@@ -28,7 +28,15 @@ urlpatterns = [
     url(r'([a-zA-Z0-9_-]{3,16})/editprofile/$', views.edit_profile_view, name='edit_profile'),
     url(r'([a-zA-Z0-9_-]{3,16})/delete/$', views.delete_space_view, name='delete_space'),
     url(r'^about/$', views.about_view, name='about'),
+    url(r'^api/v1/spaces/$', api.spaces, name='api_spaces'),
+    url(r'^api/v1/spaces/([a-zA-Z0-9_-]{3,16})/members/$', api.members, name='api_members'),
+    url(r'^api/v1/spaces/([a-zA-Z0-9_-]{3,16})/preferences/$', api.preferences, name='api_preferences'),
+    url(r'^api/v1/spaces/([a-zA-Z0-9_-]{3,16})/master_teams/$', api.master_teams, name='api_master_teams'),
+    url(r'^api/v1/spaces/([a-zA-Z0-9_-]{3,16})/teams/$', api.teams, name='api_teams'),
+    url(r'^api/v1/spaces/([a-zA-Z0-9_-]{3,16})/assignments/$', api.assignments, name='api_assignments'),
     url(r'^([a-zA-Z0-9_-]{3,16})/addmembers', views.add_members_view, name='add_members'),
+    url(r'^([a-zA-Z0-9_-]{3,16})/import_preferences/$', views.import_preferences_view, name='import_preferences'),
+    url(r'^([a-zA-Z0-9_-]{3,16})/participants/$', views.participant_search_view, name='participant_search'),
     url(r'^([a-zA-Z0-9_-]{3,16})/([a-zA-Z0-9_-]{3,16})/rank/', views.rank_preferences_view, name='rank_preferences'),
     url(r'^([a-zA-Z0-9_-]{3,16})/delete/([a-zA-Z0-9_"-]{1,30})/$', views.delete_project_view, name='delete_project'),
     url(r'^([a-zA-Z0-9_-]{1,30})/remove/([a-zA-Z0-9_"-]{3,16})/$', views.remove_member_view, name='remove_member'),
@@ -41,6 +49,14 @@ urlpatterns = [
     url(r'^([a-zA-Z0-9_-]{3,16})/all_teams/$', views.all_teams_view, name='view_groups'),
     url(r'^([a-zA-Z0-9_-]{3,16})/([a-zA-Z0-9_-]{3,16})/preferences', views.space_preferences_view,
         name='space_view_preferences'),
+    url(r'^choose_teams/([a-zA-Z0-9_-]{3,16})/improve/([0-9]+)/$', views.improve_teams_view, name='improve_teams'),
+    url(r'^choose_teams/([a-zA-Z0-9_-]{3,16})/what_if/([0-9]+)/$', views.what_if_view, name='what_if'),
+    url(r'^choose_teams/([a-zA-Z0-9_-]{3,16})/progress/([0-9]+)/$', views.formation_progress_view,
+        name='formation_progress'),
+    url(r'^choose_teams/([a-zA-Z0-9_-]{3,16})/progress/([0-9]+)/events/$', views.formation_events_view,
+        name='formation_events'),
+    url(r'^choose_teams/([a-zA-Z0-9_-]{3,16})/progress/([0-9]+)/poll/$', views.formation_poll_view,
+        name='formation_poll'),
     url(r'^choose_teams/([a-zA-Z0-9_-]{3,16})/', views.compare_teams_view, name='compare_teams'),
     url(r'^([a-zA-Z0-9_-]{3,16})/send_reminders/$', views.send_reminders_view, name='send_reminders'),
 ]
\ No newline at end of file
@@ -11,16 +11,33 @@ View.py contains all of the controller logic for this project which uses the MVC
 
 
 from __future__ import division
+from django.conf import settings
 from django.contrib.auth import login, authenticate
 from django.contrib.auth.models import User
 from django.contrib.auth.decorators import login_required
 from main.forms import SignUpForm, EmailSignupForm, ChangePasswordForm
 from django.shortcuts import render, redirect
-from main.models import Space, Project, Member, Preferences, Team, MasterTeam, TeamProject
+from django.http import JsonResponse, StreamingHttpResponse
+from django.views.decorators.http import condition
+from django.db.models import Prefetch
+from main.models import Space, Project, Member, Preferences, Team, MasterTeam, TeamProject, FormationJob
 import json as simplejson
-from main.functions import authenticate_member, get_user, send_new_space_email, send_owner_spreadsheet
+from main.purge import purge_master_teams, purge_space
+from main.routing import read_from_replica
+from main.conditional import space_etag, space_last_modified, member_spaces_etag, member_spaces_last_modified
+from main.preference_import import decode_upload, import_preferences, format_for_filename
+from main.formation.service import form_teams
+from main.formation.montecarlo import form_monte_carlo_teams, MONTE_CARLO_ALGORITHM_INDEX
+from main.formation.joint import form_joint_teams, JOINT_ALGORITHM_INDEX
+from main.formation.assignment import assign_projects
+from main.formation.optimize import improve_master_team
+from main.formation.whatif import apply_edits, rosters, save_edits
+from main.formation.progress import start_job, progress_of, event_stream, wait_for_change
+from main.functions import authenticate_member, get_user, send_new_space_email, send_owner_spreadsheet, \
+    participants_with_preferences, team_assignments, search_participants, ranking_from_ids
+from main.pagination import InvalidCursor
 from django.core.mail import send_mail
-from subprocess import Popen, PIPE, STDOUT
+from functools import partial
 import random
 
 
@@ -255,8 +272,17 @@ def create_project_view(request, space_url):
             errormsg = "Too long. The project's name cannot be more than 30 characters"
             return render(request, 'createproject.html', {'member': member, 'errormsg': errormsg})
 
+        try:
+            min_teams = int(request.POST.get('MinTeams') or 0)
+            max_teams = int(request.POST.get('MaxTeams') or 1)
+        except ValueError:
+            min_teams, max_teams = -1, 0
+        if min_teams < 0 or max_teams < 1 or min_teams > max_teams:
+            errormsg = "A project must take at least one team, and its minimum cannot be more than its maximum."
+            return render(request, 'createproject.html', {'member': member, 'errormsg': errormsg})
+
         new_project = Project(name = name, url = url, description=description, qualifications=qualifications,
-                            space = owning_space)
+                            space = owning_space, min_teams=min_teams, max_teams=max_teams)
         new_project.save()
         return redirect('/space/' + space_url)
     return render(request, 'createproject.html', {'member': member, 'errormsg': errormsg})
@@ -264,34 +290,37 @@ def create_project_view(request, space_url):
 
 # View displays all of the spaces that the active user is a part of as links to the space's page
 @login_required(login_url="/login/")
+@read_from_replica
+@condition(etag_func=space_etag, last_modified_func=space_last_modified)
 def space_view(request, url):
     msg = ""
     space = Space.objects.get(url=url)
-    teamsformed = Team.objects.filter(space=space).exists()
+    teamsformed = MasterTeam.objects.filter(space=space).exists()
     member = get_user(request)
     if member.spaces.filter(url=url).exists() or member.username == space.teacher: # makes sure user is in the space
         projects = Project.objects.filter(space__url__exact=url)
         ordered_projects = projects.order_by('name')
         participants = space.member_set.exclude(name = 'Account in Progress')
         ordered_participants = participants.order_by('name')
-        participants_prefs = []
-        for participant in ordered_participants:
-            if Preferences.objects.filter(member=participant, space=space).exists():
-                preference = Preferences.objects.get(member=participant, space=space)
-                prefs = preference.preferences_as_names()
-            else:
-                prefs = "No partner preferences submitted"
-            participants_prefs.append(prefs)
 
         non_registered_members = space.member_set.filter(name='Account in Progress')
         non_registered_members = non_registered_members.order_by('email')
         if request.method == 'POST':
             msg = "The password for this space is " + space.password
-        zipped = zip(ordered_participants, participants_prefs)
+
+        # the members list is a cached fragment in space.html, so the preferences are only looked up when it is
+        # rendered again after space.version changes
+        zipped = partial(participants_with_preferences, space, ordered_participants)
+        if member.username == space.teacher:
+            viewer_role = "teacher"
+        elif member.owner:
+            viewer_role = "owner"
+        else:
+            viewer_role = "member"
         return render(request, 'space.html', {'projects': ordered_projects, 'space': space, 'member': member,
                                               'zipped_students': zipped, 'msg': msg, 'teamsformed': teamsformed,
                                               'non_registered_members': non_registered_members, 'total_students':
-                                              participants.count()})
+                                              participants.count(), 'viewer_role': viewer_role})
     else:
         return redirect('/profile_redirect/')
 
@@ -312,11 +341,8 @@ def join_space_view(request, username):
     spaces = Space.objects.all()
     spaces = spaces.order_by('name')    # orders spaces alphabetically
 
-    # for loop checks for which spaces a member is already a part of and prevents showing those spaces on JoinSpace
-    for space in spaces:
-        already_member = member.spaces.filter(name= space.name).exists()
-        if already_member:
-           spaces = spaces.exclude(name = space.name)
+    # leaves out the spaces a member is already a part of so they are not shown on JoinSpace
+    spaces = spaces.exclude(name__in=member.spaces.values('name'))
 
     if spaces.count() == 0:
         are_spaces = False
@@ -378,7 +404,7 @@ def delete_space_view(request, spaceurl):
         return redirect('/profile_redirect/')
     if request.method == 'POST':
         if space.teacher == member.username:
-            space.delete()
+            purge_space(space.id, defer=settings.DEFER_PURGES)
             return redirect("/profile/" + member.username)
         else:
             msg = "You do not have the ability to delete this space"
@@ -470,6 +496,33 @@ def add_members_view(request, spaceurl):
                                                were_dup_adds})
 
 
+# View allows the owner of a space to upload the rankings of every member at once, e.g. exported from a survey. The
+# file is checked and saved by import_preferences in main/preference_import.py
+@login_required(login_url="/login/")
+def import_preferences_view(request, spaceurl):
+    member = get_user(request)
+    space = Space.objects.get(url=spaceurl)
+    if member.username != space.teacher:
+        return redirect('/profile_redirect/')
+    msg = ""
+    errors = []
+    if request.method == 'POST':
+        upload = request.FILES.get('preferences_file')
+        if upload:
+            lines, error = decode_upload(upload)
+            if error:
+                imported, errors = 0, [error]
+            else:
+                imported, errors = import_preferences(space, lines, format_for_filename(upload.name))
+            if errors:
+                msg = "No preferences were imported. Fix the lines below and upload the file again."
+            else:
+                msg = "Preferences were imported for " + str(imported) + " members of " + space.name + "."
+        else:
+            msg = "Error, no file submitted."
+    return render(request, "importpreferences.html", {'space': space, 'member': member, 'msg': msg, 'errors': errors})
+
+
 # View allows students to rank the students the would like to work with and projects they would like to work on
 @login_required(login_url="/login/")
 def rank_preferences_view(request, spaceurl, username):
@@ -481,9 +534,8 @@ def rank_preferences_view(request, spaceurl, username):
     space = Space.objects.get(url=spaceurl)
     projects = Project.objects.filter(space__url__exact=spaceurl)
     projects = projects.order_by('name')
-    participants = space.member_set.exclude(name='Account in Progress')
-    participants = participants.exclude(username = username)
-    participants = participants.order_by('name')
+    # the participants themselves are loaded by rankpreferences.html from participant_search_view as they are needed
+    participant_count = space.member_set.exclude(name='Account in Progress').exclude(username=username).count()
 
     if request.is_ajax():
         category = request.POST.get('category')
@@ -501,7 +553,9 @@ def rank_preferences_view(request, spaceurl, username):
             preference.projects_ranking = preference.projects_ranking[:-2]
             success = True
 
-        if category == 'peer':
+        if category == 'peer' and request.POST.get('peer_ids') is not None:
+            preference.members_ranking = ranking_from_ids(space, simplejson.loads(request.POST.get('peer_ids')))
+        elif category == 'peer':  # rankings sent as "Name (username)" strings by older copies of the page
             peer_ranking_JSON = request.POST.get('peer_ranking')
             peer_preferences = simplejson.loads(peer_ranking_JSON)
             preference.members_ranking = ""
@@ -517,8 +571,26 @@ def rank_preferences_view(request, spaceurl, username):
                     preference.members_ranking += username + ' '
 
         preference.save()
-    return render(request, "rankpreferences.html", {'member': member, 'projects': projects, 'participants': participants,
-                                                    'success': success, 'space': space})
+    return render(request, "rankpreferences.html", {'member': member, 'projects': projects,
+                                                    'participant_count': participant_count, 'success': success,
+                                                    'space': space})
+
+
+# View answers the participant search of rankpreferences.html with JSON: one page of the participants whose name or
+# username starts with 'q', and the cursor to ask for the next page with
+@login_required(login_url="/login/")
+def participant_search_view(request, spaceurl):
+    space = Space.objects.get(url=spaceurl)
+    member = get_user(request)
+    if not member.spaces.filter(pk=space.pk).exists() and member.username != space.teacher:
+        return JsonResponse({'error': "You are not in this space."}, status=403)
+    try:
+        limit = max(1, min(100, int(request.GET.get('limit', 20))))
+        participants, next_cursor = search_participants(space, member, request.GET.get('q', ''),
+                                                        request.GET.get('cursor') or None, limit)
+    except (ValueError, InvalidCursor) as error:
+        return JsonResponse({'error': str(error)}, status=400)
+    return JsonResponse({'results': participants, 'next': next_cursor})
 
 
 # View quickly changes view and back to the old view, running code to delete the project in the meantime
@@ -551,6 +623,7 @@ def remove_member_view(request, space_url, username):
 
 
 @login_required(login_url="/login/")
+@read_from_replica
 def preferences_view(request, username):
     member = Member.objects.get(username = username)
     if not authenticate_member(request, member):
@@ -583,6 +656,7 @@ def preferences_view(request, username):
 
 
 @login_required(login_url="/login/")
+@read_from_replica
 def space_preferences_view(request, username, spaceurl):
     member = Member.objects.get(username=username)
     if not authenticate_member(request, member):
@@ -601,128 +675,47 @@ def space_preferences_view(request, username, spaceurl):
 def form_teams_view(request, spaceurl):
     member = get_user(request)
     space = Space.objects.get(url=spaceurl)
-    msg = ""
-    user_preferences = ""
     if member.username != space.teacher:
         return redirect('/profile_redirect/')
-    setup_data = ""
     if request.method == 'POST':
-        group_size_raw = request.POST.get('Group_Options', None)
-        iterative_soulmates_raw = '1'
-        algorithm_index_raw = request.POST.get('optradio', None)
-        alpha_raw = request.POST.get('alpha')
-        alpha_adjusted = float(alpha_raw) * 1000000
-        alpha_adjusted = int(alpha_adjusted)
-        theta_raw = request.POST.get('theta')
-        theta_adjusted = float(theta_raw) * 100
-        theta_adjusted = int(theta_adjusted)
-        members = space.member_set.exclude(name='Account in Progress')
-        number_members = members.count()
-
-        setup_data = str(number_members) + " " + group_size_raw + " " + iterative_soulmates_raw + " " \
-                     + algorithm_index_raw + " " + str(alpha_adjusted) + " " + str(theta_adjusted)
-
-        # get input in format to store in team model
-        algorithm_index = int(algorithm_index_raw)
-        iterative_soulmates = iterative_soulmates_raw == "1"
-        group_size = int(group_size_raw)
-
-        # Assigns each member a rank and sets up easy lookup between usernames and rankings
-        rank_to_user_dict = {}
-        user_to_rank_dict = {}
-        random_array = random.sample(range(0, members.count()), members.count())
-        count = 0
-        for member in members:
-            rank = random_array[count]
-            rank_to_user_dict[rank] = member.username
-            user_to_rank_dict[member.username] = rank
-            count += 1
-
-        # Gets member preferences ready for the java program
-        user_preferences = ""
-        for member in members:
-            member_data = member.username + " " + str(user_to_rank_dict[member.username]) + " "
-            wants_any_team = False
-            if Preferences.objects.filter(member=member, space=space).exists():
-                finished = False
-                pref_data = ""
-                preferences = Preferences.objects.get(member=member, space=space)
-                preferenceArray = preferences.members_ranking.split(' ')
-                for preference in preferenceArray:
-                    if preference == "@myself@":
-                        finished = True
-                    elif preferences == "@team@":
-                        wants_any_team = True
-                    if preference in user_to_rank_dict and not finished:
-                        pref_data += str(user_to_rank_dict[preference]) + " "
-                if wants_any_team:
-                    pref_data = "team " + pref_data
-                else:
-                    pref_data = "alone " + pref_data
-                member_data += " " + pref_data
-            else:
-                member_data += "alone "
-            user_preferences += member_data
-
-        # Runs the team formation algorithms by passing in setup data and preference data to the Java executable
-        p = Popen(['java', '-jar', 'JavaCode/TeamFormationAlgorithms.jar', setup_data, user_preferences],
-                  stdout=PIPE, stderr=STDOUT)
-
-        # Adds teams to the database by parsing the console output of the Java executable
-        master_team = MasterTeam(space=space, iterative_soulmates=iterative_soulmates,
-                                 number_of_members=group_size, algorithm_index=algorithm_index)
-        master_team.save()
-        space.teams_decided = False
-        space.save()
-
-        for raw_line in p.stdout:
-            line = raw_line.decode("utf-8")
-            if line[0:2] == 'T:':
-                teammates = line[3:]
-                user_list = teammates.split(" ")
-                team = Team(space=space, master=master_team)
-                team.save()
-                for username in user_list:
-                    if Member.objects.filter(username=username).exists():
-                        user = Member.objects.get(username=username)
-                        user.teams.add(team)
-                        user.save()
-                team.save()
-            if line[0:2] == 'S:':
-                solo_names = line[3:]
-                solo_list = solo_names.split(" ")
-                for username in solo_list:
-                    if not username == '':
-                        user = Member.objects.get(username=username)
-                        team = Team(space=space, master=master_team)
-                        team.save()
-                        user.teams.add(team)
-        master_team.save()
-
-        return redirect("/choose_teams/" + space.url + "/")
+        group_size = int(request.POST.get('Group_Options', None))
+        algorithm_index = int(request.POST.get('optradio', None))
+        alpha = float(request.POST.get('alpha'))
+        theta = float(request.POST.get('theta'))
+
+        # Runs the team formation algorithms in the Java executable and stores the result as a new MasterTeam, on a
+        # background thread when settings.FORMATION_IN_BACKGROUND is on so the owner can watch its progress
+        if algorithm_index == MONTE_CARLO_ALGORITHM_INDEX:
+            job = start_job(space, 'form', "welfare", form_monte_carlo_teams, space, group_size,
+                            keep=request.POST.get('keep', 'best'))
+        elif algorithm_index == JOINT_ALGORITHM_INDEX:
+            project_weight = min(1.0, max(0.0, float(request.POST.get('project_weight', 0.5))))
+            job = start_job(space, 'form', "weighted score", form_joint_teams, space, group_size, project_weight)
+        else:
+            job = start_job(space, 'form', "members on teams", form_teams, space, group_size, algorithm_index,
+                            alpha, theta)
+        return redirect_to_job(space, job)
 
-    return render(request, "TeamFormation.html", {'member': member, 'msg': "\"" + setup_data + "\" \"" + user_preferences + "\""})
+    return render(request, "TeamFormation.html", {'member': member})
 
 
 @login_required(login_url="/login/")
+@read_from_replica
+@condition(etag_func=member_spaces_etag, last_modified_func=member_spaces_last_modified)
 def teams_view(request, username):
     member = get_user(request)
     if member.owner:
         spaces = Space.objects.filter(teacher = member.username)
         return render(request, "ownerviewteams.html", {'member': member, 'spaces': spaces})
     else:
-        teams = []
-        no_teams = True
-        for space in member.spaces.all():
-            if space.teams_decided:
-                if member.teams.filter(space=space).exists():
-                    team = member.teams.get(space=space)
-                    teams.append(team)
-                    no_teams = False
+        teams = member.teams.filter(space__member=member, space__teams_decided=True).order_by('space__id')
+        teams = list(teams.with_rosters())
+        no_teams = len(teams) == 0
         return render(request, "ViewTeams.html", {'member': member, 'teams': teams, 'noteams': no_teams})
 
 
 @login_required(login_url="/login/")
+@read_from_replica
 def all_teams_view(request, spaceurl):
     member = get_user(request)
     if Space.objects.filter(url=spaceurl).exists():
@@ -734,7 +727,7 @@ def all_teams_view(request, spaceurl):
     no_teams = not space.teams_decided
     if space.teams_decided:
         master_team = MasterTeam.objects.get(space=space)
-        teams = Team.objects.filter(space=space, master=master_team)
+        teams = Team.objects.for_spaces([space]).filter(master=master_team)
     else:
         teams = None
     return render(request, "ViewTeams.html", {'member': member, 'teams': teams, 'noteams': no_teams, 'space': space})
@@ -756,15 +749,14 @@ def compare_teams_view(request, space_url):
                 finalized_team = master_team
                 was_finalized = True
         if was_finalized:
-            for master_team in master_teams:
-                if master_team != finalized_team:
-                    master_team.delete()
+            discarded_ids = [master_team.id for master_team in master_teams if master_team != finalized_team]
+            purge_master_teams(discarded_ids, defer=settings.DEFER_PURGES)
+            finalized_team.materialize()
             space.teams_decided = True
             space.save()
 
             # tell all the members about their new team
-            master_teams = MasterTeam.objects.get(space=space)
-            send_owner_spreadsheet(master_teams, space)
+            send_owner_spreadsheet(finalized_team, space)
             participants = space.member_set.exclude(name='Account in Progress')
             for participant in participants:
                 if member.teams.filter(space=space).exists():
@@ -786,9 +778,98 @@ def compare_teams_view(request, space_url):
                     send_mail(subject, message, sender_email, [recipient_email])
 
     master_teams = MasterTeam.objects.filter(space=space)
+    master_teams = list(master_teams.prefetch_related(Prefetch('team_set', queryset=Team.objects.with_rosters())))
+    MasterTeam.defer_rosters(master_teams)
     return render(request, "choose_teams.html", {'member': member, 'space': space, 'master_teams': master_teams})
 
 
+# View runs a time limited local search (main/formation/optimize.py) starting from one of the candidate MasterTeams and
+# adds the improved teams as another candidate to compare
+@login_required(login_url="/login/")
+def improve_teams_view(request, space_url, master_team_id):
+    space = Space.objects.get(url=space_url)
+    member = get_user(request)
+    if space.teacher != member.username:
+        return redirect('/profile_redirect/')
+    if request.method == 'POST' and MasterTeam.objects.filter(id=master_team_id, space=space).exists():
+        master_team = MasterTeam.objects.get(id=master_team_id, space=space)
+        job = start_job(space, 'improve', "welfare", improve_master_team, master_team,
+                        budget=settings.LOCAL_SEARCH_BUDGET)
+        return redirect_to_job(space, job)
+    return redirect("/choose_teams/" + space.url + "/")
+
+
+# Sends the owner to the progress page of a job that is still running, or straight to the candidates once it is done
+def redirect_to_job(space, job):
+    if job.finished():
+        return redirect("/choose_teams/" + space.url + "/")
+    return redirect("/choose_teams/" + space.url + "/progress/" + str(job.id) + "/")
+
+
+# View shows the progress of a formation or local search running in the background, and sends the owner on to
+# choose_teams.html once it is done. The page listens to formation_events_view, or polls formation_poll_view in
+# browsers without server-sent events
+@login_required(login_url="/login/")
+def formation_progress_view(request, space_url, job_id):
+    space = Space.objects.get(url=space_url)
+    member = get_user(request)
+    if space.teacher != member.username or not FormationJob.objects.filter(id=job_id, space=space).exists():
+        return redirect('/profile_redirect/')
+    job = FormationJob.objects.get(id=job_id, space=space)
+    return render(request, "formationprogress.html", {'member': member, 'space': space, 'job': job})
+
+
+# View streams the job's progress as server-sent events (see event_stream in main/formation/progress.py)
+@login_required(login_url="/login/")
+def formation_events_view(request, space_url, job_id):
+    space = Space.objects.get(url=space_url)
+    member = get_user(request)
+    if space.teacher != member.username or not FormationJob.objects.filter(id=job_id, space=space).exists():
+        return JsonResponse({'error': "Only the owner of the space can follow its formations."}, status=403)
+    response = StreamingHttpResponse(event_stream(int(job_id)), content_type='text/event-stream')
+    response['Cache-Control'] = 'no-cache'
+    response['X-Accel-Buffering'] = 'no'  # keeps nginx style proxies from holding the events back
+    return response
+
+
+# View answers with the job's progress as JSON once it changed after the 'since' timestamp, for long polling
+@login_required(login_url="/login/")
+def formation_poll_view(request, space_url, job_id):
+    space = Space.objects.get(url=space_url)
+    member = get_user(request)
+    if space.teacher != member.username or not FormationJob.objects.filter(id=job_id, space=space).exists():
+        return JsonResponse({'error': "Only the owner of the space can follow its formations."}, status=403)
+    try:
+        since = float(request.GET.get('since', 0))
+    except ValueError:
+        since = 0.0
+    return JsonResponse(progress_of(wait_for_change(int(job_id), since)))
+
+
+# View replays the owner's hand edits (moves and swaps) on a candidate MasterTeam and answers with the updated welfare
+# metrics as JSON. If 'save' is posted, the edited teams are kept as a new candidate. See main/formation/whatif.py
+@login_required(login_url="/login/")
+def what_if_view(request, space_url, master_team_id):
+    space = Space.objects.get(url=space_url)
+    member = get_user(request)
+    if space.teacher != member.username or request.method != 'POST':
+        return JsonResponse({'error': "Only the owner of the space can edit its teams."}, status=403)
+    if not MasterTeam.objects.filter(id=master_team_id, space=space).exists():
+        return JsonResponse({'error': "That set of teams no longer exists."}, status=404)
+    master_team = MasterTeam.objects.get(id=master_team_id, space=space)
+    master_team.space = space
+    try:
+        edits = simplejson.loads(request.POST.get('edits', '[]'))
+        matrix, scores, baseline = apply_edits(master_team, edits)
+    except ValueError as error:
+        return JsonResponse({'error': str(error)}, status=400)
+
+    if request.POST.get('save') == '1':
+        save_edits(master_team, matrix, scores)
+        return JsonResponse({'saved': True})
+    return JsonResponse({'baseline': baseline, 'metrics': scores.metrics(), 'teams': rosters(matrix, scores)})
+
+
 @login_required(login_url="/login/")
 def send_reminders_view(request, space_url):
     space = Space.objects.get(url=space_url)
@@ -807,110 +888,39 @@ def send_reminders_view(request, space_url):
 # View assigns projects to teams in a specific space based on individuals preferences of members on teams
 @login_required(login_url="/login/")
 def assign_comprehensive_teams_view(request, spaceurl):
-    space = Space.objects.get(url=spaceurl)
-    preferences = Preferences.objects.filter(space=space)
-    teams = list(Team.objects.filter(space=space))
-    projects = Project.objects.filter(space=space)
-
-    random.shuffle(teams)
-
-    current_assignments = TeamProject.objects.filter(space=space)
-    current_assignments.delete()
-
-    for team in teams:
-        team_rank = {}
-        for project in projects:
-            team_rank[project.name] = 0
-
-        members = list(Member.objects.filter(teams=team))
-
-        for member in members:
-            if preferences.filter(member=member).exists():
-                member_preferences = preferences.get(member=member, space=space)
-                member_rankings = member_preferences.project_preferences_as_names()
-                for project in member_rankings:
-                    team_rank[project] = team_rank[project] + member_rankings[project]
-
-        max_value = -1
-        max_project = ""
-        for name in team_rank:
-            test_project = Project.objects.get(name=name)
-            if team_rank[name] > max_value and not TeamProject.objects.filter(space=space, project=test_project):
-                max_value = team_rank[name]
-                max_project = name
-
-        if Project.objects.filter(space=space, name=max_project).exists():
-            team_project = Project.objects.get(name=max_project)
-            new_project_team = TeamProject(space=space, team=team, project=team_project, assigned=True, representative=None)
-
-        else:
-            new_project_team = TeamProject(space=space, team=team, assigned=False, representative=None)
-
-        new_project_team.save()
+    return render_assignments(request, spaceurl, representatives=False)
 
-    return render(request, 'view_assignments.html', {'member': get_user(request),
-                                                     'list': TeamProject.objects.filter(space=space), 'space': space,'teams':teams})
 
-
-# View assigns projects to teams in a specific space based on individuals preferences of members on teams
+# View assigns projects to teams in a specific space based on the preferences of one representative per team
 @login_required(login_url="/login/")
 def assign_representative_teams_view(request, spaceurl):
-    space = Space.objects.get(url=spaceurl)
-    preferences = Preferences.objects.filter(space=space)
-    teams = list(Team.objects.filter(space=space))
-    projects = Project.objects.filter(space=space)
-
-    random.shuffle(teams)
-
-    current_assignments = TeamProject.objects.filter(space=space)
-    current_assignments.delete()
-
-    for team in teams:
-        team_rank = {}
-        for project in projects:
-            team_rank[project.name] = 0
-
-        members = list(Member.objects.filter(teams=team))
-
-        random.shuffle(members)
-        assigned = False
-        representative = None
-
-        for member in members:
-            if preferences.filter(member=member).exists() and not assigned:
-                assigned = True
-                representative = member
-                member_preferences = preferences.get(member=member, space=space)
-                member_rankings = member_preferences.project_preferences_as_names()
-                for project in member_rankings:
-                    team_rank[project] = member_rankings[project]
-
-        max_value = -1
-        max_project = ""
-        for name in team_rank:
-            test_project = Project.objects.get(name=name)
-            if team_rank[name] > max_value and not TeamProject.objects.filter(space=space, project=test_project):
-                max_value = team_rank[name]
-                max_project = name
-
-        if Project.objects.filter(space=space, name=max_project).exists():
-            team_project = Project.objects.get(name=max_project)
-            new_project_team = TeamProject(space=space, team=team, project=team_project, assigned=True, representative=representative)
-
-        else:
-            new_project_team = TeamProject(space=space, team=team, assigned=False, representative=None)
+    return render_assignments(request, spaceurl, representatives=True)
 
-        new_project_team.save()
 
-    return render(request, 'view_assignments.html', {'member': get_user(request),
-                                                     'list': TeamProject.objects.filter(space=space), 'space': space,
-                                                     'teams': teams})
+# Gives every team of the space a project within the capacities of the projects (see main/formation/assignment.py)
+def render_assignments(request, spaceurl, representatives):
+    space = Space.objects.get(url=spaceurl)
+    member = get_user(request)
+    if member.username != space.teacher:
+        return redirect('/profile_redirect/')
+    understaffed = assign_projects(space, representatives)
+    msg = ""
+    if understaffed:
+        msg = "There were not enough teams to meet the minimum staffing of " + ", ".join(understaffed) + "."
+    teams = Team.objects.filter(space=space).with_rosters()
+    assignments = team_assignments(space, teams)
+    return render(request, 'view_assignments.html', {'member': member, 'team_assignments': assignments,
+                                                     'space': space, 'msg': msg, 'has_assignments':
+                                                     any(project_teams for team, project_teams in assignments)})
 
 @login_required(login_url="/login/")
+@read_from_replica
+@condition(etag_func=space_etag, last_modified_func=space_last_modified)
 def view_assignments(request, spaceurl):
     space = Space.objects.get(url=spaceurl)
-    teams = Team.objects.filter(space=space)
-    return render(request, 'view_assignments.html', {'member': get_user(request),
-                                                     'list': TeamProject.objects.filter(space=space), 'space': space,
-                                                     'teams': teams})
+    teams = Team.objects.filter(space=space).with_rosters()
+    assignments = team_assignments(space, teams)
+    return render(request, 'view_assignments.html', {'member': get_user(request), 'team_assignments': assignments,
+                                                     'space': space, 'has_assignments':
+                                                     any(project_teams for team, project_teams in assignments)})
 